@@ -33,7 +33,8 @@ class Settings:
     
     # Model settings
     PREDICTION_MODEL_PATH = BASE_DIR / "models" / "sales_predictor.pkl"
-    XGB_MODEL_PATH        = BASE_DIR / "models" / "xgb_priority_v1.pkl"
+    XGB_MODEL_PATH        = BASE_DIR / "models" / "xgb_priority_v1.ubj"   # pre-registry fallback
+    MODEL_REGISTRY_DIR    = BASE_DIR / "models" / "registry"
     
     @property
     def use_azure_openai(self) -> bool:
@@ -178,13 +178,37 @@ with st.sidebar:
                     # Create the unified "Smart Joint" view
                     data_service.create_unified_view()
 
-                    # Invalidate any stale ML ranking feature cache
+                    # Refresh the portfolio-wide CRM rollup (incremental)
+                    try:
+                        from app.services.portfolio_service import portfolio_service
+                        rollup = portfolio_service.refresh()
+                        if rollup["status"] == "refreshed":
+                            data_service.add_log(
+                                f"CRM rollup refreshed: {rollup['companies_changed']} companies updated, "
+                                f"{rollup['rows']} cube rows"
+                            )
+                    except Exception as e:
+                        data_service.add_log(f"CRM rollup skipped: {e}")
+
+                    # Invalidate any stale ML ranking feature cache, then check
+                    # the new data against the model's training distributions
                     try:
                         from app.services.ml_ranking_service import ml_ranking_service as _mls
                         _mls.clear_cache()
+                        drift = _mls.get_drift_report()
+                        if drift and drift["needs_retraining"]:
+                            data_service.add_log("Model retraining advised: " + "; ".join(drift["reasons"]))
                     except Exception:
                         pass
 
+                    # Warm the web-enrichment cache for the top-ranked customers
+                    try:
+                        from app.services.enrichment_prefetch import enrichment_prefetcher
+                        if enrichment_prefetcher.schedule():
+                            data_service.add_log("Prefetching web enrichment for top-ranked customers")
+                    except Exception as e:
+                        data_service.add_log(f"Enrichment prefetch skipped: {e}")
+
                     st.session_state.data_loaded = True
                     st.rerun()
                 except Exception as e:
@@ -0,0 +1,175 @@
+"""
+app/services/concurrent_fetch.py
+=================================
+Concurrent HTTP fetch layer for the web-enrichment services.
+
+Responsibilities
+----------------
+* Share one `requests.Session` (one urllib3 connection pool per host)
+  across all enrichment calls
+* Run independent fetches on a shared thread pool, bounded per host so a
+  burst of queries never opens more than `per_host` connections to one site
+* Enforce a deadline per request, counted from when the request starts
+  running (a request still queued after one deadline is given up):
+  callers get whatever finished in time and a default for the rest, so a
+  page waits for the slowest request (capped), not the sum of all requests
+* Keep background work (cache prefetch / revalidation) on its own pool and
+  per-host slots, so it never queues ahead of interactive requests
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+MAX_WORKERS         = 8
+PER_HOST_LIMIT      = 6
+BACKGROUND_WORKERS  = 3
+BACKGROUND_PER_HOST = 2
+DEFAULT_DEADLINE    = 12.0   # seconds per request, from when it starts running
+
+
+class ConcurrentFetcher:
+    """
+    Thread-pool fetcher with a shared connection pool and per-host limits.
+
+    `get()` is a drop-in for `session.get()` that takes a per-host slot;
+    `run()` executes a batch of callables concurrently under a deadline.
+    Inside `with fetcher.background():` both use the background pool and
+    slots instead.
+    """
+
+    def __init__(
+        self,
+        session: Optional[requests.Session] = None,
+        max_workers: int = MAX_WORKERS,
+        per_host: int = PER_HOST_LIMIT,
+    ):
+        self.session = session or requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.per_host = per_host
+        self._max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._bg_executor: Optional[ThreadPoolExecutor] = None
+        self._hosts: Dict[str, threading.BoundedSemaphore] = {}
+        self._bg_hosts: Dict[str, threading.BoundedSemaphore] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def background(self):
+        """Mark fetches made by this thread as background work."""
+        previous = self.is_background()
+        self._local.background = True
+        try:
+            yield
+        finally:
+            self._local.background = previous
+
+    def is_background(self) -> bool:
+        return getattr(self._local, "background", False)
+
+    # ── Single requests ───────────────────────────────────────────────────────
+
+    @contextmanager
+    def host_slot(self, url: str):
+        """Hold one of the `per_host` connection slots for *url*'s host."""
+        host = urlsplit(url).netloc
+        hosts, limit = ((self._bg_hosts, BACKGROUND_PER_HOST) if self.is_background()
+                        else (self._hosts, self.per_host))
+        with self._lock:
+            sem = hosts.get(host)
+            if sem is None:
+                sem = hosts[host] = threading.BoundedSemaphore(limit)
+        with sem:
+            yield
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """`session.get` under the host's concurrency limit."""
+        with self.host_slot(url):
+            return self.session.get(url, **kwargs)
+
+    # ── Batches ───────────────────────────────────────────────────────────────
+
+    def _pool(self, background: bool = False) -> ThreadPoolExecutor:
+        with self._lock:
+            if background:
+                if self._bg_executor is None:
+                    self._bg_executor = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS,
+                                                           thread_name_prefix="enrich-fetch-bg")
+                return self._bg_executor
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._max_workers,
+                                                    thread_name_prefix="enrich-fetch")
+            return self._executor
+
+    def run(
+        self,
+        calls: Dict[str, Tuple[Callable, tuple]],
+        deadline: float = DEFAULT_DEADLINE,
+        default: Any = None,
+    ) -> Dict[str, Any]:
+        """
+        Run `{key: (fn, args)}` concurrently and return `{key: result}`.
+
+        Each call gets *deadline* seconds from when it starts running; a call
+        still queued *deadline* seconds after the batch started is given up.
+        Calls that raise or time out yield *default* (pass a sentinel to
+        tell them apart from empty results; timed-out calls keep running in
+        the background but their results are discarded).
+        """
+        if not calls:
+            return {}
+        background = self.is_background()
+        start = time.monotonic()
+        started: Dict[str, float] = {}
+
+        def _call(key, fn, args):
+            started[key] = time.monotonic()
+            with self.background() if background else nullcontext():
+                return fn(*args)
+
+        pool = self._pool(background)
+        futures = {key: pool.submit(_call, key, fn, args) for key, (fn, args) in calls.items()}
+        pending = dict(futures)
+        timed_out = set()
+        while pending:
+            now = time.monotonic()
+            expiry = {key: started.get(key, start) + deadline for key in pending}
+            for key, at in expiry.items():
+                if now >= at and not pending[key].done():
+                    timed_out.add(key)
+                    pending.pop(key).cancel()
+            if not pending:
+                break
+            done, _ = wait(pending.values(), timeout=max(min(expiry[k] for k in pending) - now, 0.01),
+                           return_when=FIRST_COMPLETED)
+            for key in [k for k, fut in pending.items() if fut in done]:
+                del pending[key]
+
+        results: Dict[str, Any] = {}
+        for key, fut in futures.items():
+            if key in timed_out:
+                results[key] = default
+                continue
+            try:
+                results[key] = fut.result()
+            except Exception as e:
+                logger.warning("Fetch '%s' failed: %s", key, e)
+                results[key] = default
+        if timed_out:
+            logger.warning("Fetches %s missed the %.1fs deadline", sorted(timed_out), deadline)
+        logger.debug("Fetched %d sources in %.2fs", len(futures), time.monotonic() - start)
+        return results
@@ -0,0 +1,119 @@
+"""
+app/services/enrichment_cache.py
+=================================
+Persistent, size-bounded cache for web-enrichment results.
+
+Responsibilities
+----------------
+* Store enrichment results (Wikipedia overviews, news, country intel) in a
+  local SQLite file so they survive app restarts
+* Bound the cache by entry count and total payload bytes, evicting the
+  least recently used entries first
+* Report each hit's age, so callers can apply their own TTL and serve
+  stale entries while refreshing them in the background
+
+SQLite (stdlib) is used rather than the app's DuckDB file: the DuckDB
+connection is held by data_service, and the cache is written from
+background refresh threads.
+"""
+
+from __future__ import annotations
+
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAX_ENTRIES = 2000
+MAX_BYTES   = 50 * 1024 * 1024
+
+
+class EnrichmentCache:
+    """Key → pickled value store with LRU eviction; opened lazily."""
+
+    def __init__(self, path: str | Path, max_entries: int = MAX_ENTRIES, max_bytes: int = MAX_BYTES):
+        self.path        = Path(path)
+        self.max_entries = max_entries
+        self.max_bytes   = max_bytes
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key         TEXT PRIMARY KEY,
+                    value       BLOB NOT NULL,
+                    size        INTEGER NOT NULL,
+                    stored_at   REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (accessed_at)")
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Return (value, age in seconds) and mark the entry as used, or None."""
+        with self._lock:
+            try:
+                db = self._db()
+                row = db.execute("SELECT value, stored_at FROM entries WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                db.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (time.time(), key))
+                return pickle.loads(row[0]), time.time() - row[1]
+            except Exception as e:
+                logger.warning("Enrichment cache read failed for %s: %s", key, e)
+                return None
+
+    def set(self, key: str, value: Any) -> None:
+        """Store *value* under *key* (fresh timestamp), then enforce the size bounds."""
+        try:
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.warning("Enrichment result for %s is not cacheable: %s", key, e)
+            return
+        now = time.time()
+        with self._lock:
+            try:
+                db = self._db()
+                db.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, size, stored_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, blob, len(blob), now, now),
+                )
+                self._evict(db)
+            except Exception as e:
+                logger.warning("Enrichment cache write failed for %s: %s", key, e)
+
+    def _evict(self, db: sqlite3.Connection) -> None:
+        n, total = db.execute("SELECT count(*), coalesce(sum(size), 0) FROM entries").fetchone()
+        if n <= self.max_entries and total <= self.max_bytes:
+            return
+        # walk from least to most recently used until both bounds hold
+        drop, keep_n, keep_bytes = [], n, total
+        for key, size in db.execute("SELECT key, size FROM entries ORDER BY accessed_at"):
+            if keep_n <= self.max_entries and keep_bytes <= self.max_bytes:
+                break
+            drop.append((key,))
+            keep_n -= 1
+            keep_bytes -= size
+        db.executemany("DELETE FROM entries WHERE key = ?", drop)
+        logger.debug("Evicted %d enrichment cache entries", len(drop))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db().execute("SELECT count(*) FROM entries").fetchone()[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db().execute("DELETE FROM entries")
@@ -0,0 +1,278 @@
+"""
+app/services/enrichment_prefetch.py
+====================================
+Background warm-up of the web-enrichment cache for top-ranked customers.
+
+Responsibilities
+----------------
+* Take the top-N distinct companies of the current priority ranking
+  (`ml_ranking_service.get_ranked_list`) and resolve each to the name and
+  country its customer page passes to the enrichment getters (the
+  `unified_companies` row), so prefetched entries are the page's cache keys
+* Fetch their company overview, recent news and country intelligence in the
+  background through WebEnrichmentService's cached getters, so the
+  persistent cache holds them before the user opens a customer
+* Bound concurrency with a small dedicated pool, and fetch on the
+  enrichment fetcher's background pool / host slots so interactive
+  requests are never queued behind a prefetch; a new ranking supersedes the
+  queued part of an older batch, and an unchanged ranking is not
+  re-scheduled until REFRESH_INTERVAL has passed
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from contextlib import nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+TOP_N            = 20
+PREFETCH_WORKERS = 3
+NEWS_LIMIT       = 5        # must match the customer page's get_recent_news(limit=…)
+REFRESH_INTERVAL = 3600.0   # seconds before an unchanged target list is warmed again
+
+
+def crm_identity_map(conn=None) -> Dict[str, Tuple[str, Optional[str]]]:
+    """
+    Normalised company name → (name, country) as the customer page sees it.
+
+    The ranking carries BCG company names; the customer page is keyed by the
+    `unified_companies` row (CRM name where a mapping exists) and uses that
+    row's `name` and `country`.  Every row is keyed by its `bcg_name` and its
+    `name` (stripped, case-folded); `bcg_name` wins on conflicts.  Empty
+    when `unified_companies` is not available.
+    """
+    if conn is None:
+        from app.services.data_service import data_service
+        conn = data_service.get_conn()
+    if conn is None:
+        return {}
+    try:
+        rows = conn.execute("SELECT name, bcg_name, country FROM unified_companies").df()
+    except Exception as e:
+        logger.debug(f"unified_companies unavailable for prefetch resolution: {e}")
+        return {}
+
+    def _norm(col: pd.Series) -> pd.Series:
+        return col.astype("string").str.strip().str.casefold()
+
+    rows = rows[rows["name"].notna()]
+    identities: Dict[str, Tuple[str, Optional[str]]] = {}
+    for col in ("name", "bcg_name"):          # bcg_name last: it wins on conflicts
+        keyed = rows.assign(_key=_norm(rows[col])).dropna(subset=["_key"]).drop_duplicates("_key")
+        for key, name, country in zip(keyed["_key"], keyed["name"], keyed["country"]):
+            identities[key] = (str(name), None if pd.isna(country) else str(country))
+    return identities
+
+
+def crm_identities(
+    names: List[str],
+    conn=None,
+    identity_map: Optional[Dict[str, Tuple[str, Optional[str]]]] = None,
+) -> Dict[str, Tuple[str, Optional[str]]]:
+    """
+    Ranking company name → (name, country) as the customer page sees it.
+
+    Looked up in *identity_map* (built with `crm_identity_map(conn)` when not
+    given); unresolved names are left out.
+    """
+    if not names:
+        return {}
+    if identity_map is None:
+        identity_map = crm_identity_map(conn)
+    keys = {n: str(n).strip().casefold() for n in names}
+    return {n: identity_map[k] for n, k in keys.items() if k in identity_map}
+
+
+class EnrichmentPrefetcher:
+    """Schedules cache warm-up batches for the top of the ranking."""
+
+    def __init__(
+        self,
+        enrichment=None,
+        ranking=None,
+        max_workers: int = PREFETCH_WORKERS,
+        resolver: Optional[Callable[[List[str]], Dict[str, Tuple[str, Optional[str]]]]] = None,
+    ):
+        self._enrichment = enrichment
+        self._ranking = ranking
+        self._resolver = resolver   # None: crm_identities on a map memoised per data fingerprint
+        self._identity_memo: Optional[Tuple[str, Dict]] = None
+        self._last_request: Optional[Tuple] = None
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="enrich-prefetch")
+        self._lock = threading.Lock()
+        self._futures: List[Future] = []
+        self._last: Optional[Tuple[Tuple[str, ...], Tuple[str, ...]]] = None
+        self._last_at = 0.0
+        self._batch = 0
+        self._stats = {"companies": 0, "countries": 0, "done": 0, "failed": 0}
+
+    @property
+    def enrichment(self):
+        if self._enrichment is None:
+            from app.services.web_enrichment_service import web_enrichment_service
+            self._enrichment = web_enrichment_service
+        return self._enrichment
+
+    @property
+    def ranking(self):
+        if self._ranking is None:
+            from app.services.ml_ranking_service import ml_ranking_service
+            self._ranking = ml_ranking_service
+        return self._ranking
+
+    def targets(
+        self,
+        top_n: int = TOP_N,
+        equipment_type: Optional[str] = None,
+        country: Optional[str] = None,
+    ) -> Tuple[List[str], List[str]]:
+        """
+        Top *top_n* distinct companies of the ranking (rank order) and their countries.
+
+        Names and countries are the ones the customer page uses (see
+        `crm_identities`); a company without a country there falls back to
+        the *country* filter, as the page does.
+        """
+        ranked = self.ranking.get_ranked_list(equipment_type=equipment_type, country=country,
+                                              top_k=top_n * 20)
+        if ranked.empty:
+            return [], []
+        ranked = ranked[ranked["company"].astype(str).str.strip() != ""]
+        ranked_names = ranked["company"].astype(str).drop_duplicates().tolist()
+        resolved = self._resolve(ranked_names)
+
+        companies: List[str] = []
+        countries: List[str] = []
+        for name, ranked_country in zip(ranked["company"].astype(str), ranked["country"]):
+            # unresolved (no unified_companies row yet): best guess from the ranking
+            page_name, page_country = resolved.get(name, (name.strip(), ranked_country))
+            if page_name in companies:
+                continue
+            companies.append(page_name)
+            c = next((str(c) for c in (page_country, country)
+                      if c is not None and not pd.isna(c) and str(c).strip()), None)
+            if c and c.strip().lower() not in ("unknown", "nan", "all") and c not in countries:
+                countries.append(c)
+            if len(companies) == top_n:
+                break
+        return companies, countries
+
+    def _score_key(self) -> Optional[Tuple[str, str]]:
+        """The ranking's current (model version, data fingerprint), without scoring."""
+        score_key = getattr(self.ranking, "score_key", None)
+        return score_key() if score_key is not None else None
+
+    def _resolve(self, names: List[str]) -> Dict[str, Tuple[str, Optional[str]]]:
+        if self._resolver is not None:
+            return self._resolver(names)
+        score_key = self._score_key()
+        fingerprint = score_key[1] if score_key else None
+        memo = self._identity_memo
+        if memo is None or fingerprint is None or memo[0] != fingerprint:
+            # unified_companies is rebuilt by Load Data, which also changes the
+            # ranking's data fingerprint
+            memo = (fingerprint, crm_identity_map())
+            if fingerprint is not None:
+                self._identity_memo = memo
+        return crm_identities(names, identity_map=memo[1])
+
+    def schedule(
+        self,
+        top_n: int = TOP_N,
+        equipment_type: Optional[str] = None,
+        country: Optional[str] = None,
+    ) -> bool:
+        """
+        Queue a warm-up batch for the current top-N; returns False if skipped.
+
+        Skipped when the target list equals the last batch's and that batch
+        was scheduled less than REFRESH_INTERVAL ago.  A repeated request
+        (same arguments, same ranking scores) is skipped before the targets
+        are resolved, so calling this on every page rerun is cheap.  Queued
+        (not yet started) work of a previous, different batch is cancelled.
+        """
+        request = (top_n, equipment_type, country, self._score_key())
+        with self._lock:
+            if (request[-1] is not None and request == self._last_request
+                    and time.monotonic() - self._last_at < REFRESH_INTERVAL):
+                return False
+        try:
+            companies, countries = self.targets(top_n, equipment_type, country)
+        except Exception as e:
+            logger.warning(f"Enrichment prefetch skipped, ranking unavailable: {e}")
+            return False
+        if not companies:
+            return False
+
+        key = (tuple(companies), tuple(countries))
+        request = (top_n, equipment_type, country, self._score_key())   # targets() may have scored
+        with self._lock:
+            self._last_request = request
+            if key == self._last and time.monotonic() - self._last_at < REFRESH_INTERVAL:
+                return False
+            for fut in self._futures:
+                fut.cancel()
+            self._last, self._last_at = key, time.monotonic()
+            self._batch += 1
+            batch = self._batch
+            self._stats = {"companies": len(companies), "countries": len(countries), "done": 0, "failed": 0}
+            # countries first: one country feed set serves many companies
+            self._futures = (
+                [self._pool.submit(self._warm, batch, "country", c) for c in countries]
+                + [self._pool.submit(self._warm, batch, "company", c) for c in companies]
+            )
+        logger.info(f"Prefetching enrichment for {len(companies)} companies, {len(countries)} countries")
+        return True
+
+    def _warm(self, batch: int, kind: str, name: str) -> None:
+        from app.services.web_enrichment_service import _country_intel_degraded, _overview_empty
+
+        fetcher = getattr(self.enrichment, "fetcher", None)
+        try:
+            # background pool and host slots: never queue ahead of the user's requests
+            with fetcher.background() if fetcher is not None else nullcontext():
+                if kind == "country":
+                    intel = self.enrichment.get_country_intelligence(name)
+                    empty = not intel or _country_intel_degraded(intel)
+                else:
+                    overview = self.enrichment.get_company_overview(name)
+                    news = self.enrichment.get_recent_news(name, limit=NEWS_LIMIT)
+                    empty = not overview or _overview_empty(overview) or not news
+            if empty:
+                logger.info(f"Enrichment prefetch for {kind} {name} returned no or partial data")
+            outcome = "failed" if empty else "done"
+        except Exception as e:
+            logger.warning(f"Enrichment prefetch failed for {kind} {name}: {e}")
+            outcome = "failed"
+        with self._lock:
+            # a superseded batch's stragglers must not count towards the new one
+            if batch == self._batch:
+                self._stats[outcome] += 1
+
+    def status(self) -> Dict:
+        """
+        Progress of the latest batch: companies, countries, done, failed, pending.
+
+        `failed` counts targets whose fetch raised or came back empty /
+        incomplete (cached only briefly, so they will be fetched again).
+        """
+        with self._lock:
+            pending = sum(not f.done() for f in self._futures)
+            return {**self._stats, "pending": pending}
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the latest batch finishes; True if it did within *timeout*."""
+        with self._lock:
+            futures = list(self._futures)
+        _, pending = wait(futures, timeout=timeout)
+        return not pending
+
+
+enrichment_prefetcher = EnrichmentPrefetcher()
@@ -0,0 +1,108 @@
+"""
+app/services/explanation_service.py
+====================================
+Batch SHAP explanations for the XGBoost priority-ranking model.
+
+Responsibilities
+----------------
+* Compute SHAP values for every scored equipment row in one batched pass
+  (one TreeExplainer per model version, reused across passes)
+* Cache the SHAP matrix and each row's top-N drivers per
+  (model version, data fingerprint), next to the cached scores
+* Serve the top contributions for any scored row without recomputation
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+TOP_N = 5
+
+
+class ExplanationService:
+    """
+    Holds precomputed SHAP contributions for the currently scored data.
+
+    Only one (model version, data fingerprint) is kept: a new key replaces
+    the previous matrix, mirroring the single score cache in MLRankingService.
+    """
+
+    def __init__(self, top_n: int = TOP_N):
+        self.top_n = top_n
+        self._key: Optional[Tuple[str, str]] = None
+        self._features: List[str] = []
+        self._values: Optional[np.ndarray] = None   # raw feature values  (n_rows × n_features)
+        self._shap:   Optional[np.ndarray] = None   # SHAP values         (n_rows × n_features)
+        self._top:    Optional[np.ndarray] = None   # top-N feature idx   (n_rows × top_n)
+
+    def clear(self) -> None:
+        self._key = None
+        self._values = self._shap = self._top = None
+
+    def has(self, key: Tuple[str, str]) -> bool:
+        return self._key == key and self._shap is not None
+
+    def compute(self, model, feat_df: pd.DataFrame, key: Tuple[str, str]) -> bool:
+        """
+        Compute SHAP values for all rows of *feat_df* in one pass.
+
+        *model* is an XGBPriorityModel; *key* identifies the scored data the
+        rows belong to.  Returns True when explanations are available.
+        """
+        if self.has(key):
+            return True
+
+        shap_df = model.compute_shap(feat_df)
+        if shap_df is None:
+            return False
+
+        shap_vals = shap_df.to_numpy(dtype=float)
+        n_top = min(self.top_n, shap_vals.shape[1])
+        abs_vals = np.abs(shap_vals)
+        # argpartition picks the N strongest drivers per row; sort only those N
+        part = np.argpartition(-abs_vals, n_top - 1, axis=1)[:, :n_top]
+        order = np.argsort(-np.take_along_axis(abs_vals, part, axis=1), axis=1, kind="stable")
+
+        self._features = list(shap_df.columns)
+        self._values   = feat_df[self._features].to_numpy(dtype=float)
+        self._shap     = shap_vals
+        self._top      = np.take_along_axis(part, order, axis=1)
+        self._key      = key
+        logger.info("SHAP explanations computed for %d rows", len(shap_vals))
+        return True
+
+    def top_contributions(self, row_ids: List[int]) -> Dict[int, List[Dict]]:
+        """
+        Return {row_id: [{feature, value, shap}, …]} ordered by |shap|.
+
+        *row_ids* are positions in the scored feature matrix (the `row_id`
+        column of MLRankingService.get_ranked_list).
+        """
+        if self._shap is None:
+            return {}
+        out: Dict[int, List[Dict]] = {}
+        for rid in row_ids:
+            rid = int(rid)
+            if not 0 <= rid < len(self._shap):
+                continue
+            out[rid] = [
+                {
+                    "feature": self._features[j],
+                    "value":   float(self._values[rid, j]),
+                    "shap":    float(self._shap[rid, j]),
+                }
+                for j in self._top[rid]
+            ]
+        return out
+
+    def as_frame(self) -> Optional[pd.DataFrame]:
+        """Full SHAP matrix as a DataFrame (one column per feature)."""
+        if self._shap is None:
+            return None
+        return pd.DataFrame(self._shap, columns=self._features)
@@ -0,0 +1,174 @@
+"""
+app/services/feed_parsing.py
+=============================
+Parsers for the web-enrichment sources (Google News RSS, Wikipedia).
+
+Two implementations of each parser live here:
+
+* the lean path used by WebEnrichmentService — lxml `iterparse` over the
+  RSS bytes (stops after `limit` items, one small HTML parse per
+  description only when it actually contains markup) and a targeted XPath
+  lookup of the Wikipedia infobox
+* the original BeautifulSoup path, kept as the fallback for malformed
+  input and as the baseline for `scripts/bench_enrichment_parsing.py`
+
+Both return the same structures.
+"""
+
+from __future__ import annotations
+
+import html
+import io
+from typing import Dict, List, Optional
+
+from bs4 import BeautifulSoup
+from lxml import etree
+from lxml import html as lxml_html
+
+INFOBOX_FIELDS = ("headquarters", "founded", "industry", "employee_count", "parent_company")
+
+_INFOBOX_XPATH = "//table[contains(concat(' ', normalize-space(@class), ' '), ' infobox ')]"
+
+
+# ── RSS ───────────────────────────────────────────────────────────────────────
+
+def _html_text(fragment: str) -> str:
+    """Visible text of an HTML snippet, text nodes stripped and space-joined."""
+    if "<" not in fragment:
+        return html.unescape(fragment).strip()
+    root = lxml_html.fragment_fromstring(fragment, create_parent="div")
+    return " ".join(t.strip() for t in root.itertext() if t.strip())
+
+
+def _child_text(item, tag: str) -> Optional[str]:
+    el = item.find(tag)
+    return None if el is None else (el.text or "")
+
+
+def parse_rss_items(content: bytes, limit: int = 10) -> List[Dict]:
+    """Parse up to *limit* RSS `<item>`s with lxml iterparse (stops early)."""
+    items: List[Dict] = []
+    for _, item in etree.iterparse(io.BytesIO(content), events=("end",), tag="item",
+                                   recover=True, resolve_entities=False, no_network=True):
+        title = _child_text(item, "title")
+        link = _child_text(item, "link")
+        pub_date = _child_text(item, "pubDate")
+        description = _child_text(item, "description")
+        source = _child_text(item, "source")
+
+        desc_text = ""
+        if description:
+            try:
+                desc_text = _html_text(description)
+            except Exception:
+                desc_text = description
+
+        items.append({
+            "title": title if title is not None else "No title",
+            "description": desc_text,
+            "url": link if link is not None else "",
+            "published_date": pub_date if pub_date is not None else "",
+            "source": source if source is not None else "Google News",
+        })
+        item.clear()
+        if len(items) >= limit:
+            break
+    return items
+
+
+def parse_rss_items_soup(content: bytes, limit: int = 10) -> List[Dict]:
+    """Original BeautifulSoup('xml') RSS parser (fallback / benchmark baseline)."""
+    news_items = []
+    soup = BeautifulSoup(content, "xml")
+    for item in soup.find_all("item", limit=limit):
+        title = item.find("title")
+        link = item.find("link")
+        pub_date = item.find("pubDate")
+        description = item.find("description")
+        source = item.find("source")
+
+        desc_text = ""
+        if description and description.text:
+            try:
+                soup_desc = BeautifulSoup(description.text, "html.parser")
+                desc_text = soup_desc.get_text(separator=" ", strip=True)
+            except Exception:
+                desc_text = description.text
+
+        news_items.append({
+            "title": title.text if title else "No title",
+            "description": desc_text,
+            "url": link.text if link else "",
+            "published_date": pub_date.text if pub_date else "",
+            "source": source.text if source else "Google News",
+        })
+    return news_items
+
+
+# ── Wikipedia ─────────────────────────────────────────────────────────────────
+
+def _infobox_field(header_text: str) -> Optional[str]:
+    if "headquarter" in header_text:
+        return "headquarters"
+    if "founded" in header_text:
+        return "founded"
+    if "industry" in header_text or "industries" in header_text:
+        return "industry"
+    if "employee" in header_text:
+        return "employee_count"
+    if "parent" in header_text:
+        return "parent_company"
+    return None
+
+
+def parse_infobox(html_content: str) -> Optional[Dict]:
+    """
+    Description and infobox fields from Wikipedia article HTML via XPath.
+
+    Returns None when the page has no infobox; otherwise a dict with
+    `description` (first non-empty lead paragraph) and INFOBOX_FIELDS.
+    """
+    root = lxml_html.fromstring(html_content)
+    boxes = root.xpath(_INFOBOX_XPATH)
+    if not boxes:
+        return None
+    result: Dict[str, Optional[str]] = {"description": None, **{f: None for f in INFOBOX_FIELDS}}
+
+    for p in root.xpath("//p"):
+        text = p.text_content().strip()
+        if text:
+            result["description"] = text
+            break
+
+    for row in boxes[0].iter("tr"):
+        header = next(row.iter("th"), None)
+        data = next(row.iter("td"), None)
+        if header is None or data is None:
+            continue
+        field = _infobox_field(header.text_content().strip().lower())
+        if field:
+            result[field] = data.text_content().strip()
+    return result
+
+
+def parse_infobox_soup(html_content: str) -> Optional[Dict]:
+    """Original BeautifulSoup infobox parser (benchmark baseline)."""
+    soup = BeautifulSoup(html_content, "html.parser")
+    infobox = soup.find("table", {"class": "infobox"})
+    if not infobox:
+        return None
+    result: Dict[str, Optional[str]] = {"description": None, **{f: None for f in INFOBOX_FIELDS}}
+
+    first_para = soup.find("p", recursive=False)
+    if first_para:
+        result["description"] = first_para.get_text().strip()
+
+    for row in infobox.find_all("tr"):
+        header = row.find("th")
+        data = row.find("td")
+        if not header or not data:
+            continue
+        field = _infobox_field(header.get_text().strip().lower())
+        if field:
+            result[field] = data.get_text().strip()
+    return result
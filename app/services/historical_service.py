@@ -9,13 +9,19 @@ Data sources
 ------------
 - temp_repos/work_apps/templates/ib_list.xlsx         → installed base
 - temp_repos/work_apps/templates/gh_current_projects.xlsx → CRM projects
+
+Both files are ingested into DuckDB tables (`hist_ib`, `hist_crm`) through
+a Parquet staging file the first time they are used, and re-ingested only
+when the file's fingerprint (size + mtime) changes.  The app's DuckDB
+connection is shared, so every page reads the same columnar copy.
 """
 from __future__ import annotations
 
+import hashlib
 import logging
-from functools import lru_cache
+import threading
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional
 
 import numpy as np
 import pandas as pd
@@ -26,40 +32,202 @@ logger = logging.getLogger(__name__)
 _ROOT = Path(__file__).resolve().parent.parent.parent
 _IB_PATH  = _ROOT / "temp_repos" / "work_apps" / "templates" / "ib_list.xlsx"
 _CRM_PATH = _ROOT / "temp_repos" / "work_apps" / "templates" / "gh_current_projects.xlsx"
+_STAGING_DIR = _ROOT / "data" / "staging"
 
 # Source references shown in the UI
 IB_SOURCE_LINK  = "Source: Axel's IB List (ib_list.xlsx)"
 CRM_SOURCE_LINK = "Source: Axel's CRM Export (gh_current_projects.xlsx)"
 
 
-# ── Raw loaders (cached for the app lifetime) ─────────────────────────────────
+# ── DuckDB-backed source tables ───────────────────────────────────────────────
 
-@lru_cache(maxsize=1)
-def _load_ib() -> pd.DataFrame:
-    if not _IB_PATH.exists():
-        logger.warning("IB file not found: %s", _IB_PATH)
-        return pd.DataFrame()
+def _shared_conn():
+    """The app's DuckDB connection (None if the database cannot be opened)."""
     try:
-        df = pd.read_excel(_IB_PATH)
-        # Drop unnamed / datetime columns
-        df = df[[c for c in df.columns if isinstance(c, str) and not c.startswith("Unnamed") and not c.startswith("last")]]
-        return df
+        from app.services.data_service import data_service
+        return data_service.get_conn()
     except Exception as e:
-        logger.error("Failed to load IB file: %s", e)
-        return pd.DataFrame()
+        logger.debug("No DuckDB connection for historical data: %s", e)
+        return None
+
+
+def _clean_ib(df: pd.DataFrame) -> pd.DataFrame:
+    # Drop unnamed / datetime columns
+    return df[[c for c in df.columns if isinstance(c, str) and not c.startswith("Unnamed") and not c.startswith("last")]]
+
+
+def _to_arrow_safe(df: pd.DataFrame) -> pd.DataFrame:
+    """Stringify mixed-type object columns (Excel ids, years as text) for Parquet."""
+    df = df.copy()
+    for c in df.columns[df.dtypes == object]:
+        df[c] = df[c].where(df[c].isna(), df[c].astype(str))
+    return df
+
+
+class _HistoricalTable:
+    """
+    One of Axel's Excel exports mirrored into a DuckDB table.
+
+    The Excel file is parsed once per file version, staged as Parquet and
+    loaded with `read_parquet`; the fingerprint is stored in the `_meta`
+    table, so a restarted app reuses the DuckDB copy without re-parsing
+    Excel.  The materialised DataFrame and everything derived from it (name
+    indexes, aggregates — see `derived`) are kept per fingerprint and
+    rebuilt when the file changes.  If DuckDB is unavailable (e.g. read-only
+    connection) the file is read directly.
+    """
+
+    def __init__(self, table: str, path: Path, name_cols: List[str], clean=None,
+                 staging_dir: Path = _STAGING_DIR):
+        self.table       = table
+        self.path        = Path(path)
+        self.name_cols   = name_cols
+        self.staging_dir = Path(staging_dir)
+        self._clean      = clean
+        self._lock       = threading.RLock()
+        self._fp: Optional[str] = None
+        self._df         = pd.DataFrame()
+        self._derived: Dict = {}
+
+    def fingerprint(self) -> Optional[str]:
+        """Fingerprint of the source file (None if it does not exist)."""
+        try:
+            st = self.path.stat()
+        except OSError:
+            return None
+        return hashlib.md5(f"{self.path.name}:{st.st_size}:{st.st_mtime_ns}".encode()).hexdigest()
+
+    def frame(self) -> pd.DataFrame:
+        """The table as a DataFrame (empty if the source file is missing)."""
+        fp = self.fingerprint() or "missing"
+        if fp != self._fp:
+            with self._lock:
+                if fp != self._fp:
+                    self._df      = self._materialise(fp)
+                    self._derived = {}
+                    self._fp      = fp
+        return self._df
+
+    def derived(self, key, build):
+        """
+        `build(frame)` computed once per file version and cached under *key*.
+
+        Only for whole-table results (a fixed set of keys) — per-company
+        results are computed on demand by the callers.  Builders may call
+        `derived` themselves (the lock is re-entrant).
+        """
+        df = self.frame()
+        with self._lock:
+            cache = self._derived
+            if key not in cache:
+                cache[key] = build(df)
+            return cache[key]
+
+    def name_indexes(self) -> Dict[str, "_NameIndex"]:
+        """Company-name index per name column, built once per file version."""
+        return self.derived("name_indexes", lambda df: _build_name_indexes(df, self.name_cols))
+
+    def query(self, sql: str, params: Optional[list] = None) -> Optional[pd.DataFrame]:
+        """Run *sql* against the DuckDB copy ({table} is substituted); None if unavailable."""
+        if self.frame().empty:
+            return None
+        conn = _shared_conn()
+        if conn is None:
+            return None
+        try:
+            return conn.execute(sql.format(table=self.table), params or []).df()
+        except Exception as e:
+            logger.debug("Query on %s failed: %s", self.table, e)
+            return None
+
+    def _materialise(self, fp: str) -> pd.DataFrame:
+        if fp == "missing":
+            logger.warning("%s file not found: %s", self.table, self.path)
+            return pd.DataFrame()
+        conn = _shared_conn()
+        if conn is not None:
+            try:
+                if self._stored_fingerprint(conn) != fp:
+                    self._ingest(conn, fp)
+                return conn.execute(f"SELECT * FROM {self.table}").df()
+            except Exception as e:
+                logger.warning("DuckDB copy of %s unavailable (%s); reading the file directly",
+                               self.path.name, e)
+        try:
+            return self._read_source()
+        except Exception as e:
+            logger.error("Failed to load %s: %s", self.path.name, e)
+            return pd.DataFrame()
+
+    def _read_source(self) -> pd.DataFrame:
+        df = pd.read_excel(self.path)
+        return self._clean(df) if self._clean else df
+
+    def _ingest(self, conn, fp: str) -> None:
+        df = _to_arrow_safe(self._read_source())
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        stage = self.staging_dir / f"{self.table}.parquet"
+        df.to_parquet(stage, index=False)
+        path_sql = str(stage).replace("'", "''")
+        conn.execute(f"CREATE OR REPLACE TABLE {self.table} AS SELECT * FROM read_parquet('{path_sql}')")
+        conn.execute("CREATE TABLE IF NOT EXISTS _meta (key VARCHAR PRIMARY KEY, value VARCHAR)")
+        conn.execute("""
+            INSERT INTO _meta (key, value) VALUES (?, ?)
+            ON CONFLICT (key) DO UPDATE SET value = excluded.value
+        """, (f"{self.table}_fingerprint", fp))
+        logger.info("Ingested %s into DuckDB table %s (%d rows)", self.path.name, self.table, len(df))
+
+    def _stored_fingerprint(self, conn) -> Optional[str]:
+        try:
+            row = conn.execute("SELECT value FROM _meta WHERE key = ?",
+                               (f"{self.table}_fingerprint",)).fetchone()
+            if row is None:
+                return None
+            conn.execute(f"SELECT 1 FROM {self.table} LIMIT 0")   # table still present
+            return row[0]
+        except Exception:
+            return None
+
+
+_IB_NAME_COLS  = ["ib_customer", "account_name", "company", "customer"]
+_CRM_NAME_COLS = ["account_name", "company", "customer_project", "ib_customer"]
+
+_IB_TABLE  = _HistoricalTable("hist_ib",  _IB_PATH,  _IB_NAME_COLS, clean=_clean_ib)
+_CRM_TABLE = _HistoricalTable("hist_crm", _CRM_PATH, _CRM_NAME_COLS)
+
+
+def _load_ib() -> pd.DataFrame:
+    return _IB_TABLE.frame()
 
 
-@lru_cache(maxsize=1)
 def _load_crm() -> pd.DataFrame:
-    if not _CRM_PATH.exists():
-        logger.warning("CRM file not found: %s", _CRM_PATH)
-        return pd.DataFrame()
-    try:
-        df = pd.read_excel(_CRM_PATH)
-        return df
-    except Exception as e:
-        logger.error("Failed to load CRM file: %s", e)
-        return pd.DataFrame()
+    return _CRM_TABLE.frame()
+
+
+def _search(source: _HistoricalTable, df: pd.DataFrame, col: str, term: str) -> pd.DataFrame:
+    if df.empty or col not in df.columns:
+        return df.iloc[0:0]
+    result = source.query(
+        f'SELECT * FROM {{table}} WHERE CAST("{col}" AS VARCHAR) ILIKE ?',
+        [f"%{term}%"],
+    )
+    if result is not None:
+        return result
+    return df[df[col].astype(str).str.contains(term, case=False, na=False, regex=False)]
+
+
+def search_ib(term: str) -> pd.DataFrame:
+    """IB rows whose customer name contains *term* (case-insensitive)."""
+    df = _load_ib()
+    col = "ib_customer" if "ib_customer" in df.columns else (df.columns[0] if len(df.columns) else "")
+    return _search(_IB_TABLE, df, col, term)
+
+
+def search_crm(term: str) -> pd.DataFrame:
+    """CRM rows whose account name contains *term* (case-insensitive)."""
+    df = _load_crm()
+    col = "account_name" if "account_name" in df.columns else (df.columns[0] if len(df.columns) else "")
+    return _search(_CRM_TABLE, df, col, term)
 
 
 # ── Name normalisation ────────────────────────────────────────────────────────
@@ -70,50 +238,185 @@ def _norm(s: str) -> str:
     return re.sub(r"[^a-z0-9]", "", str(s).lower())
 
 
-def _match_company(df: pd.DataFrame, col: str, company: str, threshold: int = 60) -> pd.DataFrame:
-    """Return rows from df where df[col] fuzzy-matches company."""
+class _NameIndex:
+    """
+    Company-name lookup over one column of a loaded table.
+
+    The column is factorised once: every distinct value is lowercased and
+    normalised a single time and maps to the row positions holding it.
+    Substring lookups go through a substring → value-id map per needle
+    length (built on first use), so a customer view costs a dict hit plus
+    the matching rows instead of a scan over the whole column.
+    """
+
+    def __init__(self, values: pd.Series):
+        codes, uniques = pd.factorize(values.astype(str))
+        lower = pd.Series(uniques, dtype=object).str.lower()
+        self._keys = {
+            "lower": lower.tolist(),
+            "norm":  lower.str.replace(r"[^a-z0-9]", "", regex=True).tolist(),
+        }
+        order  = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        self._rows = [order[bounds[i]:bounds[i + 1]] for i in range(len(uniques))]
+        self._present = np.flatnonzero(codes >= 0)   # missing names never match
+        self._subs: dict = {}   # (kind, length) → {substring: [value ids]}
+
+    def _substring_index(self, kind: str, length: int) -> dict:
+        idx = self._subs.get((kind, length))
+        if idx is None:
+            idx = {}
+            for vid, key in enumerate(self._keys[kind]):
+                for sub in {key[i:i + length] for i in range(len(key) - length + 1)}:
+                    idx.setdefault(sub, []).append(vid)
+            self._subs[(kind, length)] = idx
+        return idx
+
+    def rows(self, needle: str, kind: str = "lower") -> np.ndarray:
+        """Row positions (in table order) whose *kind* key contains *needle*."""
+        if not needle:
+            return self._present
+        vids = self._substring_index(kind, len(needle)).get(needle)
+        if not vids:
+            return np.empty(0, dtype=np.intp)
+        return np.sort(np.concatenate([self._rows[v] for v in vids]))
+
+
+def _build_name_indexes(df: pd.DataFrame, columns: list) -> dict:
+    return {c: _NameIndex(df[c]) for c in columns if c in df.columns}
+
+
+def _match_positions(index: _NameIndex, company: str) -> np.ndarray:
+    """Row positions matching *company* in an indexed column (see _match_company)."""
+    pos = index.rows(company[:8].lower(), "lower")
+    if len(pos) == 0:
+        pos = index.rows(_norm(company)[:6], "norm")
+    return pos
+
+
+def _match_company(
+    df: pd.DataFrame,
+    col: str,
+    company: str,
+    threshold: int = 60,
+    index: Optional[_NameIndex] = None,
+) -> pd.DataFrame:
+    """
+    Return rows from df where df[col] fuzzy-matches company.
+
+    Rows whose lowercased value contains the first 8 characters of the
+    company name; failing that, rows whose normalised value contains the
+    first 6 normalised characters.  Pass the column's prebuilt *index* to
+    avoid re-normalising the column.
+    """
     if df.empty or col not in df.columns:
         return df.iloc[0:0]
-    norm_company = _norm(company)
-    # First try substring match (fast)
-    mask = df[col].astype(str).str.lower().str.contains(
-        company[:8].lower(), na=False
+    if index is None:
+        index = _NameIndex(df[col])
+    return df.iloc[_match_positions(index, company)]
+
+
+def _find_company(source: _HistoricalTable, company: str) -> Optional[tuple]:
+    """(column, row positions) of the first name column matching *company*, or None."""
+    indexes = source.name_indexes()
+    for col in source.name_cols:
+        index = indexes.get(col)
+        if index is None:
+            continue
+        pos = _match_positions(index, company)
+        if len(pos):
+            return col, pos
+    return None
+
+
+# ── CRM yearly aggregates ─────────────────────────────────────────────────────
+
+_DATE_COLS   = ["cp_close_date", "sp_oi_date", "CP_created_on", "date_of_inquiry"]
+_VALUE_COLS  = ["cp_expected_value_eur", "sp_expected_value_eur", "CP_value_local_currency"]
+_STATUS_COLS = ["cp_status_hot", "sp_custom_status", "cp_custom_status", "sales_phase"]
+_WON_PATTERN = "won|booked|converted|order|placed"
+
+
+def _crm_derived(crm: pd.DataFrame) -> pd.DataFrame:
+    """Year, value, status and won flag of every CRM row, computed column-wise."""
+    out = pd.DataFrame(index=crm.index)
+
+    # Parse year from date columns
+    date_col = next((c for c in _DATE_COLS if c in crm.columns), None)
+    if date_col:
+        out["_year"] = pd.to_datetime(crm[date_col], errors="coerce").dt.year
+    else:
+        out["_year"] = np.nan
+
+    val_col = next((c for c in _VALUE_COLS if c in crm.columns), None)
+    if val_col:
+        out["_value"] = pd.to_numeric(crm[val_col], errors="coerce").fillna(0)
+    else:
+        out["_value"] = 0.0
+
+    status_col = next((c for c in _STATUS_COLS if c in crm.columns), None)
+    out["_status"] = crm[status_col].astype(str) if status_col else "Unknown"
+    out["_is_won"] = out["_status"].str.contains(_WON_PATTERN, case=False, regex=True, na=False)
+    out["_won_value"] = out["_value"].where(out["_is_won"], 0.0)
+    return out
+
+
+def _yearly_agg(derived: pd.DataFrame, keys) -> pd.DataFrame:
+    """Projects, total value, won value and won count per *keys* (rows with a year only)."""
+    return derived.dropna(subset=["_year"]).groupby(keys).agg(
+        projects=("_value", "size"),
+        total=("_value", "sum"),
+        won_value=("_won_value", "sum"),
+        n_won=("_is_won", "sum"),
     )
-    result = df[mask]
-    if len(result) > 0:
-        return result
-    # Fallback: normalised substring
-    mask2 = df[col].apply(lambda x: norm_company[:6] in _norm(x))
-    return df[mask2]
+
+
+def _crm_yearly_by_account(crm: pd.DataFrame) -> pd.DataFrame:
+    """Per-(account, year) aggregates of the whole CRM table, one groupby per file version."""
+    derived = _CRM_TABLE.derived("rows", _crm_derived)
+    if "account_name" not in crm.columns:
+        return pd.DataFrame()
+    return _yearly_agg(derived.assign(_account=crm["account_name"].astype(str)), ["_account", "_year"])
+
+
+def _yearly_table(agg: pd.DataFrame) -> pd.DataFrame:
+    """Format per-year aggregates as the Historical tab / export table."""
+    if agg.empty:
+        return pd.DataFrame()
+    return pd.DataFrame({
+        "Year":              agg.index.astype(int),
+        "Projects":          agg["projects"].to_numpy(),
+        "Total Value (EUR)": agg["total"].round(0).to_numpy(),
+        "Won Value (EUR)":   agg["won_value"].round(0).to_numpy(),
+        "Win Rate %":        (agg["n_won"] / agg["projects"].clip(lower=1) * 100).round(1).to_numpy(),
+    }).sort_values("Year").reset_index(drop=True)
 
 
 # ── Public API ────────────────────────────────────────────────────────────────
 
 def get_ib_for_company(company: str) -> pd.DataFrame:
     """Return installed-base rows for the given company."""
-    df = _load_ib()
-    # Try 'ib_customer' column first
-    for col in ["ib_customer", "account_name", "company", "customer"]:
-        matched = _match_company(df, col, company)
-        if not matched.empty:
-            return matched.reset_index(drop=True)
-    return pd.DataFrame()
+    hit = _find_company(_IB_TABLE, company)
+    if hit is None:
+        return pd.DataFrame()
+    return _load_ib().iloc[hit[1]].reset_index(drop=True)
 
 
 def get_crm_projects_for_company(company: str) -> pd.DataFrame:
     """Return CRM project rows for the given company."""
-    df = _load_crm()
-    for col in ["account_name", "company", "customer_project", "ib_customer"]:
-        matched = _match_company(df, col, company)
-        if not matched.empty:
-            return matched.reset_index(drop=True)
-    return pd.DataFrame()
+    hit = _find_company(_CRM_TABLE, company)
+    if hit is None:
+        return pd.DataFrame()
+    return _load_crm().iloc[hit[1]].reset_index(drop=True)
 
 
 def get_yearly_performance(company: str) -> dict:
     """
     Build yearly project performance summary from CRM data.
 
+    Computed on demand from the per-file-version row and account tables, so
+    every call returns fresh DataFrames the caller may modify.
+
     Returns
     -------
     dict with keys:
@@ -122,62 +425,39 @@ def get_yearly_performance(company: str) -> dict:
         won_list   : DataFrame of won projects
         lost_list  : DataFrame of lost / inactive projects
     """
-    projects = get_crm_projects_for_company(company)
-    if projects.empty:
-        return {}
+    return _build_performance(_load_crm(), company)
 
-    df = projects.copy()
 
-    # Parse year from date columns
-    date_col = next((c for c in ["cp_close_date", "sp_oi_date", "CP_created_on", "date_of_inquiry"]
-                     if c in df.columns), None)
-    if date_col:
-        df["_year"] = pd.to_datetime(df[date_col], errors="coerce").dt.year
-    else:
-        df["_year"] = pd.NaT
-
-    # Value column
-    val_col = next((c for c in ["cp_expected_value_eur", "sp_expected_value_eur", "CP_value_local_currency"]
-                    if c in df.columns), None)
-    if val_col:
-        df["_value"] = pd.to_numeric(df[val_col], errors="coerce").fillna(0)
-    else:
-        df["_value"] = 0
-
-    # Status / won detection
-    status_col = next((c for c in ["cp_status_hot", "sp_custom_status", "cp_custom_status", "sales_phase"]
-                       if c in df.columns), None)
-    if status_col:
-        df["_status"] = df[status_col].astype(str)
+def _build_performance(crm: pd.DataFrame, company: str) -> dict:
+    hit = _find_company(_CRM_TABLE, company)
+    if hit is None:
+        return {}
+    col, pos = hit
+
+    derived = _CRM_TABLE.derived("rows", _crm_derived).iloc[pos].reset_index(drop=True)
+    df = crm.iloc[pos].reset_index(drop=True)
+    for c in ["_year", "_value", "_status", "_is_won"]:
+        df[c] = derived[c]
+
+    # Yearly summary: whole accounts come straight from the precomputed
+    # per-account table, other matches are grouped on the fly
+    if col == "account_name":
+        by_account = _CRM_TABLE.derived("yearly_by_account", _crm_yearly_by_account)
+        accounts = df[col].astype(str).unique()
+        agg = by_account[by_account.index.get_level_values("_account").isin(accounts)]
+        agg = agg.groupby(level="_year").sum()
     else:
-        df["_status"] = "Unknown"
+        agg = _yearly_agg(derived, "_year")
+    yearly_df = _yearly_table(agg)
 
-    won_keywords = ["won", "booked", "converted", "order", "placed"]
-    df["_is_won"] = df["_status"].str.lower().apply(
-        lambda s: any(k in s for k in won_keywords)
-    )
+    is_won    = df["_is_won"]
+    won_list  = df[is_won].copy()
+    lost_list = df[~is_won].copy()
 
-    # Yearly summary
-    df_with_year = df.dropna(subset=["_year"])
-    if df_with_year.empty:
-        yearly_df = pd.DataFrame()
-    else:
-        g = df_with_year.groupby("_year")
-        yearly_df = pd.DataFrame({
-            "Year": g["_year"].first().astype(int),
-            "Projects": g["_value"].count(),
-            "Total Value (EUR)": g["_value"].sum().round(0),
-            "Won Value (EUR)": g.apply(lambda x: x.loc[x["_is_won"], "_value"].sum()).round(0),
-            "Win Rate %": g.apply(lambda x: (x["_is_won"].sum() / max(len(x), 1) * 100)).round(1),
-        }).reset_index(drop=True).sort_values("Year")
-
-    won_list  = df[df["_is_won"]].copy()
-    lost_list = df[~df["_is_won"]].copy()
-
-    total_won = float(df.loc[df["_is_won"], "_value"].sum())
-    years_list = df_with_year["_year"].dropna().unique()
-    time_span = int(max(years_list) - min(years_list)) if len(years_list) > 1 else 0
-    win_rate  = float(df["_is_won"].mean() * 100) if len(df) > 0 else 0.0
+    total_won  = float(df.loc[is_won, "_value"].sum())
+    years_list = df["_year"].dropna().unique()
+    time_span  = int(max(years_list) - min(years_list)) if len(years_list) > 1 else 0
+    win_rate   = float(is_won.mean() * 100) if len(df) > 0 else 0.0
 
     return {
         "yearly_df": yearly_df,
@@ -5,24 +5,158 @@ Streamlit-friendly wrapper around the XGBoost priority-ranking model.
 
 Responsibilities
 ----------------
-* Load the persisted model once at startup (with graceful heuristic fallback)
+* Load the active model from the model registry (with graceful heuristic
+  fallback) and hot-swap in-process when the registry's active pointer
+  changes — cached features are kept, only the scores are recomputed
 * Expose `get_ranked_list(equipment_type, top_k)` for the UI
-* Expose `score_customer(bcg_rows, crm_row)` for the customer-detail page
+* Score every equipment row once per (model version, data fingerprint) and
+  serve filtered / top-k views from the cached score array
+* Serve per-row top-5 SHAP drivers from one batched SHAP pass per scored
+  data set (see ExplanationService)
+* Expose `score_customer(company_name)` for the customer-detail page, served
+  from a per-company score index built alongside the rankings
 * Provide `is_model_available()` so the UI can show a "train model" prompt
+* Serve model metadata, metrics and feature importances from the parsed
+  `.meta.json`, cached until the file changes — no booster load needed
+* Compare the loaded data against the model's training distributions
+  (`get_drift_report`), reusing the cached feature matrix and scores
 """
 
 from __future__ import annotations
 
+import json
 import logging
+import re
+import threading
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
 
+from app.services.explanation_service import ExplanationService
+
 logger = logging.getLogger(__name__)
 
 
+def _norm_key(s: pd.Series) -> pd.Series:
+    """Vectorised key normalisation: lowercase, alphanumerics only."""
+    return s.astype(str).str.lower().str.replace(r"[^a-z0-9]", "", regex=True)
+
+
+class _IBCompanyIndex:
+    """
+    Aggregated view of Axel's IB list keyed by normalised customer name.
+
+    One row per IB customer (site cities, latest startup year).  Company
+    names are resolved by exact key first, then by the fuzzy rule the old
+    per-row scan used — the first 10 characters of the company key occur in
+    an IB key, or an IB key occurs in the company key — via a substring
+    index instead of a scan over all IB customers.
+    """
+
+    PREFIX_LEN = 10
+
+    def __init__(self, ib: pd.DataFrame, customer_col: str,
+                 city_col: Optional[str], year_col: Optional[str]):
+        keys   = _norm_key(ib[customer_col])
+        cities = ib[city_col].fillna("").astype(str).str.strip() if city_col else pd.Series("", index=ib.index)
+        years  = pd.to_numeric(ib[year_col], errors="coerce") if year_col else pd.Series(np.nan, index=ib.index)
+
+        df = pd.DataFrame({"key": keys, "city": cities, "year": years.where(years != 0)})
+        df = df[df["key"] != ""]
+
+        g = df.groupby("key", sort=False)
+        self.table = pd.DataFrame({
+            "cities":       g["city"].agg(lambda c: ", ".join(sorted(set(c) - {""}))[:60]),
+            "last_startup": g["year"].max(),
+        })
+        # IB file order decides between several fuzzy candidates
+        self._order: Dict[str, int] = {k: i for i, k in enumerate(self.table.index)}
+        self._by_len: Dict[int, Dict[str, int]] = {}
+
+    def _substring_index(self, length: int) -> Dict[str, int]:
+        """substring of *length* chars → order of the first IB key containing it."""
+        idx = self._by_len.get(length)
+        if idx is None:
+            idx = {}
+            for key, order in self._order.items():
+                for i in range(len(key) - length + 1):
+                    idx.setdefault(key[i:i + length], order)
+            self._by_len[length] = idx
+        return idx
+
+    def resolve(self, company: str) -> Optional[str]:
+        """Return the IB key matching *company*, or None."""
+        norm = re.sub(r"[^a-z0-9]", "", str(company).lower())
+        if not norm:
+            return None
+        if norm in self._order:
+            return norm
+
+        prefix = norm[:self.PREFIX_LEN]
+        best = self._substring_index(len(prefix)).get(prefix)
+        # IB keys contained in the company key
+        for i in range(len(norm)):
+            for j in range(i + 1, len(norm) + 1):
+                order = self._order.get(norm[i:j])
+                if order is not None and (best is None or order < best):
+                    best = order
+        return self.table.index[best] if best is not None else None
+
+    def lookup(self, companies: pd.Series) -> Tuple[pd.Series, pd.Series]:
+        """Return (site_city, last_startup) aligned with *companies*."""
+        uniq = companies.astype(str).unique()
+        cities: Dict[str, str] = {}
+        years:  Dict[str, Optional[int]] = {}
+        for name in uniq:
+            key = self.resolve(name)
+            if key is None:
+                cities[name], years[name] = "", None
+                continue
+            row = self.table.loc[key]
+            cities[name] = row["cities"]
+            years[name]  = int(row["last_startup"]) if pd.notna(row["last_startup"]) else None
+        names = companies.astype(str)
+        return (
+            pd.Series([cities[n] for n in names], index=companies.index, dtype=object),
+            pd.Series([years[n] for n in names], index=companies.index, dtype=object),
+        )
+
+
+class _ModelInfo:
+    """Parsed `.meta.json` of one model, valid while the file's (mtime, size) is unchanged."""
+
+    def __init__(self, meta_path: Path, stamp: Tuple[int, int], meta: Dict):
+        self.meta_path = meta_path
+        self.stamp     = stamp
+        self.meta      = meta
+        fi = meta.get("feature_importance") or {}
+        self.feature_importance: Optional[pd.Series] = (
+            pd.Series(fi, dtype=float).sort_values(ascending=False) if fi else None
+        )
+
+
+class _ScoreSnapshot:
+    """
+    One scoring result: the feature matrix with scores, its filter masks and
+    company index, and the model that produced it.
+
+    Published with a single assignment, so readers that take one reference
+    never mix tables, scores or masks of different scoring runs.  Only the
+    mask memo grows after publication (masks of this snapshot's table).
+    """
+
+    def __init__(self, key: Tuple[str, str], scored: pd.DataFrame, scores: np.ndarray,
+                 company_index: Dict[str, Dict], model=None):
+        self.key           = key        # (model version | "heuristic", data fingerprint)
+        self.scored        = scored     # feat_df + priority_score column
+        self.scores        = scores     # raw score array aligned with scored
+        self.company_index = company_index
+        self.model         = model      # None for heuristic scores
+        self.masks: Dict[Tuple[str, str], np.ndarray] = {}   # filter → boolean mask
+
+
 class MLRankingService:
     """
     High-level service that bridges the Streamlit app and the XGBoost model.
@@ -30,42 +164,113 @@ class MLRankingService:
     The model is loaded lazily on first use.  If the model file does not exist
     the service falls back to the heuristic scoring already implemented in
     PredictionService, so the app never breaks.
+
+    By default the model comes from the registry's active version; passing
+    *model_path* pins the service to a single artifact instead.
     """
 
-    def __init__(self, db_path: str | Path, model_path: Optional[str | Path] = None):
+    def __init__(
+        self,
+        db_path: str | Path,
+        model_path: Optional[str | Path] = None,
+        registry=None,
+    ):
         from app.core.config import settings
         self._db_path    = Path(db_path)
-        self._model_path = Path(model_path) if model_path else Path(settings.XGB_MODEL_PATH)
+        if model_path:
+            self._registry = None
+            self._model_path: Optional[Path] = Path(model_path)
+        else:
+            from src.models.model_registry import ModelRegistry
+            self._registry = registry or ModelRegistry(
+                settings.MODEL_REGISTRY_DIR, legacy_model_path=settings.XGB_MODEL_PATH
+            )
+            self._model_path = self._registry.active_model_path()
         self._model      = None    # lazy
+        self._active     = None    # registry pointer the loaded model belongs to
+        self._failed     = None    # (pointer, pointer stamp) whose model failed to load
+        self._swap_lock  = threading.RLock()
         self._feat_df    = None    # cached feature matrix
         self._labels     = None    # cached labels (if available)
+        self._feat_fp    = None    # fingerprint of the cached feature matrix
+        self._snapshot: Optional[_ScoreSnapshot] = None  # latest scores, swapped as one unit
+        self._ib_index   = None    # (IB frame, aggregated IB table: site city, last startup)
+        self._drift      = None    # (scored key, drift report)
+        self._info: Optional[_ModelInfo] = None  # cached model metadata
+        self._explanations = ExplanationService()
 
     # ── Public API ────────────────────────────────────────────────────────────
 
     def is_model_available(self) -> bool:
-        return self._model_path.exists()
+        self._sync_with_registry()
+        return self._model_path is not None and self._model_path.exists()
+
+    @property
+    def registry(self):
+        """The ModelRegistry backing this service (None when pinned to a file)."""
+        return self._registry
 
     def clear_cache(self) -> None:
-        """Invalidate the cached feature matrix (call after data is reloaded)."""
-        self._feat_df = None
-        self._labels  = None
+        """Invalidate the cached feature matrix and scores (call after data is reloaded)."""
+        self._feat_df    = None
+        self._labels     = None
+        self._feat_fp    = None
+        with self._swap_lock:
+            self._snapshot = None
+        self._ib_index   = None
+        self._drift      = None
+        self._explanations.clear()
 
     def load_model(self) -> bool:
         """Load model from disk. Returns True on success."""
         if not self.is_model_available():
             logger.info("No trained model found at %s", self._model_path)
             return False
+        if self._failed is not None and self._pointer_stamp() == self._failed:
+            return False    # already failed for this pointer; retried once it changes
         try:
             from src.models.xgb_ranking_model import XGBPriorityModel
-            self._model = XGBPriorityModel()
-            self._model.load(self._model_path)
+            model = XGBPriorityModel().load(self._model_path)
+            model.booster   # parse now, so a swap never publishes a half-loaded model
+            with self._swap_lock:
+                self._model = model
             logger.info("XGBoost model loaded from %s", self._model_path)
             return True
         except Exception as e:
             logger.warning("Could not load XGBoost model: %s", e)
             self._model = None
+            if self._registry is not None:
+                self._failed = self._pointer_stamp()
             return False
 
+    def activate_version(self, version: str) -> bool:
+        """
+        Make a registry *version* (or "heuristic") active and swap to it now.
+
+        Cached features are kept; the next ranking request rescores them
+        with the new model.  Returns True if a model is being served.
+        """
+        if self._registry is None:
+            raise RuntimeError("MLRankingService is pinned to a model file, not a registry")
+        self._registry.activate(version)
+        return self.refresh_model()
+
+    def use_heuristic(self) -> None:
+        """Serve heuristic scores (the registry keeps every model version)."""
+        if self._registry is not None:
+            self._registry.deactivate()
+            self.refresh_model()
+        else:
+            with self._swap_lock:
+                self._model = None
+
+    def refresh_model(self) -> bool:
+        """Re-read the registry pointer and hot-swap if it changed."""
+        self._sync_with_registry()
+        if self._model is None and self._model_path is not None:
+            return self.load_model()
+        return self._model is not None
+
     def get_ranked_list(
         self,
         equipment_type: Optional[str] = None,
@@ -76,30 +281,19 @@ class MLRankingService:
         """
         Return a ranked DataFrame of equipment units.
 
-        Columns: rank, company, equipment_type, country, equipment_age, priority_score
+        Columns: rank, company, equipment_type, country, equipment_age, priority_score, row_id
+
+        `row_id` is the row's position in the scored feature matrix; pass it
+        to `get_explanations` for SHAP drivers.
 
         Falls back to the heuristic model if XGBoost model is unavailable.
+        Scores come from the cache built by `_get_scored`; only the filter
+        masks and a top-k partial sort are computed per call.
         """
-        if self._model is None and not force_heuristic:
-            self.load_model()
-
-        if self._model is not None:
-            feat_df = self._get_features()
-            if feat_df is not None and not feat_df.empty:
-                try:
-                    result = self._model.rank_by_equipment_type(
-                        feat_df, equipment_type=equipment_type, top_k=top_k if not country else None
-                    )
-                    if country and "country" in result.columns:
-                        result = result[result["country"].str.contains(country, case=False, na=False)]
-                    if top_k:
-                        result = result.head(top_k)
-                    return result
-                except Exception as e:
-                    logger.warning("XGBoost ranking failed, falling back: %s", e)
-
-        # ── Heuristic fallback ────────────────────────────────────────────────
-        return self._heuristic_ranked_list(equipment_type, country, top_k)
+        snap = self._get_scored(force_heuristic)
+        if snap is None:
+            return self._empty_ranking()
+        return self._select(snap, equipment_type, country, top_k)
 
     def score_customer(
         self,
@@ -109,20 +303,59 @@ class MLRankingService:
         """
         Return (priority_score [0-100], source) for a single company.
         source is "xgboost" or "heuristic".
+
+        The score is the company's best-scored equipment unit (optionally
+        restricted to *equipment_type*), looked up by normalised name.
         """
-        ranked = self.get_ranked_list(equipment_type=equipment_type)
-        if ranked.empty:
+        entry = self.get_company_ranking(company_name)
+        if entry is None:
             return 50.0, "heuristic"
 
-        mask = ranked["company"].str.lower().str.contains(
-            company_name.lower()[:8], na=False
-        )
-        if mask.any():
-            row = ranked[mask].iloc[0]
-            source = "xgboost" if self._model is not None else "heuristic"
-            return float(row["priority_score"]), source
+        if equipment_type:
+            by_type = entry["by_type"]
+            stats = by_type.get(equipment_type)
+            if stats is None:
+                needle = equipment_type.lower()
+                matches = [v for k, v in by_type.items() if needle in k.lower()]
+                if not matches:
+                    return 50.0, "heuristic"
+                stats = max(matches, key=lambda v: v["max_score"])
+            return float(stats["max_score"]), entry["source"]
+
+        return float(entry["max_score"]), entry["source"]
+
+    def score_key(self) -> Optional[Tuple[str, str]]:
+        """(model version | "heuristic", data fingerprint) of the latest scores; None before scoring."""
+        snap = self._snapshot
+        return snap.key if snap is not None else None
+
+    def get_company_ranking(self, company_name: str) -> Optional[Dict]:
+        """
+        Return the score summary of one company, or None if it is not in the data.
 
-        return 50.0, "heuristic"
+        Keys: company, rank, total_companies, max_score, mean_score, n_units,
+        by_type ({equipment_type: {max_score, mean_score, n_units}}), source
+        """
+        snap = self._get_scored()
+        if snap is None:
+            return None
+        from src.features.feature_engineering import _normalise_name
+        return snap.company_index.get(_normalise_name(company_name))
+
+    def get_explanations(self, row_ids: List[int]) -> Dict[int, List[Dict]]:
+        """
+        Return the top-5 SHAP contributions for the given scored rows.
+
+        SHAP values for all rows are computed in a single batched pass the
+        first time explanations are requested for the current scores.
+        Returns {} in heuristic mode (no model to explain).
+        """
+        snap = self._get_scored()
+        if snap is None or snap.model is None:
+            return {}
+        if not self._explanations.compute(snap.model, snap.scored, snap.key):
+            return {}
+        return self._explanations.top_contributions(row_ids)
 
     def get_equipment_types(self) -> List[str]:
         """Return sorted list of unique EquipmentType values from BCG data."""
@@ -149,24 +382,75 @@ class MLRankingService:
         return []
 
     def get_model_metadata(self) -> Dict:
-        """Return the metadata JSON stored alongside the model file."""
-        meta_path = self._model_path.with_suffix(".meta.json")
-        if meta_path.exists():
-            import json
-            try:
-                return json.loads(meta_path.read_text())
-            except Exception:
-                pass
-        return {}
+        """
+        Return the metadata JSON stored alongside the model file.
+
+        The parsed dict is cached and shared between calls (treat it as
+        read-only); it is re-read only when the file's mtime or size changes.
+        """
+        info = self._model_info()
+        return info.meta if info is not None else {}
+
+    def get_drift_report(self) -> Optional[Dict]:
+        """
+        Feature / score drift of the loaded data against the served model's
+        training data (see src.models.drift.drift_report).
+
+        Computed once per (model version, data fingerprint) from the cached
+        feature matrix and scores.  Returns None in heuristic mode or for
+        models trained before reference profiles were recorded.
+        """
+        snap = self._get_scored()
+        if snap is None or snap.model is None:
+            return None
+        drift = self._drift
+        if drift is not None and drift[0] == snap.key:
+            return drift[1]
+        model = snap.model
+        profile = model._meta.get("reference_profile")
+        if not profile:
+            return None
+        from src.models.drift import drift_report
+        report = drift_report(profile, snap.scored, snap.scores / 100,
+                              trained_at=model._meta.get("trained_at"))
+        self._drift = (snap.key, report)
+        if report["needs_retraining"]:
+            logger.warning("Model drift detected: %s", "; ".join(report["reasons"]))
+        return report
 
     def get_feature_importance(self) -> Optional[pd.Series]:
-        """Return feature importances as a pd.Series, or None."""
+        """Return feature importances as a pd.Series (from the metadata file), or None."""
+        info = self._model_info()
+        if info is not None and info.feature_importance is not None:
+            return info.feature_importance
         if self._model and hasattr(self._model, "feature_importances_"):
             return self._model.feature_importances_
         return None
 
     # ── Private helpers ───────────────────────────────────────────────────────
 
+    def _model_info(self) -> Optional[_ModelInfo]:
+        """Metadata of the current model file, parsed once per file version."""
+        if self._model_path is None:
+            return None
+        meta_path = self._model_path.with_suffix(".meta.json")
+        try:
+            st = meta_path.stat()
+        except OSError:
+            return None
+        stamp = (st.st_mtime_ns, st.st_size)
+        info = self._info
+        if info is not None and info.meta_path == meta_path and info.stamp == stamp:
+            return info
+        try:
+            meta = json.loads(meta_path.read_text())
+        except Exception as e:
+            logger.warning("Could not read model metadata %s: %s", meta_path, e)
+            return None
+        info = _ModelInfo(meta_path, stamp, meta)
+        self._info = info
+        return info
+
     def _get_features(self) -> Optional[pd.DataFrame]:
         """Lazily extract and cache the feature matrix, reusing the app's open DB connection."""
         if self._feat_df is not None:
@@ -209,139 +493,284 @@ class MLRankingService:
             return None
 
     def _enrich_with_ib(self, feat_df: pd.DataFrame) -> pd.DataFrame:
-        """Join Axel's IB list to add site_city, last_startup, capacity columns."""
+        """Join Axel's IB list to add _site_city and _last_startup columns."""
         try:
-            from app.services.historical_service import _load_ib
-            ib = _load_ib()
-            if ib.empty or "_company" not in feat_df.columns:
+            index = self._get_ib_index()
+            if index is None or "_company" not in feat_df.columns:
                 return feat_df
 
-            customer_col = next((c for c in ["ib_customer", "account_name"] if c in ib.columns), None)
-            city_col     = next((c for c in ["ib_city", "city"] if c in ib.columns), None)
-            year_col     = next((c for c in ["ib_startup"] if c in ib.columns), None)
-
-            if not customer_col:
-                return feat_df
-
-            # Build lookup: normalised company name -> (city list, max startup year)
-            import re
-            def _n(s): return re.sub(r"[^a-z0-9]", "", str(s).lower())
-
-            ib_lookup: dict = {}
-            for _, row in ib.iterrows():
-                key = _n(str(row.get(customer_col, "")))
-                if not key:
-                    continue
-                city = str(row.get(city_col, "")).strip() if city_col else ""
-                yr   = row.get(year_col, None) if year_col else None
-                try:
-                    yr = int(float(yr)) if yr and str(yr).strip() else None
-                except (ValueError, TypeError):
-                    yr = None
-                if key not in ib_lookup:
-                    ib_lookup[key] = {"cities": set(), "years": []}
-                if city:
-                    ib_lookup[key]["cities"].add(city)
-                if yr:
-                    ib_lookup[key]["years"].append(yr)
-
-            def _lookup_city(company):
-                key = _n(str(company))[:10]
-                for k, v in ib_lookup.items():
-                    if key in k or k in _n(str(company)):
-                        return ", ".join(sorted(v["cities"]))[:60]
-                return ""
-
-            def _lookup_year(company):
-                key = _n(str(company))[:10]
-                for k, v in ib_lookup.items():
-                    if key in k or k in _n(str(company)):
-                        if v["years"]:
-                            return max(v["years"])
-                return None
-
             feat_df = feat_df.copy()
-            feat_df["_site_city"]     = feat_df["_company"].apply(_lookup_city)
-            feat_df["_last_startup"]  = feat_df["_company"].apply(_lookup_year)
+            feat_df["_site_city"], feat_df["_last_startup"] = index.lookup(feat_df["_company"])
         except Exception as e:
             logger.debug("IB enrichment skipped: %s", e)
 
         return feat_df
 
+    def _get_ib_index(self) -> Optional[_IBCompanyIndex]:
+        """Build (once per IB file version) the aggregated per-company IB table."""
+        from app.services.historical_service import _load_ib
+        ib = _load_ib()   # same object until ib_list.xlsx changes
+        if self._ib_index is not None and self._ib_index[0] is ib:
+            return self._ib_index[1]
+        if ib.empty:
+            return None
+
+        customer_col = next((c for c in ["ib_customer", "account_name"] if c in ib.columns), None)
+        city_col     = next((c for c in ["ib_city", "city"] if c in ib.columns), None)
+        year_col     = next((c for c in ["ib_startup"] if c in ib.columns), None)
+        if not customer_col:
+            return None
+
+        index = _IBCompanyIndex(ib, customer_col, city_col, year_col)
+        self._ib_index = (ib, index)
+        return index
+
     def get_ib_enriched_row(self, company: str) -> dict:
         """Return IB enrichment fields for a single company (for explanation card)."""
-        feat_df = self._get_features()
-        if feat_df is None or "_company" not in feat_df.columns:
+        index = self._get_ib_index()
+        key = index.resolve(company) if index is not None else None
+        if key is None:
             return {}
-        mask = feat_df["_company"].str.lower().str.contains(company[:8].lower(), na=False)
-        rows = feat_df[mask]
-        if rows.empty:
-            return {}
-        row = rows.iloc[0]
+        row = index.table.loc[key]
         return {
-            "site_city":    row.get("_site_city", ""),
-            "last_startup": row.get("_last_startup", None),
+            "site_city":    row["cities"],
+            "last_startup": int(row["last_startup"]) if pd.notna(row["last_startup"]) else None,
         }
 
+    # ── Model hot swap ────────────────────────────────────────────────────────
 
-    def _heuristic_ranked_list(
-        self,
-        equipment_type: Optional[str],
-        country: Optional[str],
-        top_k: Optional[int],
-    ) -> pd.DataFrame:
+    def _sync_with_registry(self) -> None:
         """
-        Build a heuristic ranking directly from BCG data.
-        Score = age × 3 + sms_oem × 15 + crm_rating × 2  (capped at 100).
+        Follow the registry's ACTIVE pointer.
+
+        When it changed since the current model was loaded (a training run
+        registered a new version, or a version was activated elsewhere) the
+        new model is loaded and published with one reference assignment; the
+        feature matrix stays cached and scores are recomputed on next use
+        because the score cache is keyed by model version.
+
+        A version that fails to load is remembered with the pointer file's
+        stamp (inode, mtime) and not retried (or re-logged) until the ACTIVE
+        pointer changes.
         """
-        from src.features.feature_engineering import (
-            extract_equipment_features,
-            load_raw_data,
-            load_raw_data_from_conn,
-        )
-        _empty = pd.DataFrame(columns=["rank", "company", "equipment_type",
-                                        "country", "equipment_age", "priority_score"])
-        try:
-            bcg_df = crm_df = None
+        if self._registry is None:
+            return
+        active = self._registry.active_version()
+        if self._is_current(active):
+            return
+        stamp = (active, self._registry.pointer_stamp())
+        if stamp == self._failed:
+            return
+        with self._swap_lock:
+            if self._is_current(active) or stamp == self._failed:
+                return
+            path = self._registry.active_model_path()
+            model = None
+            if path is not None:
+                try:
+                    from src.models.xgb_ranking_model import XGBPriorityModel
+                    model = XGBPriorityModel().load(path)
+                    model.booster
+                except Exception as e:
+                    logger.warning("Could not load model %s, keeping current: %s", path, e)
+                    self._failed = stamp
+                    return
+            self._model_path = path
+            self._model      = model
+            self._active     = active
+            self._failed     = None
+            logger.info("Serving model: %s", model.version_id if model else "heuristic")
+
+    def _pointer_stamp(self) -> Optional[Tuple[Optional[str], Optional[Tuple[int, int]]]]:
+        """(ACTIVE pointer, its file stamp) — identifies one activation; None when pinned to a file."""
+        if self._registry is None:
+            return None
+        return self._registry.active_version(), self._registry.pointer_stamp()
+
+    def _is_current(self, active: Optional[str]) -> bool:
+        """True when the served model already matches the pointer *active*."""
+        return active == self._active and (self._model is not None or self._model_path is None)
+
+    # ── Score cache ───────────────────────────────────────────────────────────
+
+    def _get_scored(self, force_heuristic: bool = False) -> Optional[_ScoreSnapshot]:
+        """
+        Return the score snapshot (feature matrix with a `priority_score`
+        column, raw scores, masks, company index) for the current model.
+
+        Scores are computed once per (model version, data fingerprint) and
+        reused until either the model or the underlying data changes.
+        Callers use the returned snapshot throughout, never `self._snapshot`
+        again, so a concurrent re-score cannot mix two scoring runs.
+        """
+        self._sync_with_registry()
+        if self._model is None and not force_heuristic:
+            self.load_model()
+        model = self._model   # one snapshot per call – a concurrent swap cannot mix models
+
+        feat_df = self._get_features()
+        if feat_df is None or feat_df.empty:
+            return None
+
+        if self._feat_fp is None:
+            from src.features.feature_engineering import data_fingerprint
+            self._feat_fp = data_fingerprint(feat_df)
+
+        use_model = model is not None and not force_heuristic
+        version   = model.version_id if use_model else "heuristic"
+        key       = (version, self._feat_fp)
+        snap = self._snapshot
+        if snap is not None and snap.key == key:
+            return snap
+
+        scores = None
+        if use_model:
             try:
-                from app.services.data_service import data_service as _ds
-                conn = _ds.get_conn()
-                if conn is not None:
-                    bcg_df, crm_df = load_raw_data_from_conn(conn)
-            except Exception:
-                pass
+                scores = model.predict_proba(feat_df) * 100
+            except Exception as e:
+                logger.warning("XGBoost scoring failed, falling back: %s", e)
+                key = ("heuristic", self._feat_fp)
+                if snap is not None and snap.key == key:
+                    return snap
+                use_model = False
+        if scores is None:
+            scores = self._heuristic_scores(feat_df)
+
+        scored = feat_df.copy()
+        scored["priority_score"] = np.round(scores, 1)
+        snap = _ScoreSnapshot(key, scored, np.asarray(scores, dtype=float),
+                              self._build_company_index(scored, key[0]),
+                              model if use_model else None)
+        with self._swap_lock:
+            self._snapshot = snap
+        logger.info("Scored %d equipment rows (%s)", len(scored), key[0])
+        return snap
+
+    @staticmethod
+    def _build_company_index(scored: pd.DataFrame, version: str) -> Dict[str, Dict]:
+        """
+        Aggregate scores per normalised company (and per equipment type).
 
-            if bcg_df is None:
-                bcg_df, crm_df = load_raw_data(self._db_path)
+        Companies are ranked by their best equipment score, so the customer
+        page gets rank / total without re-sorting the equipment table.
+        """
+        from src.features.feature_engineering import _normalise_name
+
+        source = "heuristic" if version == "heuristic" else "xgboost"
+        names  = scored["_company"].astype(str)
+        uniq   = names.drop_duplicates()
+        keys   = names.map(dict(zip(uniq, uniq.map(_normalise_name))))
+
+        df = pd.DataFrame({
+            "key":     keys.to_numpy(),
+            "company": names.to_numpy(),
+            "eq_type": scored["_equipment_type"].astype(str).to_numpy(),
+            "score":   scored["priority_score"].to_numpy(dtype=float),
+        })
+        df = df[df["key"] != ""]
+        if df.empty:
+            return {}
 
-            feat_df, _ = extract_equipment_features(bcg_df, crm_df)
-        except Exception as e:
-            logger.warning("Heuristic fallback data load failed: %s", e)
-            return _empty
+        per_co = df.groupby("key", sort=False).agg(
+            company=("company", "first"),
+            max_score=("score", "max"),
+            mean_score=("score", "mean"),
+            n_units=("score", "size"),
+        )
+        per_co["rank"] = per_co["max_score"].rank(method="min", ascending=False).astype(int)
+
+        per_type = df.groupby(["key", "eq_type"], sort=False)["score"].agg(["max", "mean", "size"])
+        by_type: Dict[str, Dict[str, Dict]] = {}
+        for (key, eq_type), mx, mn, n in zip(
+            per_type.index, per_type["max"], per_type["mean"], per_type["size"]
+        ):
+            by_type.setdefault(key, {})[eq_type] = {
+                "max_score":  float(mx),
+                "mean_score": round(float(mn), 1),
+                "n_units":    int(n),
+            }
+
+        total = len(per_co)
+        return {
+            key: {
+                "company":         company,
+                "rank":            int(rank),
+                "total_companies": total,
+                "max_score":       float(mx),
+                "mean_score":      round(float(mn), 1),
+                "n_units":         int(n),
+                "by_type":         by_type.get(key, {}),
+                "source":          source,
+            }
+            for key, company, mx, mn, n, rank in zip(
+                per_co.index, per_co["company"], per_co["max_score"],
+                per_co["mean_score"], per_co["n_units"], per_co["rank"],
+            )
+        }
 
-        df = feat_df.copy()
-        df["priority_score"] = (
-            df["equipment_age"].clip(0, 30) * 3.0
-            + df["is_sms_oem"] * 15.0
-            + df["crm_rating_num"] * 2.0
-        ).clip(0, 100).round(1)
+    @staticmethod
+    def _filter_mask(snap: _ScoreSnapshot, column: str, value: str) -> np.ndarray:
+        """Case-insensitive substring mask over *snap*'s table, memoised per value."""
+        key = (column, value.lower())
+        mask = snap.masks.get(key)
+        if mask is None:
+            mask = snap.scored[column].str.contains(value, case=False, na=False, regex=False).to_numpy()
+            snap.masks[key] = mask
+        return mask
+
+    def _select(
+        self,
+        snap: _ScoreSnapshot,
+        equipment_type: Optional[str],
+        country: Optional[str],
+        top_k: Optional[int],
+    ) -> pd.DataFrame:
+        """Build a ranked view from *snap*'s score array (filter + argpartition)."""
+        from src.models.xgb_ranking_model import top_k_order
 
+        idx = np.arange(len(snap.scored))
         if equipment_type:
-            df = df[df["_equipment_type"].str.contains(equipment_type, case=False, na=False)]
+            idx = idx[self._filter_mask(snap, "_equipment_type", equipment_type)[idx]]
         if country:
-            df = df[df["_country"].str.contains(country, case=False, na=False)]
+            idx = idx[self._filter_mask(snap, "_country", country)[idx]]
 
-        df = df.sort_values("priority_score", ascending=False).reset_index(drop=True)
-        df.index += 1
+        order = idx[top_k_order(snap.scores[idx], top_k or None)]
 
-        out = df[["_company", "_equipment_type", "_country", "_equipment_age", "priority_score"]].copy()
+        out = snap.scored.iloc[order][
+            ["_company", "_equipment_type", "_country", "_equipment_age", "priority_score"]
+        ].copy()
         out.columns = ["company", "equipment_type", "country", "equipment_age", "priority_score"]
+        out["row_id"] = order
+        out.index = np.arange(1, len(out) + 1)  # 1-based rank
         out.insert(0, "rank", out.index)
-
-        if top_k:
-            out = out.head(top_k)
         return out
 
+    @staticmethod
+    def _heuristic_scores(feat_df: pd.DataFrame) -> np.ndarray:
+        """
+        Heuristic priority score used when no trained model is available.
+
+        Same equipment rules as PredictionService (age bands, critical
+        equipment type, SMS OEM, CRM rating), so the fallback ranking and the
+        customer page agree; maintenance dates are not in the feature matrix.
+        """
+        from app.services.prediction_service import (
+            CRITICAL_EQUIPMENT_TYPES,
+            heuristic_equipment_scores,
+        )
+        return heuristic_equipment_scores(pd.DataFrame({
+            "equipment_age":            feat_df["equipment_age"],
+            "is_critical":              feat_df["_equipment_type"].astype(str).str.lower().str.contains(
+                                            "|".join(CRITICAL_EQUIPMENT_TYPES), regex=True),
+            "is_sms_equipment":         feat_df["is_sms_oem"].astype(bool),
+            "months_since_maintenance": 12.0,
+            "customer_rating":          feat_df["crm_rating_num"],
+        }, index=feat_df.index))
+
+    @staticmethod
+    def _empty_ranking() -> pd.DataFrame:
+        return pd.DataFrame(columns=["rank", "company", "equipment_type",
+                                     "country", "equipment_age", "priority_score", "row_id"])
 
 
 # Singleton (uses settings.DB_PATH automatically)
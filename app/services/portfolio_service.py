@@ -0,0 +1,269 @@
+"""
+app/services/portfolio_service.py
+==================================
+Portfolio-wide yearly rollups of Axel's CRM project export.
+
+Responsibilities
+----------------
+* Aggregate pipeline value, won value and project / won counts per
+  (company, region, country, equipment type, year) in one DuckDB pass over
+  the `hist_crm` rows (year / value / won flag as historical_service
+  derives them) and store the result as the `crm_rollup` cube
+* Refresh incrementally: only companies whose projects changed since the
+  last run are re-aggregated (per-company content digests)
+* Serve slices of the cube — the Analytics page's CRM pipeline by year
+  for the active filters, per-customer yearly lookups — with win rates
+  derived at query time
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Dict, Optional, Sequence, Union
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+CUBE_TABLE    = "crm_rollup"
+DIGEST_TABLE  = "crm_rollup_accounts"
+DIMENSIONS    = ("company", "region", "country", "equipment_type", "year")
+
+_COUNTRY_COLS   = ["account_country", "country"]
+_EQ_TYPE_COLS   = ["equipment_type", "sp_coe", "product_line"]
+_NOT_ASSIGNED   = "Not assigned"
+
+
+def _text_col(df: pd.DataFrame, candidates: Sequence[str]) -> pd.Series:
+    """First present *candidates* column as trimmed text; blank / missing → NA."""
+    col = next((c for c in candidates if c in df.columns), None)
+    if col is None:
+        return pd.Series(pd.NA, index=df.index, dtype="string")
+    text = df[col].astype("string").str.strip()
+    return text.mask(text == "")
+
+
+class PortfolioRollupService:
+    """Builds and queries the CRM rollup cube on the app's DuckDB connection."""
+
+    def __init__(self, conn_factory=None):
+        self._conn_factory = conn_factory
+
+    def _conn(self):
+        if self._conn_factory is not None:
+            return self._conn_factory()
+        from app.services.data_service import data_service
+        return data_service.get_conn()
+
+    # ── Build ─────────────────────────────────────────────────────────────────
+
+    def refresh(self) -> Dict:
+        """
+        Bring the cube up to date with the current CRM export.
+
+        Runs as part of Load Data.  Skips all work when the CRM file
+        fingerprint is unchanged; otherwise recomputes per-company digests
+        and re-aggregates only new / changed companies (and drops removed
+        ones).  Returns {status, companies_changed, companies_removed, rows}.
+        """
+        from app.services.historical_service import _CRM_TABLE
+
+        if _CRM_TABLE.frame().empty:        # ingests hist_crm if the file changed
+            return {"status": "no_data", "companies_changed": 0, "companies_removed": 0, "rows": 0}
+        fp = _CRM_TABLE.fingerprint()
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS _meta (key VARCHAR PRIMARY KEY, value VARCHAR)")
+        row = conn.execute("SELECT value FROM _meta WHERE key = 'crm_rollup_fingerprint'").fetchone()
+        if row is not None and row[0] == fp and self._has_cube(conn):
+            return {"status": "unchanged", "companies_changed": 0, "companies_removed": 0,
+                    "rows": self._cube_rows(conn)}
+
+        # the temp tables are dropped however staging, diffing or the swap ends
+        try:
+            if not self._stage_projects(conn):
+                logger.warning("CRM export has no account_name column; rollup skipped")
+                return {"status": "no_data", "companies_changed": 0, "companies_removed": 0, "rows": 0}
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {CUBE_TABLE} (
+                    company VARCHAR, region VARCHAR, country VARCHAR, equipment_type VARCHAR,
+                    year INTEGER, projects BIGINT, pipeline_value DOUBLE, won_value DOUBLE, n_won BIGINT
+                )
+            """)
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {DIGEST_TABLE} (company VARCHAR, digest HUGEINT, n BIGINT)")
+            conn.execute("""
+                CREATE OR REPLACE TEMP TABLE _rollup_digest AS
+                SELECT company,
+                       sum(hash(region, country, equipment_type, year, value, is_won))::HUGEINT AS digest,
+                       count(*) AS n
+                FROM _rollup_projects GROUP BY company
+            """)
+            conn.execute(f"""
+                CREATE OR REPLACE TEMP TABLE _rollup_changed AS
+                SELECT d.company FROM _rollup_digest d
+                LEFT JOIN {DIGEST_TABLE} o USING (company)
+                WHERE o.company IS NULL OR o.digest <> d.digest OR o.n <> d.n
+            """)
+            n_removed = conn.execute(f"""
+                SELECT count(*) FROM {DIGEST_TABLE}
+                WHERE company NOT IN (SELECT company FROM _rollup_digest)
+            """).fetchone()[0]
+            n_changed = conn.execute("SELECT count(*) FROM _rollup_changed").fetchone()[0]
+
+            conn.execute("BEGIN TRANSACTION")
+            try:
+                conn.execute(f"""
+                    DELETE FROM {CUBE_TABLE}
+                    WHERE company IN (SELECT company FROM _rollup_changed)
+                       OR company NOT IN (SELECT company FROM _rollup_digest)
+                """)
+                conn.execute(f"""
+                    INSERT INTO {CUBE_TABLE}
+                    SELECT company, region, country, equipment_type, year,
+                           count(*)                           AS projects,
+                           sum(value)                         AS pipeline_value,
+                           coalesce(sum(value) FILTER (WHERE is_won), 0) AS won_value,
+                           count(*) FILTER (WHERE is_won)     AS n_won
+                    FROM _rollup_projects
+                    WHERE company IN (SELECT company FROM _rollup_changed)
+                    GROUP BY ALL
+                """)
+                conn.execute(f"DELETE FROM {DIGEST_TABLE}")
+                conn.execute(f"INSERT INTO {DIGEST_TABLE} SELECT company, digest, n FROM _rollup_digest")
+                conn.execute("""
+                    INSERT INTO _meta (key, value) VALUES ('crm_rollup_fingerprint', ?)
+                    ON CONFLICT (key) DO UPDATE SET value = excluded.value
+                """, (fp,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            for tmp in ("_rollup_projects", "_rollup_digest", "_rollup_changed"):
+                conn.execute(f"DROP TABLE IF EXISTS {tmp}")
+
+        rows = self._cube_rows(conn)
+        logger.info("CRM rollup refreshed: %d companies re-aggregated, %d removed, %d cube rows",
+                    n_changed, n_removed, rows)
+        return {"status": "refreshed", "companies_changed": int(n_changed),
+                "companies_removed": int(n_removed), "rows": rows}
+
+    def _stage_projects(self, conn) -> bool:
+        """
+        Normalise hist_crm into one row per project with its cube dimensions.
+
+        Year, value and won flag are historical_service's per-row derivation
+        (`_crm_derived`), so the cube and the Historical tab agree on them.
+        """
+        from app.services.data_service import DataIngestionService
+        from app.services.historical_service import _CRM_TABLE, _crm_derived
+
+        crm = _CRM_TABLE.frame()
+        if "account_name" not in crm.columns:
+            return False
+        derived = _CRM_TABLE.derived("rows", _crm_derived)
+        keep = crm["account_name"].notna()
+        source = pd.DataFrame({
+            "company":  crm["account_name"].astype(str),
+            "_country": _text_col(crm, _COUNTRY_COLS),
+            "_eq_type": _text_col(crm, _EQ_TYPE_COLS),
+            "_year":    derived["_year"].astype("Int64"),
+            "_value":   derived["_value"].astype(float),
+            "_is_won":  derived["_is_won"].astype(bool),
+        })[keep]
+        region_map = pd.DataFrame(
+            list(DataIngestionService.COUNTRY_TO_REGION_MAP.items()), columns=["country_key", "region"]
+        )
+        conn.register("_rollup_source", source)
+        conn.register("_rollup_region_map", region_map)
+        try:
+            conn.execute(f"""
+                CREATE OR REPLACE TEMP TABLE _rollup_projects AS
+                SELECT CAST(p.company AS VARCHAR)                AS company,
+                       coalesce(r.region, '{_NOT_ASSIGNED}')     AS region,
+                       coalesce(p._country, 'Unknown')           AS country,
+                       coalesce(p._eq_type, 'Unknown')           AS equipment_type,
+                       CAST(p._year AS INTEGER)                  AS year,
+                       CAST(p._value AS DOUBLE)                  AS value,
+                       p._is_won                                 AS is_won
+                FROM _rollup_source p
+                LEFT JOIN _rollup_region_map r ON r.country_key = lower(p._country)
+            """)
+        finally:
+            conn.unregister("_rollup_source")
+            conn.unregister("_rollup_region_map")
+        return True
+
+    @staticmethod
+    def _has_cube(conn) -> bool:
+        try:
+            conn.execute(f"SELECT 1 FROM {CUBE_TABLE} LIMIT 0")
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _cube_rows(conn) -> int:
+        return int(conn.execute(f"SELECT count(*) FROM {CUBE_TABLE}").fetchone()[0])
+
+    # ── Query ─────────────────────────────────────────────────────────────────
+
+    def rollup(
+        self,
+        by: Sequence[str] = ("year",),
+        company: Optional[str] = None,
+        region: Optional[Union[str, Sequence[str]]] = None,
+        country: Optional[Union[str, Sequence[str]]] = None,
+        equipment_type: Optional[Union[str, Sequence[str]]] = None,
+        include_undated: bool = False,
+    ) -> pd.DataFrame:
+        """
+        Aggregate the cube along *by* (any of DIMENSIONS) with optional filters.
+
+        A filter is a single value or a sequence of accepted values; None and
+        "All" do not filter.  Columns: *by*, projects, pipeline_value,
+        won_value, n_won, win_rate (%).  Projects without a date are excluded
+        unless *include_undated*.
+        """
+        by = list(by)
+        unknown = set(by) - set(DIMENSIONS)
+        if unknown:
+            raise ValueError(f"Unknown rollup dimension(s) {sorted(unknown)}; use {DIMENSIONS}")
+
+        where, params = [], []
+        for dim, value in (("company", company), ("region", region),
+                           ("country", country), ("equipment_type", equipment_type)):
+            if value is None or value == "All":
+                continue
+            if isinstance(value, str):
+                where.append(f"{dim} = ?")
+                params.append(value)
+            else:
+                values = list(value)
+                where.append(f"{dim} IN ({', '.join('?' * len(values))})" if values else "false")
+                params.extend(values)
+        if not include_undated:
+            where.append("year IS NOT NULL")
+
+        dims = ", ".join(by)
+        sql = f"""
+            SELECT {dims + "," if dims else ""}
+                   sum(projects)::BIGINT AS projects,
+                   sum(pipeline_value)   AS pipeline_value,
+                   sum(won_value)        AS won_value,
+                   sum(n_won)::BIGINT    AS n_won,
+                   round(100.0 * sum(n_won) / greatest(sum(projects), 1), 1) AS win_rate
+            FROM {CUBE_TABLE}
+            {"WHERE " + " AND ".join(where) if where else ""}
+            {"GROUP BY " + dims + " ORDER BY " + dims if dims else ""}
+        """
+        conn = self._conn()
+        if not self._has_cube(conn):
+            return pd.DataFrame(columns=by + ["projects", "pipeline_value", "won_value", "n_won", "win_rate"])
+        return conn.execute(sql, params).df()
+
+    def company_yearly(self, company: str) -> pd.DataFrame:
+        """Yearly pipeline / won value / win rate of one CRM account (exact name)."""
+        return self.rollup(by=("year",), company=company)
+
+
+portfolio_service = PortfolioRollupService()
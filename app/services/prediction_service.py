@@ -3,9 +3,47 @@ Prediction service for sales hit rate forecasting
 """
 import pandas as pd
 import numpy as np
-from typing import Dict, Tuple
+from typing import Dict, Optional, Sequence, Tuple
 from pathlib import Path
 
+CURRENT_YEAR = 2026
+CRITICAL_EQUIPMENT_TYPES = ['furnace', 'blast', 'arc', 'casting', 'rolling']
+RATING_MAP = {'A': 5, 'B': 4, 'C': 3, 'D': 2, 'E': 1}
+DEFAULT_INSTALL_YEAR = 2020   # no installation_year / year given
+UNPARSEABLE_YEAR_AGE = 5      # a year is given but is not a number
+
+
+def heuristic_equipment_scores(features: pd.DataFrame) -> np.ndarray:
+    """
+    Vectorised equipment hit-rate heuristic (0-100), one score per row.
+
+    The single source of the equipment rules: PredictionService's single and
+    batch equipment predictions and MLRankingService's fallback all use it.
+    *features* needs the columns equipment_age, is_critical,
+    is_sms_equipment, months_since_maintenance and customer_rating.
+    Also used by MLRankingService when no trained model is available.
+    """
+    age = features['equipment_age'].to_numpy(dtype=float)
+    maint = features['months_since_maintenance'].to_numpy(dtype=float)
+    score = (
+        40.0
+        + np.select([age > 20, age > 15, age > 10, age < 5], [35, 25, 15, -10], 0)
+        + features['is_critical'].to_numpy(dtype=bool) * 10
+        + features['is_sms_equipment'].to_numpy(dtype=bool) * 10
+        + np.select([maint > 24, maint > 12], [10, 5], 0)
+        + (features['customer_rating'].to_numpy(dtype=float) - 3) * 5
+    )
+    return np.round(np.clip(score, 0, 100), 1)
+
+
+def _coalesce(df: pd.DataFrame, columns: Sequence[str], default) -> pd.Series:
+    """First non-null value across *columns* (dict.get alias chain), else *default*."""
+    out = pd.Series(np.nan, index=df.index, dtype=object)
+    for col in columns:
+        if col in df.columns:
+            out = out.where(out.notna(), df[col])
+    return out.where(out.notna(), default) if default is not None else out
+
 
 class PredictionService:
     """Service for predicting sales hit rates"""
@@ -29,12 +67,31 @@ class PredictionService:
         Returns:
             Tuple of (probability_score, key_drivers)
         """
-        features = self._extract_equipment_features(equipment_data, customer_data)
-        score = self._heuristic_equipment_prediction(features)
-        drivers = self._identify_equipment_drivers(features, score)
+        # One-row batch, so single and batch predictions share every rule
+        frame = self._equipment_feature_frame(pd.DataFrame([equipment_data]), customer_data)
+        score = float(heuristic_equipment_scores(frame)[0])
+        drivers = self._identify_equipment_drivers(frame.iloc[0].to_dict(), score)
         
         return score, drivers
     
+    def predict_equipment_hit_rates(
+        self,
+        equipment_df: pd.DataFrame,
+        customer_data: Optional[Dict] = None,
+    ) -> np.ndarray:
+        """
+        Batch version of predict_equipment_hit_rate: one score per row.
+
+        Columns follow the equipment dict keys (installation_year / year,
+        equipment / equipment_type, oem / manufacturer, last_maintenance /
+        last_service); *customer_data* supplies one rating for all rows.
+        """
+        if equipment_df.empty:
+            return np.zeros(0)
+        return heuristic_equipment_scores(
+            self._equipment_feature_frame(equipment_df, customer_data)
+        )
+
     def predict_hit_rate(self, customer_data: Dict) -> Tuple[float, Dict]:
         """
         Predict sales hit rate for a customer (aggregated across equipment)
@@ -47,13 +104,13 @@ class PredictionService:
         """
         # If customer has installed base, calculate per-equipment and aggregate
         if 'installed_base' in customer_data and customer_data['installed_base']:
-            equipment_scores = []
-            for equipment in customer_data['installed_base']:
-                score, _ = self.predict_equipment_hit_rate(equipment, customer_data.get('crm', {}))
-                equipment_scores.append(score)
+            equipment_scores = self.predict_equipment_hit_rates(
+                pd.DataFrame(list(customer_data['installed_base'])),
+                customer_data.get('crm', {}),
+            )
             
             # Average score across all equipment
-            avg_score = sum(equipment_scores) / len(equipment_scores) if equipment_scores else 50.0
+            avg_score = float(equipment_scores.mean()) if len(equipment_scores) else 50.0
             
             # Get drivers based on aggregated features
             features = self._extract_features(customer_data)
@@ -111,12 +168,15 @@ class PredictionService:
         if installed:
             ages = []
             for item in installed:
-                year = item.get('installation_year', item.get('year', 2020))
-                if pd.notna(year):
-                    try:
-                        ages.append(2026 - int(float(year)))
-                    except:
-                        pass
+                year = item.get('installation_year')
+                if year is None or pd.isna(year):
+                    year = item.get('year')
+                if year is None or pd.isna(year):
+                    year = DEFAULT_INSTALL_YEAR
+                try:
+                    ages.append(CURRENT_YEAR - int(float(year)))
+                except (ValueError, TypeError):
+                    pass
             features['installed_base_age'] = float(np.mean(ages)) if ages else 5.0
         else:
             features['installed_base_age'] = 0.0
@@ -135,8 +195,7 @@ class PredictionService:
         
         # CRM rating
         rating = str(crm.get('rating', crm.get('crm_rating', 'C')) or 'C')
-        rating_map = {'A': 5, 'B': 4, 'C': 3, 'D': 2, 'E': 1}
-        features['crm_rating'] = rating_map.get(rating, 3)
+        features['crm_rating'] = RATING_MAP.get(rating, 3)
         
         return features
     
@@ -220,92 +279,38 @@ class PredictionService:
         
         return drivers
     
-    def _extract_equipment_features(self, equipment_data: Dict, customer_data: Dict = None) -> Dict:
-        """Extract features from equipment/installation data"""
-        features = {}
-        
-        # Equipment age
-        year = equipment_data.get('installation_year', equipment_data.get('year', 2020))
-        if pd.notna(year):
-            try:
-                features['equipment_age'] = 2026 - int(float(year))
-            except (ValueError, TypeError):
-                features['equipment_age'] = 5
-        else:
-            features['equipment_age'] = 5
-        
-        # Equipment type/criticality
-        equipment_type = str(equipment_data.get('equipment', equipment_data.get('equipment_type', ''))).lower()
-        
-        # Critical equipment types that are more likely to need modernization
-        critical_types = ['furnace', 'blast', 'arc', 'casting', 'rolling']
-        features['is_critical'] = any(ct in equipment_type for ct in critical_types)
-        
-        # OEM (SMS equipment gets higher score)
-        oem = str(equipment_data.get('oem', equipment_data.get('manufacturer', ''))).lower()
-        features['is_sms_equipment'] = 'sms' in oem
-        
-        # Last maintenance
-        last_maint = equipment_data.get('last_maintenance', equipment_data.get('last_service', ''))
-        if last_maint:
-            try:
-                from datetime import datetime
-                maint_date = pd.to_datetime(last_maint)
-                days_since = (datetime.now() - maint_date).days
-                features['months_since_maintenance'] = days_since / 30
-            except:
-                features['months_since_maintenance'] = 12
-        else:
-            features['months_since_maintenance'] = 12
-        
-        # Customer context (if available)
+    def _equipment_feature_frame(self, equipment_df: pd.DataFrame, customer_data: Dict = None) -> pd.DataFrame:
+        """
+        Equipment features for heuristic_equipment_scores, one row per equipment row.
+
+        Year: first non-null of installation_year / year, else
+        DEFAULT_INSTALL_YEAR; a non-numeric year gives UNPARSEABLE_YEAR_AGE.
+        """
+        df = equipment_df
+        years = pd.to_numeric(_coalesce(df, ['installation_year', 'year'], DEFAULT_INSTALL_YEAR), errors='coerce')
+        age = (CURRENT_YEAR - np.trunc(years)).fillna(UNPARSEABLE_YEAR_AGE)
+
+        eq_type = _coalesce(df, ['equipment', 'equipment_type'], '').astype(str).str.lower()
+        oem = _coalesce(df, ['oem', 'manufacturer'], '').astype(str).str.lower()
+
+        last_maint = _coalesce(df, ['last_maintenance', 'last_service'], None)
+        # tz-aware and naive dates may mix: parse as UTC, then compare naive
+        maint_date = pd.to_datetime(last_maint.where(last_maint != ''), errors='coerce',
+                                    format='mixed', utc=True).dt.tz_convert(None)
+        months = ((pd.Timestamp.now() - maint_date).dt.days / 30).fillna(12)
+
+        rating = 3
         if customer_data:
-            rating = customer_data.get('rating', customer_data.get('crm_rating', 'C'))
-            rating_map = {'A': 5, 'B': 4, 'C': 3, 'D': 2, 'E': 1}
-            features['customer_rating'] = rating_map.get(rating, 3)
-        else:
-            features['customer_rating'] = 3
-        
-        return features
-    
-    def _heuristic_equipment_prediction(self, features: Dict) -> float:
-        """Predict hit rate for specific equipment"""
-        score = 40.0  # Base score (lower than customer-level)
-        
-        # Equipment age is the primary driver
-        age = features['equipment_age']
-        if age > 20:
-            score += 35
-        elif age > 15:
-            score += 25
-        elif age > 10:
-            score += 15
-        elif age < 5:
-            score -= 10
-        
-        # Critical equipment types
-        if features['is_critical']:
-            score += 10
-        
-        # SMS equipment (existing relationship)
-        if features['is_sms_equipment']:
-            score += 10
-        
-        # Maintenance history
-        months_maint = features['months_since_maintenance']
-        if months_maint > 24:
-            score += 10
-        elif months_maint > 12:
-            score += 5
-        
-        # Customer rating
-        score += (features['customer_rating'] - 3) * 5
-        
-        # Normalize
-        score = max(0, min(100, score))
-        
-        return round(score, 1)
-    
+            rating = RATING_MAP.get(customer_data.get('rating', customer_data.get('crm_rating', 'C')), 3)
+
+        return pd.DataFrame({
+            'equipment_age':            age.astype(int),
+            'is_critical':              eq_type.str.contains('|'.join(CRITICAL_EQUIPMENT_TYPES), regex=True),
+            'is_sms_equipment':         oem.str.contains('sms', regex=False),
+            'months_since_maintenance': months,
+            'customer_rating':          rating,
+        }, index=df.index)
+
     def _identify_equipment_drivers(self, features: Dict, score: float) -> Dict:
         """Identify key drivers for equipment-level prediction"""
         drivers = {
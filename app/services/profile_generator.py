@@ -2,11 +2,34 @@
 AI Service for generating customer profiles (Steckbrief) using LLM
 """
 import json
+import logging
+from collections import Counter
+from datetime import datetime
 import numpy as np
-from typing import Dict, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 from openai import AzureOpenAI, OpenAI
 from app.core.config import settings
 
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_TOKEN_BUDGET = 6000   # tokens for the data context (the prompt template comes on top)
+MIN_SECTION_TOKENS   = 80     # below this a section is dropped rather than truncated
+CHARS_PER_TOKEN      = 4      # estimate when tiktoken is unavailable
+
+_IB_TYPE_KEYS     = ("equipment", "equipment_type")
+_IB_YEAR_KEYS     = ("installation_year", "start_year_internal", "start_year", "year")
+_IB_OEM_KEYS      = ("OEM", "oem", "supplier", "manufacturer")
+_IB_CAPACITY_KEYS = ("capacity_internal", "capacity")
+
+_encoder = None
+
+
 class NumpyEncoder(json.JSONEncoder):
     """Custom JSON encoder for NumPy types"""
     def default(self, obj):
@@ -14,14 +37,125 @@ class NumpyEncoder(json.JSONEncoder):
             return obj.tolist()
         if isinstance(obj, np.generic):
             return obj.item()
+        if hasattr(obj, "isoformat"):     # datetime / pandas Timestamp
+            return obj.isoformat()
         return super(NumpyEncoder, self).default(obj)
 
 
+def _tokenizer():
+    """gpt-4o tokenizer, or None if tiktoken (or its encoding files) is unavailable."""
+    global _encoder
+    if _encoder is None:
+        _encoder = False
+        if TIKTOKEN_AVAILABLE:
+            try:
+                _encoder = tiktoken.get_encoding("o200k_base")
+            except Exception as e:
+                logger.warning(f"tiktoken encoding unavailable, estimating tokens: {e}")
+    return _encoder or None
+
+
+def count_tokens(text: str) -> int:
+    """Token count of *text* (tiktoken if available, else ~4 characters per token)."""
+    enc = _tokenizer()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut *text* to at most *max_tokens* tokens, marking the cut."""
+    marker = "\n  … (truncated)"
+    keep = max(max_tokens - count_tokens(marker), 0)
+    enc = _tokenizer()
+    if enc is not None:
+        return enc.decode(enc.encode(text, disallowed_special=())[:keep]) + marker
+    return text[:keep * CHARS_PER_TOKEN] + marker
+
+
+def _is_blank(value) -> bool:
+    if value is None:
+        return True
+    if isinstance(value, float) and value != value:
+        return True
+    return isinstance(value, str) and value.strip().lower() in ("", "nan", "none", "n/a")
+
+
+def _compact_json(obj, max_str: Optional[int] = None) -> str:
+    """Whitespace-free JSON without empty / NaN fields; long strings cut to *max_str*."""
+    def _clean(o):
+        if isinstance(o, dict):
+            return {k: _clean(v) for k, v in o.items() if not _is_blank(v)}
+        if isinstance(o, (list, tuple)):
+            return [_clean(v) for v in o if not _is_blank(v)]
+        if max_str and isinstance(o, str) and len(o) > max_str:
+            return o[:max_str] + "…"
+        return o
+    return json.dumps(_clean(obj), separators=(",", ":"), ensure_ascii=False, cls=NumpyEncoder)
+
+
+def _first(record: Dict, keys) -> Optional[object]:
+    return next((record[k] for k in keys if k in record and not _is_blank(record[k])), None)
+
+
+def _installed_base_summary(records: List[Dict], max_types: Optional[int] = None, oldest: int = 5) -> str:
+    """
+    Installed base aggregated per equipment type (units, start-year range,
+    median age, total capacity, main OEMs) plus the *oldest* units, instead
+    of listing every record.
+    """
+    this_year = datetime.now().year
+    groups: Dict[str, Dict] = {}
+    dated = []
+    for rec in records:
+        eq_type = str(_first(rec, _IB_TYPE_KEYS) or "Unknown")
+        g = groups.setdefault(eq_type, {"n": 0, "years": [], "capacity": 0.0, "oems": Counter()})
+        g["n"] += 1
+        try:
+            year = int(float(_first(rec, _IB_YEAR_KEYS)))
+            g["years"].append(year)
+            dated.append((year, eq_type, rec))
+        except (TypeError, ValueError):
+            pass
+        try:
+            g["capacity"] += float(_first(rec, _IB_CAPACITY_KEYS) or 0)
+        except (TypeError, ValueError):
+            pass
+        oem = _first(rec, _IB_OEM_KEYS)
+        if oem is not None:
+            g["oems"][str(oem)] += 1
+
+    ordered = sorted(groups.items(), key=lambda kv: -kv[1]["n"])
+    shown = ordered[:max_types] if max_types else ordered
+    lines = [f"INSTALLED BASE:\n{len(records)} equipment units, {len(groups)} equipment types"]
+    for eq_type, g in shown:
+        parts = [f"{g['n']} units"]
+        if g["years"]:
+            years = sorted(g["years"])
+            parts.append(f"started {years[0]}-{years[-1]}, median age {this_year - years[len(years) // 2]} yrs")
+        if g["capacity"]:
+            parts.append(f"capacity {g['capacity']:,.0f}")
+        if g["oems"]:
+            parts.append("OEM " + ", ".join(f"{o} ({n})" for o, n in g["oems"].most_common(2)))
+        lines.append(f"  {eq_type}: " + "; ".join(parts))
+    if len(shown) < len(ordered):
+        rest = ordered[len(shown):]
+        lines.append(f"  … {len(rest)} more types ({sum(g['n'] for _, g in rest)} units)")
+    if oldest and dated:
+        lines.append("  Oldest units:")
+        for year, eq_type, rec in sorted(dated, key=lambda t: t[0])[:oldest]:
+            oem = _first(rec, _IB_OEM_KEYS)
+            lines.append(f"    {eq_type}, started {year}" + (f", OEM {oem}" if oem is not None else ""))
+    return "\n".join(lines)
+
+
 class ProfileGeneratorService:
     """Generate comprehensive customer profiles using AI"""
     
     def __init__(self):
         self.client = None
+        self.context_token_budget = CONTEXT_TOKEN_BUDGET
+        self.last_context_report: Optional[Dict] = None
         self._initialize_client()
     
     def _initialize_client(self):
@@ -66,6 +200,7 @@ class ProfileGeneratorService:
             Dictionary with structured profile fields
         """
         if not self.client:
+            self.last_context_report = None
             return self._generate_fallback_profile(customer_data)
 
         # Build context from available data
@@ -77,17 +212,7 @@ class ProfileGeneratorService:
         try:
             response = self.client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "You are an expert business analyst and metallurgical sales strategist "
-                            "at SMS group, creating comprehensive customer intelligence dossiers "
-                            "(Steckbriefe) for B2B sales teams. Use ALL provided data sources."
-                        ),
-                    },
-                    {"role": "user", "content": prompt},
-                ],
+                messages=self._profile_messages(prompt),
                 temperature=0.3,
                 response_format={"type": "json_object"},
             )
@@ -98,98 +223,225 @@ class ProfileGeneratorService:
         except Exception as e:
             print(f"Error generating profile: {e}")
             return self._generate_fallback_profile(customer_data)
+
+    def stream_profile(
+        self,
+        customer_data: Dict,
+        web_data: Optional[str] = None,
+        extra_context: Optional[Dict] = None,
+    ) -> Iterator[str]:
+        """
+        Streaming variant of `generate_profile`: yield the profile JSON text
+        chunk by chunk as the model produces it.
+
+        Yields nothing when no LLM client is configured; pass the joined
+        text to `parse_profile` to get the profile dict.
+        """
+        if not self.client:
+            self.last_context_report = None
+            return
+        context = self._build_context(customer_data, web_data, extra_context or {})
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=self._profile_messages(self._create_profile_prompt(context)),
+            temperature=0.3,
+            response_format={"type": "json_object"},
+            stream=True,
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    def parse_profile(self, text: str, customer_data: Dict) -> Dict:
+        """Profile dict from streamed JSON text (fallback profile if empty or invalid)."""
+        if text:
+            try:
+                return json.loads(text)
+            except json.JSONDecodeError as e:
+                print(f"Error parsing streamed profile: {e}")
+        return self._generate_fallback_profile(customer_data)
+
+    @staticmethod
+    def _profile_messages(prompt: str) -> List[Dict]:
+        return [
+            {
+                "role": "system",
+                "content": (
+                    "You are an expert business analyst and metallurgical sales strategist "
+                    "at SMS group, creating comprehensive customer intelligence dossiers "
+                    "(Steckbriefe) for B2B sales teams. Use ALL provided data sources."
+                ),
+            },
+            {"role": "user", "content": prompt},
+        ]
     
     def _build_context(
         self,
         customer_data: Dict,
         web_data: Optional[str],
         extra_context: Optional[Dict] = None,
+        budget: Optional[int] = None,
     ) -> str:
-        """Build comprehensive context string from all available data sources."""
-        context_parts = []
-        extra = extra_context or {}
+        """
+        Build the context string from all available data sources within a
+        token budget (default `self.context_token_budget`).
 
-        # ── Core internal data ────────────────────────────────────────────────
-        if 'crm' in customer_data:
-            context_parts.append("CRM DATA:\n" + json.dumps(customer_data['crm'], indent=2, cls=NumpyEncoder))
+        Sections are listed in priority order.  When the full text is over
+        budget, the lowest-priority sections are first compacted (fewer
+        headlines, top equipment types only, …), then truncated or dropped
+        from the bottom up.  The token count and what was cut are kept in
+        `self.last_context_report`.
+        """
+        budget = budget or self.context_token_budget
+        sections = self._context_sections(customer_data, web_data, extra_context or {})
+        full = {title: count_tokens(text) for title, text, _ in sections}
+        sep = count_tokens("\n\n")
+        report = {"tokens": 0, "budget": budget, "sections": {}, "compacted": [],
+                  "truncated": [], "dropped": [], "exact": _tokenizer() is not None}
 
-        if 'bcg' in customer_data:
-            context_parts.append("BCG MARKET DATA:\n" + json.dumps(customer_data['bcg'], indent=2, cls=NumpyEncoder))
+        # compact from the lowest priority up until the whole context fits
+        chosen = [[title, text, full[title]] for title, text, _ in sections]
+        total = sum(n + sep for _, _, n in chosen)
+        for i in range(len(sections) - 1, -1, -1):
+            if total <= budget:
+                break
+            title, _, compact = sections[i]
+            if compact is None:
+                continue
+            n = count_tokens(compact)
+            if n < chosen[i][2]:
+                total -= chosen[i][2] - n
+                chosen[i][1:] = [compact, n]
+                report["compacted"].append(title)
 
-        if 'installed_base' in customer_data:
-            ib = customer_data['installed_base']
-            context_parts.append(
-                f"INSTALLED BASE:\n{len(ib)} equipment records (sample of first 5 shown)\n"
-                + json.dumps(ib[:5], indent=2, cls=NumpyEncoder)
+        # then fill in priority order, truncating or dropping what still overflows
+        parts, remaining = [], budget
+        for title, text, n in chosen:
+            if n + sep <= remaining:
+                parts.append(text)
+            elif remaining - sep >= MIN_SECTION_TOKENS:
+                text = truncate_to_tokens(text, remaining - sep)
+                n = count_tokens(text)
+                parts.append(text)
+                report["truncated"].append(title)
+            else:
+                report["dropped"].append(title)
+                continue
+            report["sections"][title] = n
+            remaining -= n + sep
+
+        context = "\n\n".join(parts)
+        report["tokens"] = count_tokens(context)
+        self.last_context_report = report
+        if report["compacted"] or report["truncated"] or report["dropped"]:
+            logger.info(
+                f"Profile context: {report['tokens']}/{budget} tokens; compacted {report['compacted']}, "
+                f"truncated {report['truncated']}, dropped {report['dropped']}"
             )
+        return context
+
+    def _context_sections(
+        self,
+        customer_data: Dict,
+        web_data: Optional[str],
+        extra: Dict,
+    ) -> List[Tuple[str, str, Optional[str]]]:
+        """(title, full text, compact text or None) per available source, most important first."""
+        sections = []
+
+        # ── Core internal data ────────────────────────────────────────────────
+        if 'crm' in customer_data:
+            sections.append(("CRM DATA", "CRM DATA:\n" + _compact_json(customer_data['crm']),
+                             "CRM DATA:\n" + _compact_json(customer_data['crm'], max_str=120)))
 
         # ── Priority ranking ──────────────────────────────────────────────────
         if extra.get('priority_ranking'):
             pr = extra['priority_ranking']
-            context_parts.append(
-                "PRIORITY RANKING:\n"
-                + json.dumps(pr, indent=2, cls=NumpyEncoder)
-            )
-
-        # ── Financial details ─────────────────────────────────────────────────
-        if extra.get('financial_details'):
-            context_parts.append(
-                "FINANCIAL DETAILS:\n"
-                + json.dumps(extra['financial_details'], indent=2, cls=NumpyEncoder)
-            )
+            raw = pr.get('raw_data') or {}
+            by_type = sorted((raw.get('by_type') or {}).items(),
+                             key=lambda kv: -(kv[1] or {}).get('max_score', 0))
+            summary = {k: pr.get(k) for k in ('rank', 'total_customers', 'score')}
+            sections.append((
+                "PRIORITY RANKING",
+                "PRIORITY RANKING:\n" + _compact_json(pr),
+                "PRIORITY RANKING:\n" + _compact_json({**summary, 'top_equipment_types': dict(by_type[:3])}),
+            ))
 
         # ── CRM historical performance ────────────────────────────────────────
         if extra.get('crm_history'):
-            hist = extra['crm_history']
-            metrics = hist.get('metrics', {})
-            context_parts.append(
+            metrics = extra['crm_history'].get('metrics', {})
+            sections.append((
+                "CRM HISTORICAL PERFORMANCE",
                 f"CRM HISTORICAL PERFORMANCE:\n"
                 f"  Total Won Value: {metrics.get('total_won_value', 'N/A')} EUR\n"
                 f"  Total Projects: {metrics.get('n_projects', 'N/A')}\n"
                 f"  Win Rate: {metrics.get('win_rate', 'N/A')}%\n"
-                f"  Years of Data: {metrics.get('time_span', 'N/A')}"
-            )
+                f"  Years of Data: {metrics.get('time_span', 'N/A')}",
+                None,
+            ))
+
+        # ── Installed base, aggregated by equipment type ──────────────────────
+        if customer_data.get('installed_base'):
+            ib = customer_data['installed_base']
+            sections.append(("INSTALLED BASE", _installed_base_summary(ib),
+                             _installed_base_summary(ib, max_types=8, oldest=0)))
 
         # ── Installed base summary (Axel's IB) ────────────────────────────────
         if extra.get('ib_summary') and extra['ib_summary'].get('n_units', 0) > 0:
             ib_sum = extra['ib_summary']
-            context_parts.append(
-                f"IB LIST SUMMARY (Axel's data):\n"
-                f"  Equipment Units: {ib_sum.get('n_units', 0)}\n"
-                f"  Average Age: {ib_sum.get('avg_age', 'N/A')} years\n"
-                f"  Types: {', '.join(str(t) for t in ib_sum.get('equipment_types', []))}"
-            )
+            types = [str(t) for t in ib_sum.get('equipment_types', [])]
+
+            def _ib_list(max_types):
+                shown = ', '.join(types[:max_types])
+                more = f" (+{len(types) - max_types} more)" if len(types) > max_types else ""
+                return (f"IB LIST SUMMARY (Axel's data):\n"
+                        f"  Equipment Units: {ib_sum.get('n_units', 0)}\n"
+                        f"  Average Age: {ib_sum.get('avg_age', 'N/A')} years\n"
+                        f"  Types: {shown}{more}")
+            sections.append(("IB LIST SUMMARY", _ib_list(25), _ib_list(8)))
 
-        # ── Country intelligence ───────────────────────────────────────────────
+        if 'bcg' in customer_data:
+            sections.append(("BCG MARKET DATA", "BCG MARKET DATA:\n" + _compact_json(customer_data['bcg']),
+                             "BCG MARKET DATA:\n" + _compact_json(customer_data['bcg'], max_str=120)))
+
+        # ── Financial details ─────────────────────────────────────────────────
+        if extra.get('financial_details'):
+            sections.append(("FINANCIAL DETAILS",
+                             "FINANCIAL DETAILS:\n" + _compact_json(extra['financial_details']),
+                             "FINANCIAL DETAILS:\n" + _compact_json(extra['financial_details'], max_str=120)))
+
+        # ── Country intelligence (headlines only) ─────────────────────────────
         if extra.get('country_intelligence'):
             ci = extra['country_intelligence']
-            country = ci.get('country', 'Unknown')
-            # Summarise news headlines only (keep context short)
-            def _headlines(news_list, n=3):
-                return '; '.join(
-                    item.get('title', '') for item in (news_list or [])[:n]
-                ) or 'No recent news found'
-
-            context_parts.append(
-                f"COUNTRY INTELLIGENCE ({country}):\n"
-                f"  Steel industry news: {_headlines(ci.get('steel_news', []))}\n"
-                f"  Economic developments: {_headlines(ci.get('economic_developments', []))}\n"
-                f"  Tariffs/Trade: {_headlines(ci.get('tariffs_trade', []))}\n"
-                f"  Automotive trends: {_headlines(ci.get('automotive_trends', []))}\n"
-                f"  Other macro: {_headlines(ci.get('other_macro', []))}"
-            )
+
+            def _country(n):
+                def _headlines(news_list):
+                    return '; '.join(
+                        item.get('title', '') for item in (news_list or [])[:n]
+                    ) or 'No recent news found'
+                return (
+                    f"COUNTRY INTELLIGENCE ({ci.get('country', 'Unknown')}):\n"
+                    f"  Steel industry news: {_headlines(ci.get('steel_news', []))}\n"
+                    f"  Economic developments: {_headlines(ci.get('economic_developments', []))}\n"
+                    f"  Tariffs/Trade: {_headlines(ci.get('tariffs_trade', []))}\n"
+                    f"  Automotive trends: {_headlines(ci.get('automotive_trends', []))}\n"
+                    f"  Other macro: {_headlines(ci.get('other_macro', []))}"
+                )
+            sections.append(("COUNTRY INTELLIGENCE", _country(3), _country(1)))
 
         # ── Company news ──────────────────────────────────────────────────────
         if extra.get('company_news'):
             news = extra['company_news']
-            headlines = '; '.join(item.get('title', '') for item in news[:5])
-            context_parts.append(f"RECENT COMPANY NEWS:\n{headlines}")
+
+            def _news(n):
+                return "RECENT COMPANY NEWS:\n" + '; '.join(item.get('title', '') for item in news[:n])
+            sections.append(("RECENT COMPANY NEWS", _news(5), _news(2)))
 
         # ── Web research ──────────────────────────────────────────────────────
         if web_data:
-            context_parts.append(f"WEB RESEARCH:\n{web_data}")
+            sections.append(("WEB RESEARCH", f"WEB RESEARCH:\n{web_data}", None))
 
-        return "\n\n".join(context_parts)
+        return sections
 
 
     def _create_profile_prompt(self, context: str) -> str:
@@ -0,0 +1,231 @@
+"""
+app/services/profile_pipeline.py
+=================================
+Orchestrates "Generate Profile" on the customer page.
+
+Responsibilities
+----------------
+* Gather every independent context source of a Steckbrief — company
+  overview, company news, country intelligence, priority ranking,
+  financial details, CRM history, IB summary, LLM market intelligence —
+  concurrently under one deadline, reporting each stage as it finishes
+* Assemble the `extra_context` for ProfileGeneratorService
+* Stream the profile LLM response chunk by chunk to a UI callback and
+  record per-stage latency (including time to first content)
+
+Callbacks run in the caller's thread, so Streamlit elements can be
+updated from them.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STAGE_DEADLINE = 25.0   # seconds for all context stages together
+NEWS_LIMIT     = 5
+STREAM_REFRESH = 0.15   # minimum seconds between streamed UI updates
+
+STAGE_LABELS = {
+    "overview":             "Company overview",
+    "company_news":         "Company news",
+    "country_intelligence": "Country intelligence",
+    "priority_ranking":     "Priority ranking",
+    "financial_details":    "Financial details",
+    "crm_history":          "CRM history",
+    "ib_summary":           "Installed base summary",
+    "market_intelligence":  "Market intelligence",
+}
+
+# stages passed to ProfileGeneratorService as extra_context
+_EXTRA_CONTEXT_KEYS = ("priority_ranking", "financial_details", "crm_history",
+                       "ib_summary", "country_intelligence", "company_news")
+
+
+# Local-data stages share data_service's single DuckDB connection, which is
+# not safe for concurrent use; they are fast, so they run one at a time
+# (concurrently with the web / LLM stages)
+_LOCAL_DATA_LOCK = threading.Lock()
+
+
+def _local(fn: Callable) -> Callable:
+    def _run(*args):
+        with _LOCAL_DATA_LOCK:
+            return fn(*args)
+    return _run
+
+
+def _priority_ranking(customer: str) -> Optional[Dict]:
+    from app.services.ml_ranking_service import ml_ranking_service
+    entry = ml_ranking_service.get_company_ranking(customer)
+    if entry is None:
+        return None
+    return {
+        "rank": entry["rank"],
+        "total_customers": entry["total_companies"],
+        "score": entry["max_score"],
+        "raw_data": entry,
+    }
+
+
+def _financial_details(customer_data: Dict) -> Optional[Dict]:
+    from app.services import financial_service
+    return financial_service.get_financial_summary(customer_data)
+
+
+class ProfilePipeline:
+    """Concurrent context gathering + streamed profile generation."""
+
+    def __init__(self, max_workers: int = len(STAGE_LABELS)):
+        # Own pool: country intelligence fans out on the enrichment fetcher's
+        # pool, so stages must not run on that pool themselves
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="profile-stage")
+
+    def stages(self, customer_data: Dict, customer: str, company_name: str, country: str) -> Dict[str, Tuple[Callable, tuple]]:
+        """`{stage: (fn, args)}` for one customer."""
+        from app.services import market_intelligence_service, web_enrichment_service
+        from app.services.historical_service import get_ib_summary, get_yearly_performance
+
+        return {
+            "overview":             (web_enrichment_service.get_company_overview, (company_name,)),
+            "company_news":         (web_enrichment_service.get_recent_news, (company_name, NEWS_LIMIT)),
+            "country_intelligence": (web_enrichment_service.get_country_intelligence, (country,)),
+            "priority_ranking":     (_local(_priority_ranking), (customer,)),
+            "financial_details":    (_local(_financial_details), (customer_data,)),
+            "crm_history":          (_local(get_yearly_performance), (customer,)),
+            "ib_summary":           (_local(get_ib_summary), (customer,)),
+            # a minimal profile skeleton is enough for market intelligence
+            "market_intelligence":  (market_intelligence_service.generate_market_intelligence,
+                                     (customer_data, {"basic_data": {"name": company_name}})),
+        }
+
+    def gather(
+        self,
+        calls: Dict[str, Tuple[Callable, tuple]],
+        deadline: float = STAGE_DEADLINE,
+        on_stage: Optional[Callable[[str, Dict], None]] = None,
+    ) -> Tuple[Dict[str, Any], Dict[str, Dict]]:
+        """
+        Run the stage *calls* concurrently; return (results, report).
+
+        `report[stage]` is {"seconds": float, "status": "ok" | "failed" |
+        "timeout", "error": str | None}.  Failed and timed-out stages have
+        result None.  *on_stage(stage, report_entry)* is called as each stage
+        completes (and once per timed-out stage at the deadline).
+        """
+        start = time.monotonic()
+
+        def _timed(fn, args):
+            t0 = time.monotonic()
+            try:
+                return fn(*args), None, time.monotonic() - t0
+            except Exception as e:
+                return None, e, time.monotonic() - t0
+
+        futures = {self._pool.submit(_timed, fn, args): stage for stage, (fn, args) in calls.items()}
+        results: Dict[str, Any] = {}
+        report: Dict[str, Dict] = {}
+        pending = set(futures)
+        while pending:
+            remaining = deadline - (time.monotonic() - start)
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for fut in done:
+                stage = futures[fut]
+                value, error, seconds = fut.result()
+                results[stage] = value
+                report[stage] = {"seconds": seconds, "status": "failed" if error else "ok",
+                                 "error": str(error) if error else None}
+                if error:
+                    logger.warning(f"Profile stage '{stage}' failed: {error}")
+                if on_stage:
+                    on_stage(stage, report[stage])
+
+        for fut in pending:
+            fut.cancel()
+            stage = futures[fut]
+            results[stage] = None
+            report[stage] = {"seconds": deadline, "status": "timeout", "error": None}
+            logger.warning(f"Profile stage '{stage}' missed the {deadline:.0f}s deadline")
+            if on_stage:
+                on_stage(stage, report[stage])
+        return results, report
+
+    @staticmethod
+    def extra_context(results: Dict[str, Any]) -> Dict:
+        """The `extra_context` for ProfileGeneratorService from gathered results."""
+        return {key: results.get(key) for key in _EXTRA_CONTEXT_KEYS}
+
+    def generate(
+        self,
+        customer_data: Dict,
+        results: Dict[str, Any],
+        on_text: Optional[Callable[[str], None]] = None,
+    ) -> Tuple[Dict, Dict[str, Optional[float]]]:
+        """
+        Stream the profile for the gathered *results*; return (profile, timing).
+
+        *on_text(text_so_far)* is called at most every STREAM_REFRESH seconds
+        and once at the end.  timing = {"first_content": s or None, "total": s,
+        "context_tokens": prompt context size or None}.
+        Without an LLM the fallback profile is returned; if the stream
+        fails, the profile is generated once more without streaming.
+        """
+        from app.services.profile_generator import profile_generator
+
+        extra = self.extra_context(results)
+        start = time.monotonic()
+        first = None
+        parts = []
+        last_push = 0.0
+        try:
+            for chunk in profile_generator.stream_profile(customer_data, extra_context=extra):
+                now = time.monotonic()
+                if first is None:
+                    first = now - start
+                parts.append(chunk)
+                if on_text and now - last_push >= STREAM_REFRESH:
+                    on_text("".join(parts))
+                    last_push = now
+        except Exception as e:
+            logger.error(f"Profile streaming failed, generating without streaming: {e}")
+            profile = profile_generator.generate_profile(customer_data, extra_context=extra)
+            return profile, {"first_content": None, "total": time.monotonic() - start,
+                             "context_tokens": (profile_generator.last_context_report or {}).get("tokens")}
+        text = "".join(parts)
+        if on_text and text:
+            on_text(text)
+        profile = profile_generator.parse_profile(text, customer_data)
+        return profile, {"first_content": first, "total": time.monotonic() - start,
+                         "context_tokens": (profile_generator.last_context_report or {}).get("tokens")}
+
+    @staticmethod
+    def attach(profile: Dict, results: Dict[str, Any], report: Dict[str, Dict], timing: Dict) -> Dict:
+        """Attach the raw enrichment data and latency report to *profile*."""
+        if results.get("overview"):
+            profile["company_overview"] = results["overview"]
+        if results.get("company_news"):
+            profile["recent_news"] = results["company_news"]
+        if results.get("market_intelligence"):
+            profile["market_intelligence"] = results["market_intelligence"]
+        if results.get("country_intelligence"):
+            profile["_country_intelligence_raw"] = results["country_intelligence"]
+        if results.get("priority_ranking"):
+            profile["_priority_ranking_raw"] = results["priority_ranking"]
+        profile["_stage_latency"] = {
+            **{stage: round(r["seconds"], 2) for stage, r in report.items()},
+            "llm_first_content": None if timing["first_content"] is None else round(timing["first_content"], 2),
+            "llm_total": round(timing["total"], 2),
+        }
+        if timing.get("context_tokens") is not None:
+            profile["_context_tokens"] = timing["context_tokens"]
+        return profile
+
+
+profile_pipeline = ProfilePipeline()
@@ -0,0 +1,190 @@
+"""
+app/services/training_service.py
+=================================
+Runs `scripts/train.py` out of process for the Streamlit app.
+
+Responsibilities
+----------------
+* Launch one training job at a time in a child process, so feature
+  engineering and XGBoost never hold the Streamlit server's GIL
+* Stream the job's log lines back (bounded buffer) and derive progress
+  from the pipeline's "Step N/M" markers (M is 6 with --search)
+* Record the registry version the run produced and tell MLRankingService
+  to hot-swap to it when the job succeeds
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+import subprocess
+import sys
+import threading
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ROOT         = Path(__file__).resolve().parent.parent.parent
+TRAIN_SCRIPT = ROOT / "scripts" / "train.py"
+
+_STEP_RE    = re.compile(r"Step (\d+)/(\d+)\s+(.*)")
+_VERSION_RE = re.compile(r"Registered version (\S+)")
+
+
+class TrainingJob:
+    """State of one `scripts/train.py` run; updated by the reader thread."""
+
+    def __init__(self, cmd: List[str], max_lines: int = 2000):
+        self.cmd         = cmd
+        self.started_at  = datetime.now()
+        self.finished_at: Optional[datetime] = None
+        self.status      = "running"       # running | succeeded | failed | cancelled
+        self.returncode: Optional[int] = None
+        self.step        = 0
+        self.n_steps     = 5
+        self.step_label  = "Starting …"
+        self.version: Optional[str] = None  # registry version written by the run
+        self.lines: deque = deque(maxlen=max_lines)
+        self.process: Optional[subprocess.Popen] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status != "running"
+
+    @property
+    def progress(self) -> float:
+        """Fraction of pipeline steps started (1.0 once the job has finished)."""
+        if self.done:
+            return 1.0
+        return min(self.step / self.n_steps, 0.99) if self.n_steps else 0.0
+
+    def log_tail(self, n: int = 200) -> str:
+        return "\n".join(list(self.lines)[-n:])
+
+    def _consume(self, line: str) -> None:
+        line = line.rstrip("\n")
+        self.lines.append(line)
+        m = _STEP_RE.search(line)
+        if m:
+            self.step, self.n_steps = int(m.group(1)), int(m.group(2))
+            self.step_label = m.group(3).strip().rstrip("…").strip()
+        m = _VERSION_RE.search(line)
+        if m:
+            self.version = m.group(1)
+
+
+class TrainingJobRunner:
+    """
+    Starts and tracks out-of-process training runs.
+
+    The runner is a process-wide singleton shared by all Streamlit sessions;
+    starting a job while one is running raises RuntimeError.
+    """
+
+    def __init__(
+        self,
+        script: Path = TRAIN_SCRIPT,
+        on_success: Optional[Callable[[TrainingJob], None]] = None,
+    ):
+        self._script     = Path(script)
+        self._on_success = on_success
+        self._job: Optional[TrainingJob] = None
+        self._lock = threading.Lock()
+
+    @property
+    def job(self) -> Optional[TrainingJob]:
+        """The current or most recent job (None before the first run)."""
+        return self._job
+
+    def is_running(self) -> bool:
+        return self._job is not None and not self._job.done
+
+    def start(self, args: List[str]) -> TrainingJob:
+        """Launch `train.py *args` in a child process and return immediately."""
+        with self._lock:
+            if self.is_running():
+                raise RuntimeError("A training job is already running")
+            cmd = [sys.executable, "-u", str(self._script), *args]
+            job = TrainingJob(cmd)
+            env = {**os.environ, "PYTHONUNBUFFERED": "1"}
+            job.process = subprocess.Popen(
+                cmd,
+                cwd=str(ROOT),
+                env=env,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                encoding="utf-8",
+                errors="replace",
+                bufsize=1,
+            )
+            self._job = job
+        threading.Thread(target=self._follow, args=(job,), daemon=True,
+                         name="training-job-reader").start()
+        logger.info("Training job started: %s", " ".join(cmd))
+        return job
+
+    def start_from_csv(self, bcg_csv: Path, crm_csv: Optional[Path] = None) -> TrainingJob:
+        """Train from exported CSV files (avoids the DuckDB file lock)."""
+        args = ["--bcg-csv", str(bcg_csv)]
+        if crm_csv is not None and Path(crm_csv).exists():
+            args += ["--crm-csv", str(crm_csv)]
+        return self.start(args)
+
+    def cancel(self) -> None:
+        job = self._job
+        if job is not None and not job.done and job.process is not None:
+            job.status = "cancelled"
+            job.process.terminate()
+
+    def _follow(self, job: TrainingJob) -> None:
+        """Reader thread: collect output, then finalise the job."""
+        proc = job.process
+        for line in proc.stdout:
+            job._consume(line)
+        job.returncode = proc.wait()
+        status = job.status
+        if status != "cancelled":
+            status = "succeeded" if job.returncode == 0 else "failed"
+
+        # reload before publishing the final status, so "succeeded" means
+        # the new model is already being served
+        if status == "succeeded" and self._on_success is not None:
+            job.step_label = "Loading new model"
+            try:
+                self._on_success(job)
+            except Exception as e:
+                logger.warning("Post-training reload failed: %s", e)
+        job.finished_at = datetime.now()
+        job.status      = status
+        logger.info("Training job %s (exit code %s)", status, job.returncode)
+
+    def status(self) -> Dict:
+        """Snapshot of the current job for the UI ({} before the first run)."""
+        job = self._job
+        if job is None:
+            return {}
+        end = job.finished_at or datetime.now()
+        return {
+            "status":     job.status,
+            "progress":   job.progress,
+            "step":       job.step,
+            "n_steps":    job.n_steps,
+            "step_label": job.step_label,
+            "version":    job.version,
+            "returncode": job.returncode,
+            "elapsed_s":  round((end - job.started_at).total_seconds(), 1),
+        }
+
+
+def _reload_ranking_model(job: TrainingJob) -> None:
+    """Hot-swap the app's ranking service to the newly registered model."""
+    from app.services.ml_ranking_service import ml_ranking_service
+    ml_ranking_service.refresh_model()
+
+
+training_service = TrainingJobRunner(on_success=_reload_ranking_model)
@@ -3,26 +3,121 @@ Web Enrichment Service - Fetch and enrich customer data from external sources
 All external data includes source URL for provenance tracking
 """
 import requests
-from bs4 import BeautifulSoup
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 import time
 from urllib.parse import urljoin, quote_plus
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from app.services.concurrent_fetch import ConcurrentFetcher
+from app.services.enrichment_cache import EnrichmentCache
+from app.services.feed_parsing import parse_infobox, parse_rss_items, parse_rss_items_soup
 
 logger = logging.getLogger(__name__)
 
+_COUNTRY_SECTIONS = ('steel_news', 'economic_developments', 'tariffs_trade', 'automotive_trends', 'other_macro')
+_OVERVIEW_FIELDS  = ('description', 'headquarters', 'founded', 'industry', 'employee_count', 'parent_company')
+
+
+class EnrichmentFetchError(RuntimeError):
+    """An external source could not be reached (as opposed to having no data)."""
+
+
+def _key_part(name: str) -> str:
+    """Cache-key form of a company / country name: whitespace-collapsed, case-folded."""
+    return " ".join(str(name).split()).casefold()
+
+
+def _overview_empty(overview: Dict) -> bool:
+    return not any(overview.get(field) for field in _OVERVIEW_FIELDS)
+
+
+def _country_intel_degraded(intel: Dict) -> bool:
+    return bool(intel.get("incomplete")) or not any(intel.get(section) for section in _COUNTRY_SECTIONS)
+
 
 class WebEnrichmentService:
     """Service for enriching customer data with external web sources"""
+
+    GOOGLE_NEWS_RSS = "https://news.google.com/rss/search"
+    WIKIPEDIA_API   = "https://en.wikipedia.org/w/api.php"
+    FETCH_DEADLINE  = 12.0   # seconds for a batch of concurrent news queries
+    NEGATIVE_TTL    = timedelta(minutes=10)   # lifetime of empty / incomplete results
     
-    def __init__(self):
+    def __init__(self, cache_path: Optional[Path] = None):
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         })
-        self.cache = {}
+        self.fetcher = ConcurrentFetcher(self.session)
+        if cache_path is None:
+            from app.core.config import settings
+            cache_path = settings.DATA_DIR / "enrichment_cache.sqlite"
+        # Persistent LRU cache; expired entries are served while a refresh runs
+        self.cache = EnrichmentCache(cache_path)
         self.cache_ttl = timedelta(hours=24)
+        self._refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="enrich-refresh")
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+
+    def _cached(self, key: str, ttl: timedelta, fetch, degraded=lambda value: not value):
+        """
+        Stale-while-revalidate lookup.
+
+        Fresh hit → cached value.  Expired hit → cached value now, plus one
+        background refresh per key.  Miss → fetch synchronously and store.
+
+        *fetch* raises EnrichmentFetchError when its source is unreachable;
+        that propagates on a miss and never replaces a cached value.  Results
+        for which *degraded(value)* holds (empty, or partly timed out) are
+        only kept for NEGATIVE_TTL and never overwrite a good stale value.
+        """
+        hit = self.cache.get(key)
+        if hit is not None:
+            value, age = hit
+            if degraded(value):
+                if age < self.NEGATIVE_TTL.total_seconds():
+                    return value
+                try:
+                    return self._store(key, fetch(), degraded)
+                except Exception as e:
+                    logger.warning(f"Retry of degraded entry {key} failed: {e}")
+                    return value
+            if age >= ttl.total_seconds():
+                self._revalidate(key, fetch, degraded)
+            return value
+        return self._store(key, fetch(), degraded)
+
+    def _store(self, key: str, value, degraded):
+        if degraded(value):
+            logger.info(f"Enrichment result for {key} is empty or incomplete; caching it briefly")
+        self.cache.set(key, value)
+        return value
+
+    def _revalidate(self, key: str, fetch, degraded) -> None:
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def _run():
+            try:
+                with self.fetcher.background():
+                    value = fetch()
+                if degraded(value):
+                    logger.warning(f"Background refresh of {key} returned no data; keeping cached value")
+                else:
+                    self.cache.set(key, value)
+            except Exception as e:
+                logger.warning(f"Background refresh failed for {key}, keeping cached value: {e}")
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(key)
+
+        self._refresh_pool.submit(_run)
     
     def get_company_overview(self, company_name: str) -> Dict[str, any]:
         """
@@ -39,12 +134,11 @@ class WebEnrichmentService:
                 'last_updated': datetime
             }
         """
-        cache_key = f"overview_{company_name}"
-        if cache_key in self.cache:
-            cached_data, timestamp = self.cache[cache_key]
-            if datetime.now() - timestamp < self.cache_ttl:
-                return cached_data
-        
+        return self._cached(f"overview_{_key_part(company_name)}", self.cache_ttl,
+                            lambda: self._fetch_overview(company_name),
+                            degraded=_overview_empty)
+
+    def _fetch_overview(self, company_name: str) -> Dict[str, any]:
         overview = {
             'description': None,
             'source_url': None,
@@ -55,16 +149,11 @@ class WebEnrichmentService:
             'last_updated': datetime.now()
         }
         
-        try:
-            # Try Wikipedia first (free, reliable for large companies)
-            wiki_data = self._get_wikipedia_data(company_name)
-            if wiki_data:
-                overview.update(wiki_data)
-        except Exception as e:
-            logger.warning(f"Wikipedia lookup failed for {company_name}: {e}")
+        # Wikipedia (free, reliable for large companies); fetch errors propagate
+        wiki_data = self._get_wikipedia_data(company_name)
+        if wiki_data:
+            overview.update(wiki_data)
         
-        # Cache the result
-        self.cache[cache_key] = (overview, datetime.now())
         return overview
     
     def get_recent_news(self, company_name: str, limit: int = 10) -> List[Dict[str, str]]:
@@ -83,23 +172,13 @@ class WebEnrichmentService:
                 ...
             ]
         """
-        cache_key = f"news_{company_name}_{limit}"
-        if cache_key in self.cache:
-            cached_data, timestamp = self.cache[cache_key]
-            if datetime.now() - timestamp < timedelta(hours=1):  # News cache: 1 hour
-                return cached_data
-        
-        news_items = []
-        
-        try:
-            # Use Google News RSS (free, no API key needed)
-            news_items = self._get_google_news(company_name, limit)
-        except Exception as e:
-            logger.warning(f"News lookup failed for {company_name}: {e}")
-        
-        # Cache the result
-        self.cache[cache_key] = (news_items, datetime.now())
-        return news_items
+        # News cache: 1 hour
+        return self._cached(f"news_{_key_part(company_name)}_{limit}", timedelta(hours=1),
+                            lambda: self._fetch_recent_news(company_name, limit))
+
+    def _fetch_recent_news(self, company_name: str, limit: int) -> List[Dict[str, str]]:
+        # Google News RSS (free, no API key needed); fetch errors propagate
+        return self._get_google_news(company_name, limit)
     
     def get_ownership_info(self, company_name: str) -> Dict[str, any]:
         """
@@ -165,137 +244,99 @@ class WebEnrichmentService:
     # Private helper methods
     
     def _get_wikipedia_data(self, company_name: str) -> Optional[Dict]:
-        """Extract company data from Wikipedia"""
+        """
+        Extract company data from Wikipedia.
+
+        Returns None when Wikipedia has no matching article; raises
+        EnrichmentFetchError when the API cannot be reached.
+        """
+        # Wikipedia API for search
+        search_url = self.WIKIPEDIA_API
+        search_params = {
+            'action': 'opensearch',
+            'search': company_name,
+            'limit': 1,
+            'format': 'json'
+        }
+        
+        search_results = self._get_json(search_url, search_params, f"Wikipedia search for {company_name}")
+        if not search_results[1]:  # No results
+            return None
+        
+        page_title = search_results[1][0]
+        page_url = search_results[3][0]
+        
+        # Lead section only: the infobox and first paragraph live there
+        content_params = {
+            'action': 'parse',
+            'page': page_title,
+            'format': 'json',
+            'prop': 'text',
+            'section': 0,
+        }
+        
+        page_data = self._get_json(search_url, content_params, f"Wikipedia page {page_title}")
+        html_content = page_data.get('parse', {}).get('text', {}).get('*', '')
+        
+        if not html_content:
+            return None
+        
+        result = {
+            'source_url': page_url,
+            'description': None,
+            'headquarters': None,
+            'founded': None,
+            'industry': None,
+            'employee_count': None,
+            'parent_company': None
+        }
         try:
-            # Wikipedia API for search
-            search_url = f"https://en.wikipedia.org/w/api.php"
-            search_params = {
-                'action': 'opensearch',
-                'search': company_name,
-                'limit': 1,
-                'format': 'json'
-            }
-            
-            response = self.session.get(search_url, params=search_params, timeout=5)
-            if response.status_code != 200:
-                return None
-            
-            search_results = response.json()
-            if not search_results[1]:  # No results
-                return None
-            
-            page_title = search_results[1][0]
-            page_url = search_results[3][0]
-            
-            # Get page content
-            content_params = {
-                'action': 'parse',
-                'page': page_title,
-                'format': 'json',
-                'prop': 'text'
-            }
-            
-            content_response = self.session.get(search_url, params=content_params, timeout=5)
-            if content_response.status_code != 200:
-                return None
-            
-            page_data = content_response.json()
-            html_content = page_data.get('parse', {}).get('text', {}).get('*', '')
-            
-            if not html_content:
-                return None
-            
-            # Parse the infobox
-            soup = BeautifulSoup(html_content, 'html.parser')
-            infobox = soup.find('table', {'class': 'infobox'})
-            
-            result = {
-                'source_url': page_url,
-                'description': None,
-                'headquarters': None,
-                'founded': None,
-                'industry': None,
-                'employee_count': None,
-                'parent_company': None
-            }
-            
-            if infobox:
-                # Extract first paragraph as description
-                first_para = soup.find('p', recursive=False)
-                if first_para:
-                    result['description'] = first_para.get_text().strip()
-                
-                # Parse infobox rows
-                for row in infobox.find_all('tr'):
-                    header = row.find('th')
-                    data = row.find('td')
-                    
-                    if not header or not data:
-                        continue
-                    
-                    header_text = header.get_text().strip().lower()
-                    data_text = data.get_text().strip()
-                    
-                    if 'headquarter' in header_text:
-                        result['headquarters'] = data_text
-                    elif 'founded' in header_text:
-                        result['founded'] = data_text
-                    elif 'industry' in header_text or 'industries' in header_text:
-                        result['industry'] = data_text
-                    elif 'employee' in header_text:
-                        result['employee_count'] = data_text
-                    elif 'parent' in header_text:
-                        result['parent_company'] = data_text
-            
-            return result
-            
+            infobox = parse_infobox(html_content)
         except Exception as e:
-            logger.error(f"Wikipedia extraction error for {company_name}: {e}")
-            return None
+            logger.warning(f"Wikipedia infobox parse failed for {page_title}: {e}")
+            infobox = None
+        if infobox:
+            result.update(infobox)
+        
+        return result
+
+    def _get_json(self, url: str, params: Dict, what: str):
+        try:
+            response = self.fetcher.get(url, params=params, timeout=5)
+        except requests.RequestException as e:
+            raise EnrichmentFetchError(f"{what} failed: {e}") from e
+        if response.status_code != 200:
+            raise EnrichmentFetchError(f"{what} returned HTTP {response.status_code}")
+        try:
+            return response.json()
+        except ValueError as e:
+            raise EnrichmentFetchError(f"{what} returned invalid JSON") from e
     
     def _get_google_news(self, company_name: str, limit: int = 10) -> List[Dict]:
-        """Get news from Google News RSS"""
-        news_items = []
+        """
+        Get news from Google News RSS.
+
+        An empty list means the feed had no items; raises
+        EnrichmentFetchError when the feed cannot be fetched.
+        """
+        # Google News RSS feed
+        query = quote_plus(company_name)
+        rss_url = f"{self.GOOGLE_NEWS_RSS}?q={query}&hl=en-US&gl=US&ceid=US:en"
         
         try:
-            # Google News RSS feed
-            query = quote_plus(company_name)
-            rss_url = f"https://news.google.com/rss/search?q={query}&hl=en-US&gl=US&ceid=US:en"
-            
-            response = self.session.get(rss_url, timeout=10)
-            if response.status_code != 200:
-                return news_items
-            
-            soup = BeautifulSoup(response.content, 'xml')
-            items = soup.find_all('item', limit=limit)
-            
-            for item in items:
-                title = item.find('title')
-                link = item.find('link')
-                pub_date = item.find('pubDate')
-                description = item.find('description')
-                source = item.find('source')
-                
-                desc_text = ''
-                if description and description.text:
-                    try:
-                        soup_desc = BeautifulSoup(description.text, 'html.parser')
-                        desc_text = soup_desc.get_text(separator=' ', strip=True)
-                    except:
-                        desc_text = description.text
-                
-                news_items.append({
-                    'title': title.text if title else 'No title',
-                    'description': desc_text,
-                    'url': link.text if link else '',
-                    'published_date': pub_date.text if pub_date else '',
-                    'source': source.text if source else 'Google News'
-                })
-            
-        except Exception as e:
-            logger.error(f"Google News fetch error for {company_name}: {e}")
+            response = self.fetcher.get(rss_url, timeout=10)
+        except requests.RequestException as e:
+            raise EnrichmentFetchError(f"Google News fetch for {company_name} failed: {e}") from e
+        if response.status_code != 200:
+            raise EnrichmentFetchError(
+                f"Google News fetch for {company_name} returned HTTP {response.status_code}"
+            )
         
-        return news_items
+        try:
+            return parse_rss_items(response.content, limit=limit)
+        except Exception as e:
+            logger.debug(f"lxml RSS parse failed for {company_name}, using soup: {e}")
+            return parse_rss_items_soup(response.content, limit=limit)
     
     def get_country_intelligence(self, country: str) -> dict:
         """
@@ -308,43 +349,39 @@ class WebEnrichmentService:
             automotive_trends   – list of automotive industry news items
             other_macro         – list of other macro/sector news items
             summary_text        – short AI-friendly summary string
+            incomplete          – sections that failed or missed the fetch deadline
         """
         if not country or country.lower() == "all":
             country = "global"
 
-        cache_key = f"country_intel_{country}"
-        if cache_key in self.cache:
-            cached_data, timestamp = self.cache[cache_key]
-            if datetime.now() - timestamp < timedelta(hours=3):
-                return cached_data
-
-        def _fetch(query: str, limit: int = 5) -> List[Dict]:
-            try:
-                return self._get_google_news(query, limit)
-            except Exception as e:
-                logger.warning(f"Country intel news fetch failed for '{query}': {e}")
-                return []
+        return self._cached(f"country_intel_{_key_part(country)}", timedelta(hours=3),
+                            lambda: self._fetch_country_intelligence(country),
+                            degraded=_country_intel_degraded)
 
+    def _fetch_country_intelligence(self, country: str) -> dict:
         base = country if country.lower() != "global" else ""
         prefix = f"{base} " if base else ""
 
-        steel_news          = _fetch(f"{prefix}steel industry market", 6)
-        economic_news       = _fetch(f"{prefix}economy GDP industrial output", 4)
-        tariffs_trade_news  = _fetch(f"{prefix}steel tariffs trade policy", 4)
-        automotive_news     = _fetch(f"{prefix}automotive steel demand", 4)
-        other_macro_news    = _fetch(f"{prefix}infrastructure investment manufacturing", 4)
+        # All five feeds are fetched concurrently under one deadline
+        failed = object()
+        news = self.fetcher.run({
+            "steel_news":            (self._get_google_news, (f"{prefix}steel industry market", 6)),
+            "economic_developments": (self._get_google_news, (f"{prefix}economy GDP industrial output", 4)),
+            "tariffs_trade":         (self._get_google_news, (f"{prefix}steel tariffs trade policy", 4)),
+            "automotive_trends":     (self._get_google_news, (f"{prefix}automotive steel demand", 4)),
+            "other_macro":           (self._get_google_news, (f"{prefix}infrastructure investment manufacturing", 4)),
+        }, deadline=self.FETCH_DEADLINE, default=failed)
 
+        incomplete = [key for key, items in news.items() if items is failed]
+        if len(incomplete) == len(news):
+            raise EnrichmentFetchError(f"No country news feed for {country or 'global'} could be fetched")
         result = {
             "country": country,
-            "steel_news": steel_news,
-            "economic_developments": economic_news,
-            "tariffs_trade": tariffs_trade_news,
-            "automotive_trends": automotive_news,
-            "other_macro": other_macro_news,
+            **{key: [] if items is failed else items for key, items in news.items()},
             "retrieved_at": datetime.now().isoformat(),
+            # sections that failed or missed the deadline; such results are cached only briefly
+            "incomplete": incomplete,
         }
-
-        self.cache[cache_key] = (result, datetime.now())
         return result
 
     def get_dashboard_news(self, company: str, country: str, region: str, limit: int = 15) -> List[Dict]:
@@ -364,12 +401,16 @@ class WebEnrichmentService:
             
         all_news = []
         seen_urls = set()
+
+        # Append 12 month time constraint; queries run concurrently
+        fetched = self.fetcher.run(
+            {q: (self._get_google_news, (f"{q} when:12m", limit)) for q in queries},
+            deadline=self.FETCH_DEADLINE,
+        )
         
         for q in queries:
             try:
-                # Append 12 month time constraint
-                rss_query = f"{q} when:12m"
-                items = self._get_google_news(rss_query, limit=limit)
+                items = fetched.get(q) or []
                 for item in items:
                     url = item.get('url')
                     if url and url not in seen_urls:
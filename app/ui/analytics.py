@@ -3,6 +3,7 @@ Analytics page - Visualizations and insights
 """
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from app.services import data_service, prediction_service
@@ -171,25 +172,19 @@ def render():
             geo_df = data_service.conn.execute(bcg_query).df()
             
             if not geo_df.empty and 'latitude' in geo_df.columns and 'longitude' in geo_df.columns:
-                # Calculate hit rates for equipment on the map
-                equipment_with_scores = []
-                
-                # Limit to 500 for better performance with map markers
-                for idx, row in geo_df.head(500).iterrows():
-                    equipment_data = row.to_dict()
-                    score, _ = prediction_service.predict_equipment_hit_rate(equipment_data, {})
-                    
-                    equipment_with_scores.append({
-                        'company': row.get('company', 'Unknown'),
-                        'equipment_type': row.get('equipment_type', 'Unknown'),
-                        'country': row.get('country', 'Unknown'),
-                        'latitude': float(row['latitude']),
-                        'longitude': float(row['longitude']),
-                        'hit_rate': float(score),
-                        'age': 2026 - int(row.get('start_year', 2020)) if pd.notna(row.get('start_year')) else 0
-                    })
-                
-                map_df = pd.DataFrame(equipment_with_scores)
+                # Score every mapped unit in one vectorised pass
+                years = pd.to_numeric(geo_df['start_year'], errors='coerce')
+                map_df = pd.DataFrame({
+                    'company': geo_df['company'].fillna('Unknown'),
+                    'equipment_type': geo_df['equipment_type'].fillna('Unknown'),
+                    'country': geo_df['country'].fillna('Unknown'),
+                    'latitude': geo_df['latitude'].astype(float),
+                    'longitude': geo_df['longitude'].astype(float),
+                    'hit_rate': prediction_service.predict_equipment_hit_rates(
+                        geo_df.rename(columns={'start_year': 'installation_year'}), {}
+                    ),
+                    'age': (2026 - np.trunc(years)).fillna(0).astype(int),
+                })
                 
                 # Create map with color-coded markers
                 fig = px.scatter_mapbox(
@@ -247,6 +242,11 @@ def render():
         
         st.markdown("---")
         
+        # Portfolio pipeline history from the CRM rollup cube
+        _render_pipeline_history(selected_region, selected_country, selected_company)
+
+        st.markdown("---")
+
         # Top opportunities table
         st.markdown("#### Top 20 Opportunities (Europe & Australia)")
         
@@ -275,3 +275,44 @@ def render():
     except Exception as e:
         st.error(f"Error generating analytics: {e}")
         st.exception(e)
+
+
+def _render_pipeline_history(region: str, country: str, company: str):
+    """Yearly CRM pipeline / won value and win rate for the active filters (from the rollup cube)."""
+    st.markdown("#### CRM Pipeline by Year")
+    try:
+        from app.services.portfolio_service import portfolio_service
+        # cube regions come from the CRM country; accept every alias of the filter region
+        regions = data_service.REGION_MAPPING.get(region, region) if region != "All" else None
+        yearly = portfolio_service.rollup(by=("year",), region=regions, country=country, company=company)
+    except Exception as e:
+        st.info(f"CRM pipeline history not available: {str(e)}")
+        return
+
+    if yearly.empty:
+        st.info("No dated CRM projects match the selected filters.")
+        return
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Projects", f"{int(yearly['projects'].sum()):,}")
+    with col2:
+        st.metric("Won Value", f"€{yearly['won_value'].sum() / 1e6:,.1f}M")
+    with col3:
+        st.metric("Win Rate", f"{100.0 * yearly['n_won'].sum() / max(yearly['projects'].sum(), 1):.1f}%")
+
+    chart_df = yearly.melt(id_vars=["year"], value_vars=["pipeline_value", "won_value"],
+                           var_name="Measure", value_name="Value (EUR)")
+    chart_df["Measure"] = chart_df["Measure"].map({"pipeline_value": "Pipeline", "won_value": "Won"})
+    fig = px.bar(
+        chart_df,
+        x="year",
+        y="Value (EUR)",
+        color="Measure",
+        barmode="group",
+        title="Pipeline and Won Value per Year",
+        labels={"year": "Year"},
+        color_discrete_sequence=["#667eea", "#28a745"],
+        hover_data={"Value (EUR)": ":,.0f"},
+    )
+    st.plotly_chart(fig, width="stretch")
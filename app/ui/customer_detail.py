@@ -32,6 +32,7 @@ from app.services import (
     enhanced_export_service,
     visualization_service,
 )
+from app.services.profile_pipeline import STAGE_LABELS, profile_pipeline
 from app.services.historical_service import (
     get_yearly_performance,
     get_ib_summary,
@@ -148,119 +149,44 @@ def render_profile_tab(selected_customer: str, customer_data: dict):
 
         with sub_col1:
             if st.button("Generate Profile", type="primary", use_container_width=True):
-                with st.spinner("Gathering all available intelligence and generating comprehensive profile..."):
-                    # ── 1. Company overview + news ────────────────────────────
-                    company_name = customer_data.get("crm", {}).get(
-                        "name", customer_data.get("crm", {}).get("customer_name", selected_customer)
-                    )
-                    try:
-                        overview = web_enrichment_service.get_company_overview(company_name)
-                    except Exception as e:
-                        overview = {}
-                        st.warning(f"Company overview not retrieved: {e}")
-
-                    try:
-                        # Depending on the method signature in web_enrichment_service
-                        company_news = web_enrichment_service.get_recent_news(company_name, limit=5)
-                    except Exception as e2:
-                        company_news = []
-                        st.warning(f"Company news not retrieved: {e2}")
-
-                    # ── 2. Country-level steel intelligence ───────────────────
-                    country = (
-                        customer_data.get("crm", {}).get("country")
-                        or st.session_state.filters.get("country", "")
-                        or ""
+                company_name = customer_data.get("crm", {}).get(
+                    "name", customer_data.get("crm", {}).get("customer_name", selected_customer)
+                )
+                country = (
+                    customer_data.get("crm", {}).get("country")
+                    or st.session_state.filters.get("country", "")
+                    or ""
+                )
+                # All context sources run concurrently; each is listed as it lands
+                with st.status("Gathering all available intelligence...", expanded=True) as status:
+                    def _on_stage(stage, report):
+                        label = STAGE_LABELS.get(stage, stage)
+                        if report["status"] == "ok":
+                            st.write(f"✓ {label} ({report['seconds']:.1f}s)")
+                        elif report["status"] == "timeout":
+                            st.write(f"⏱ {label} timed out — continuing without it")
+                        else:
+                            st.write(f"✗ {label} not available")
+
+                    results, stage_report = profile_pipeline.gather(
+                        profile_pipeline.stages(customer_data, selected_customer, company_name, country),
+                        on_stage=_on_stage,
                     )
-                    try:
-                        country_intel = web_enrichment_service.get_country_intelligence(country)
-                    except Exception as e:
-                        country_intel = {}
-                        st.warning(f"Country intelligence not retrieved: {e}")
-
-                    # ── 3. Priority ranking ────────────────────────────────────
-                    priority_ranking = None
-                    try:
-                        from app.services.ml_ranking_service import ml_ranking_service as _mls
-                        ranked = _mls.get_ranked_customers()
-                        if not ranked.empty:
-                            # Find this customer in the ranking
-                            name_col = "name" if "name" in ranked.columns else ranked.columns[0]
-                            match = ranked[
-                                ranked[name_col].astype(str).str.lower() == selected_customer.lower()
-                            ]
-                            if not match.empty:
-                                row = match.iloc[0]
-                                priority_ranking = {
-                                    "rank": int(match.index[0]) + 1,
-                                    "total_customers": len(ranked),
-                                    "score": float(row.get("score", row.get("ml_score", 0))),
-                                    "raw_data": row.to_dict(),
-                                }
-                    except Exception as e:
-                        st.info(f"Priority ranking data not available: {e}")
-
-                    # ── 4. Financial details ────────────────────────────────────
-                    financial_details = None
-                    try:
-                        from app.services import financial_service as _fs
-                        financial_details = _fs.get_financial_summary(customer_data)
-                    except Exception:
-                        pass
-
-                    # ── 5. CRM history (Axel's data) ─────────────────────────
-                    crm_history = None
-                    try:
-                        crm_history = get_yearly_performance(selected_customer)
-                    except Exception:
-                        pass
-
-                    # ── 6. Installed base summary ─────────────────────────────
-                    ib_data = None
-                    try:
-                        ib_data = get_ib_summary(selected_customer)
-                    except Exception:
-                        pass
-
-                    # ── 7. Market intelligence from LLM ──────────────────────
-                    try:
-                        # Build a minimal profile skeleton so market_intel can run
-                        _tmp_profile = {"basic_data": {"name": company_name}}
-                        market_intel = market_intelligence_service.generate_market_intelligence(
-                            customer_data, _tmp_profile
-                        )
-                    except Exception as e:
-                        market_intel = {}
-                        st.warning(f"Market intelligence not generated: {e}")
-
-                    # ── 8. Generate the full profile ──────────────────────────
-                    extra_ctx = {
-                        "priority_ranking": priority_ranking,
-                        "financial_details": financial_details,
-                        "crm_history": crm_history,
-                        "ib_summary": ib_data,
-                        "country_intelligence": country_intel,
-                        "company_news": company_news,
-                    }
-                    profile = profile_generator.generate_profile(
-                        customer_data, extra_context=extra_ctx
+
+                    # Stream the Steckbrief as the model writes it
+                    status.update(label="Generating comprehensive profile...")
+                    stream_box = st.empty()
+                    profile, timing = profile_pipeline.generate(
+                        customer_data, results,
+                        on_text=lambda text: stream_box.code(text[-3000:], language="json"),
                     )
-                    # Attach enriched data to profile
-                    if overview:
-                        profile["company_overview"] = overview
-                    if company_news:
-                        profile["recent_news"] = company_news
-                    if market_intel:
-                        profile["market_intelligence"] = market_intel
-                    if country_intel:
-                        profile["_country_intelligence_raw"] = country_intel
-                    if priority_ranking:
-                        profile["_priority_ranking_raw"] = priority_ranking
-
-                    st.session_state[f"profile_{selected_customer}"] = profile
-                    st.session_state[f"enriched_{selected_customer}"] = True
-                    st.success("Comprehensive profile generated with all available intelligence!")
-                    st.rerun()
+                    profile_pipeline.attach(profile, results, stage_report, timing)
+                    status.update(label="Profile generated", state="complete")
+
+                st.session_state[f"profile_{selected_customer}"] = profile
+                st.session_state[f"enriched_{selected_customer}"] = True
+                st.success("Comprehensive profile generated with all available intelligence!")
+                st.rerun()
 
         if f"profile_{selected_customer}" in st.session_state:
             profile = st.session_state[f"profile_{selected_customer}"]
@@ -369,6 +295,19 @@ def render_profile_tab(selected_customer: str, customer_data: dict):
     if f"profile_{selected_customer}" in st.session_state:
         profile = st.session_state[f"profile_{selected_customer}"]
 
+        latency = profile.get("_stage_latency")
+        if latency:
+            slowest = max(((k, v) for k, v in latency.items() if not k.startswith("llm_")),
+                          key=lambda kv: kv[1], default=(None, 0))
+            first = latency.get("llm_first_content")
+            st.caption(
+                f"Context gathered in {slowest[1]:.1f}s"
+                + (f" (slowest: {STAGE_LABELS.get(slowest[0], slowest[0])})" if slowest[0] else "")
+                + (f" · first profile content after {first:.1f}s" if first is not None else "")
+                + f" · generation {latency.get('llm_total', 0):.1f}s"
+                + (f" · context {profile['_context_tokens']:,} tokens" if profile.get("_context_tokens") else "")
+            )
+
         # ── Basic Information ──────────────────────────────────────────────────
         st.markdown("##### Basic Information")
         basic_data = profile.get("basic_data", {})
@@ -751,12 +690,9 @@ def _show_raw_crm_search(company: str):
         key=f"hist_search_{company}",
     )
     if search_term and len(search_term) >= 3:
-        from app.services.historical_service import _load_crm
-        crm = _load_crm()
-        if not crm.empty:
-            col = "account_name" if "account_name" in crm.columns else crm.columns[0]
-            mask = crm[col].astype(str).str.contains(search_term, case=False, na=False)
-            results = crm[mask]
+        from app.services.historical_service import _load_crm, search_crm
+        if not _load_crm().empty:
+            results = search_crm(search_term)
             st.info(f"Found {len(results)} rows matching '{search_term}'")
             if not results.empty:
                 show_cols = [c for c in ["account_name", "codeword_sales", "customer_project",
@@ -1193,12 +1129,9 @@ def _ib_manual_search(company: str):
         key=f"ib_search_{company}",
     )
     if search_term and len(search_term) >= 3:
-        from app.services.historical_service import _load_ib
-        ib = _load_ib()
-        if not ib.empty:
-            col = "ib_customer" if "ib_customer" in ib.columns else ib.columns[0]
-            mask = ib[col].astype(str).str.contains(search_term, case=False, na=False)
-            results = ib[mask]
+        from app.services.historical_service import _load_ib, search_ib
+        if not _load_ib().empty:
+            results = search_ib(search_term)
             st.info(f"Found {len(results)} rows matching '{search_term}'")
             if not results.empty:
                 st.dataframe(results, use_container_width=True, height=300)
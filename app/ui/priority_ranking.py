@@ -5,7 +5,7 @@ Priority Ranking page — enhanced with:
   - Country + Company search filters (in addition to Equipment Type)
   - Ranking explanation: 5 reasons per ranked item (why high / low)
   - Business opportunity type (OEM replacement, Modernisation, Maintenance, New Build)
-  - Stale-model detection and retrain prompt
+  - Stale-model detection (NaN AUC, feature / score drift) and retrain prompt
   - Improved charts
 """
 
@@ -18,6 +18,9 @@ import plotly.express as px
 import plotly.graph_objects as go
 from pathlib import Path
 import sys
+import logging
+
+logger = logging.getLogger(__name__)
 
 ROOT = Path(__file__).resolve().parent.parent.parent
 sys.path.insert(0, str(ROOT))
@@ -104,6 +107,33 @@ def _explain_rank(row: pd.Series, score: float, source: str) -> list[str]:
     return reasons[:5]
 
 
+_FEATURE_LABELS = {
+    "equipment_age":      "Equipment age (yrs)",
+    "is_sms_oem":         "SMS Group is OEM",
+    "equipment_type_enc": "Equipment type",
+    "country_enc":        "Country",
+    "crm_rating_num":     "CRM rating (A=5 … E=1)",
+    "log_fte":            "Company size (log FTE)",
+    "crm_projects_count": "Past CRM projects",
+}
+
+
+def _explain_shap(driver: dict) -> str:
+    """Format one SHAP contribution {feature, value, shap} as a ranking reason."""
+    feature = driver["feature"]
+    label   = _FEATURE_LABELS.get(feature, feature)
+    value   = driver["value"]
+    impact  = driver["shap"]
+    if feature in ("equipment_type_enc", "country_enc"):
+        shown = ""                       # encoded category – raw code is meaningless
+    elif feature == "log_fte":
+        shown = f" = ~{int(round(np.expm1(value))):,} FTE"
+    else:
+        shown = f" = {value:.0f}"
+    arrow = "🔼 raises" if impact >= 0 else "🔽 lowers"
+    return f"**{label}{shown}** — {arrow} the score ({impact:+.2f} log-odds)"
+
+
 # ── Main render ───────────────────────────────────────────────────────────────
 
 def render():
@@ -157,16 +187,11 @@ def render():
                     _run_training_from_csv()
             with col_train3:
                 if st.button("🔄 Switch to Heuristic (instant)", key="use_heuristic"):
-                    from pathlib import Path as _P
-                    from app.core.config import settings as _s
-                    stale = _P(_s.XGB_MODEL_PATH)
-                    stale_bak = stale.with_suffix(".pkl.bak")
-                    if stale.exists():
-                        stale.rename(stale_bak)
-                        st.success("Model backed up. Switching to heuristic mode...")
-                        ml_ranking_service._model = None
-                        ml_ranking_service.clear_cache()
-                        st.rerun()
+                    ml_ranking_service.use_heuristic()
+                    st.success("Switching to heuristic mode (model versions are kept) …")
+                    st.rerun()
+        elif (drift := ml_ranking_service.get_drift_report()) and drift["needs_retraining"]:
+            _render_drift_warning(drift)
     else:
         st.warning(
             "⚠️ No trained model found — showing **heuristic** ranking. "
@@ -184,6 +209,9 @@ def render():
             if st.button("🚀 Step 2: Train XGBoost model from CSV"):
                 _run_training_from_csv()
 
+    _render_training_status()
+    _render_model_versions()
+
     st.markdown("---")
 
     # ── Build filter options from feature dataframe (lazy load) ──────────────
@@ -244,6 +272,13 @@ def render():
         st.info("No data available. Make sure data is loaded (sidebar → Load Data).")
         return
 
+    # Warm the enrichment cache for the likeliest next customer clicks
+    try:
+        from app.services.enrichment_prefetch import TOP_N, enrichment_prefetcher
+        enrichment_prefetcher.schedule(min(int(top_k), TOP_N), eq_filter, country_filter)
+    except Exception as e:
+        logger.warning(f"Enrichment prefetch not scheduled: {e}")
+
     # ── Apply company search filter ───────────────────────────────────────────
     if company_search.strip():
         mask = ranked_df["company"].str.contains(company_search.strip(), case=False, na=False)
@@ -254,16 +289,17 @@ def render():
     feat_df = ml_ranking_service._get_features()
 
     if feat_df is not None and not feat_df.empty:
-        # Build a map: company → first-match feature row
-        feat_by_company: dict[str, pd.Series] = {}
-        for _, frow in feat_df.iterrows():
-            name = str(frow.get("_company", "")).strip()
-            if name and name not in feat_by_company:
-                feat_by_company[name] = frow
+        # First feature row per company (for explanation metadata)
+        first_rows = (
+            feat_df.assign(_key=feat_df["_company"].astype(str).str.strip())
+            .drop_duplicates("_key")
+            .set_index("_key")
+        )
+        first_rows = first_rows[first_rows.index != ""]
 
         def _opp_for_company(company):
-            if company in feat_by_company:
-                return _opportunity_type(feat_by_company[company])
+            if company in first_rows.index:
+                return _opportunity_type(first_rows.loc[company])
             return "📞 Sales Development"
 
         ranked_df["opportunity_type"] = ranked_df["company"].map(_opp_for_company)
@@ -275,14 +311,9 @@ def render():
         ranked_df = ranked_df[ranked_df["opportunity_type"] == opp_filter]
 
     # ── Enrich with site/location data from IB ───────────────────────────────
-    if feat_df is not None and not feat_df.empty and "_company" in feat_df.columns:
-        city_map = {}
-        year_map = {}
-        for _, fr in feat_df.iterrows():
-            co = str(fr.get("_company", "")).strip()
-            if co and co not in city_map:
-                city_map[co] = str(fr.get("_site_city", "") or "")
-                year_map[co] = fr.get("_last_startup", None)
+    if feat_df is not None and not feat_df.empty and "_site_city" in feat_df.columns:
+        city_map = first_rows["_site_city"].fillna("").astype(str).to_dict()
+        year_map = first_rows["_last_startup"].to_dict()
         ranked_df["site_city"]    = ranked_df["company"].map(lambda c: city_map.get(c, ""))
         ranked_df["last_startup"] = ranked_df["company"].map(lambda c: year_map.get(c, None))
     else:
@@ -389,7 +420,11 @@ def render():
             opp_val     = crow["opportunity_type"]
 
             # Get feature row for this company (for metadata)
-            feat_row = feat_by_company.get(selected_explain, pd.Series()) if feat_df is not None else pd.Series()
+            feat_row = (
+                first_rows.loc[selected_explain]
+                if feat_df is not None and selected_explain in first_rows.index
+                else pd.Series()
+            )
 
             col_e1, col_e2 = st.columns([1, 2])
             with col_e1:
@@ -408,10 +443,20 @@ def render():
 </div>""", unsafe_allow_html=True)
 
             with col_e2:
-                reasons = _explain_rank(feat_row if not feat_row.empty else crow, score_val, source_label)
-                st.markdown("**Top 5 Ranking Drivers:**")
-                for i, r in enumerate(reasons, 1):
-                    st.markdown(f"{i}. {r}")
+                shap_drivers = []
+                if source_label == "XGBoost" and "row_id" in crow.index:
+                    rid = int(crow["row_id"])
+                    shap_drivers = ml_ranking_service.get_explanations([rid]).get(rid, [])
+
+                if shap_drivers:
+                    st.markdown("**Top 5 Ranking Drivers (SHAP):**")
+                    for i, d in enumerate(shap_drivers, 1):
+                        st.markdown(f"{i}. {_explain_shap(d)}")
+                else:
+                    reasons = _explain_rank(feat_row if not feat_row.empty else crow, score_val, source_label)
+                    st.markdown("**Top 5 Ranking Drivers:**")
+                    for i, r in enumerate(reasons, 1):
+                        st.markdown(f"{i}. {r}")
 
                 # Business recommendation
                 st.markdown("**📌 Recommended Next Action:**")
@@ -593,27 +638,111 @@ def _export_training_data():
 
 
 def _run_training_from_csv():
-    """Train from the previously exported CSV files (avoids DB lock)."""
-    import subprocess, sys
+    """Start training from the exported CSV files in a background process (avoids DB lock)."""
+    from app.services.training_service import training_service
     if not _BCG_CSV.exists():
         st.error(f"BCG CSV not found at `{_BCG_CSV}`. Run Step 1 first.")
         return
+    if training_service.is_running():
+        st.info("A training job is already running — see progress below.")
+        return
+    training_service.start_from_csv(_BCG_CSV, _CRM_CSV)
+    st.rerun()
+
+
+def _training_status_body():
+    """Progress, log tail and outcome of the current / last training job."""
+    from app.services.training_service import training_service
+    info = training_service.status()
+    if not info:
+        return
+    job = training_service.job
 
-    train_script = ROOT / "scripts" / "train.py"
-    cmd = [
-        sys.executable, str(train_script),
-        "--bcg-csv", str(_BCG_CSV),
-        "--crm-csv", str(_CRM_CSV) if _CRM_CSV.exists() else "",
-    ]
-    with st.spinner("Training XGBoost model … (this may take 1-3 minutes)"):
-        result = subprocess.run(cmd, capture_output=True, text=True, cwd=str(ROOT))
-
-    if result.returncode == 0:
-        st.success("✅ Training complete! Refresh the page to load the new model.")
-        with st.expander("Training log"):
-            out = result.stdout + result.stderr
-            st.text(out[-4000:] if len(out) > 4000 else out)
+    if info["status"] == "running":
+        st.progress(
+            info["progress"],
+            text=f"🚀 Training … step {info['step']}/{info['n_steps']} "
+                 f"{info['step_label']} ({info['elapsed_s']:.0f}s)",
+        )
+        if st.button("⏹ Cancel training", key="training_cancel"):
+            training_service.cancel()
+    elif info["status"] == "succeeded":
+        version = f" Version `{info['version']}` is now active." if info["version"] else ""
+        st.success(f"✅ Training complete in {info['elapsed_s']:.0f}s.{version}")
+        if st.button("🔄 Reload rankings", key="training_reload"):
+            st.rerun()
+    elif info["status"] == "cancelled":
+        st.warning("Training was cancelled.")
+    else:
+        st.error(f"Training failed (exit code {info['returncode']}). See log below.")
+
+    with st.expander("Training log", expanded=info["status"] == "failed"):
+        st.text(job.log_tail(80))
+
+
+# Re-render only the status block every 2 s while a job runs; older
+# Streamlit versions without fragments fall back to a manual refresh button.
+if hasattr(st, "fragment"):
+    _training_status_live = st.fragment(run_every=2)(_training_status_body)
+else:
+    _training_status_live = None
+
+
+def _render_training_status():
+    from app.services.training_service import training_service
+    if training_service.job is None:
+        return
+    if _training_status_live is not None and training_service.is_running():
+        _training_status_live()
     else:
-        st.error("Training failed. See log below.")
-        with st.expander("Error log"):
-            st.text(result.stderr[-4000:])
+        _training_status_body()
+        if training_service.is_running() and st.button("Refresh status", key="training_refresh"):
+            st.rerun()
+
+
+def _render_drift_warning(drift: dict):
+    """Retrain prompt when the loaded data no longer matches the training data."""
+    st.warning(
+        "⚠️ The loaded data has drifted from the model's training data — "
+        "**retraining is recommended**:\n\n" + "\n".join(f"- {r}" for r in drift["reasons"])
+    )
+    with st.expander("📉 Feature drift (PSI vs. training data)"):
+        st.caption("PSI < 0.1 stable · 0.1–0.25 moderate shift · > 0.25 major shift")
+        st.dataframe(drift["features"], use_container_width=True, hide_index=True)
+        if drift["score_psi"] == drift["score_psi"]:
+            st.metric("Score distribution PSI", f"{drift['score_psi']:.3f}")
+    col_train1, col_train2 = st.columns(2)
+    with col_train1:
+        if st.button("📤 Step 1: Export training data to CSV", key="export_drift"):
+            _export_training_data()
+    with col_train2:
+        if st.button("🚀 Step 2: Train XGBoost from CSV", key="train_drift"):
+            _run_training_from_csv()
+
+
+def _render_model_versions():
+    """Registry versions with one-click activation (hot swap, no restart)."""
+    from app.services.ml_ranking_service import ml_ranking_service
+    registry = ml_ranking_service.registry
+    if registry is None:
+        return
+    versions = registry.list_versions()
+    if versions.empty:
+        return
+
+    with st.expander(f"🗂️ Model versions ({len(versions)})"):
+        st.dataframe(versions, use_container_width=True, hide_index=True)
+        options = ["heuristic"] + versions["version"].tolist()[::-1]
+        active = registry.active_version() or "heuristic"
+        col_v1, col_v2 = st.columns([3, 1])
+        with col_v1:
+            chosen = st.selectbox(
+                "Active model", options,
+                index=options.index(active) if active in options else 0,
+                key="registry_version",
+            )
+        with col_v2:
+            st.markdown("<br>", unsafe_allow_html=True)
+            if st.button("Activate", key="registry_activate", disabled=chosen == active):
+                ml_ranking_service.activate_version(chosen)
+                st.rerun()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+scripts/bench_enrichment_parsing.py
+===================================
+Micro-benchmark: lean lxml parsers vs the original BeautifulSoup parsers
+used by WebEnrichmentService (Google News RSS, Wikipedia infobox).
+
+Inputs are synthetic but shaped like the real payloads (Google News items
+carry an HTML-escaped <a>/<font> description; the infobox sits in a lead
+section with a few reference-heavy paragraphs).  Both paths are checked
+for identical output before timing.
+
+Usage
+-----
+    python scripts/bench_enrichment_parsing.py
+    python scripts/bench_enrichment_parsing.py --items 100 --limit 10 --repeat 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import timeit
+from html import escape
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from app.services.feed_parsing import (  # noqa: E402
+    parse_infobox, parse_infobox_soup, parse_rss_items, parse_rss_items_soup,
+)
+
+
+def make_feed(n_items: int) -> bytes:
+    items = []
+    for i in range(n_items):
+        desc = (f'<a href="https://news.example.com/{i}" target="_blank">Steelmaker {i} expands '
+                f'EAF capacity &amp; rolling mill</a>&nbsp;&nbsp;<font color="#6f6f6f">Outlet {i}</font>')
+        items.append(
+            f"<item><title>Steelmaker {i} expands capacity - Outlet {i}</title>"
+            f"<link>https://news.google.com/rss/articles/{i}</link>"
+            f'<guid isPermaLink="false">{i}</guid>'
+            f"<pubDate>Mon, 02 Mar 2026 {i % 24:02d}:00:00 GMT</pubDate>"
+            f"<description>{escape(desc)}</description>"
+            f'<source url="https://outlet{i}.example.com">Outlet {i}</source></item>'
+        )
+    return ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<rss version="2.0" xmlns:media="http://search.yahoo.com/mrss/"><channel>'
+            "<title>Google News</title>" + "".join(items) + "</channel></rss>").encode()
+
+
+def make_wiki_html(n_paragraphs: int) -> str:
+    rows = "".join(
+        f'<tr><th class="infobox-label">{k}</th><td class="infobox-data">{v}</td></tr>'
+        for k, v in [("Type", "Public"), ("Industry", "Steel"), ("Founded", "1811"),
+                     ("Headquarters", "Essen, Germany"), ("Number of employees", "96,000 (2025)"),
+                     ("Parent", "Example Holding AG"), ("Website", "example.com")] * 3
+    )
+    paras = "".join(
+        f'<p>Paragraph {i} about the <a href="/wiki/Steel">steel</a> company'
+        f'<sup class="reference"><a href="#cite-{i}">[{i}]</a></sup>.</p>'
+        for i in range(n_paragraphs)
+    )
+    return (f'<div class="mw-parser-output"><table class="infobox vcard"><tbody>{rows}</tbody></table>'
+            f"{paras}</div>")
+
+
+def bench(label: str, lean, soup, repeat: int) -> None:
+    t_lean = min(timeit.repeat(lean, number=repeat, repeat=3)) / repeat * 1e3
+    t_soup = min(timeit.repeat(soup, number=repeat, repeat=3)) / repeat * 1e3
+    print(f"{label:<22} lean {t_lean:8.3f} ms   soup {t_soup:8.3f} ms   speed-up {t_soup / t_lean:5.1f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark enrichment parsers")
+    parser.add_argument("--items", type=int, default=100, help="RSS items in the synthetic feed")
+    parser.add_argument("--limit", type=int, default=10, help="Items parsed per call")
+    parser.add_argument("--paragraphs", type=int, default=40, help="Paragraphs in the Wikipedia page")
+    parser.add_argument("--repeat", type=int, default=100, help="Calls per timing run")
+    args = parser.parse_args()
+
+    feed = make_feed(args.items)
+    page = make_wiki_html(args.paragraphs)
+
+    assert parse_rss_items(feed, args.limit) == parse_rss_items_soup(feed, args.limit)
+    lean_box, soup_box = parse_infobox(page), parse_infobox_soup(page)
+    assert {k: v for k, v in lean_box.items() if k != "description"} == \
+           {k: v for k, v in soup_box.items() if k != "description"}
+
+    print(f"feed: {len(feed) / 1024:.0f} KiB, {args.items} items (limit {args.limit}); "
+          f"page: {len(page) / 1024:.0f} KiB")
+    bench(f"RSS (limit {args.limit})", lambda: parse_rss_items(feed, args.limit),
+          lambda: parse_rss_items_soup(feed, args.limit), args.repeat)
+    bench(f"RSS (all {args.items})", lambda: parse_rss_items(feed, args.items),
+          lambda: parse_rss_items_soup(feed, args.items), max(args.repeat // 5, 1))
+    bench("Wikipedia infobox", lambda: parse_infobox(page),
+          lambda: parse_infobox_soup(page), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
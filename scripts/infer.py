@@ -18,8 +18,12 @@ Usage
     # Export to JSON instead of CSV:
     python scripts/infer.py --format json
 
-    # Use a non-default model or database:
-    python scripts/infer.py --model models/xgb_priority_v1.pkl --db data/sales_app.db
+    # Stream a multi-million-row installed base to Parquet in bounded memory:
+    python scripts/infer.py --stream --chunk-rows 200000 --out data/processed/scores.parquet
+
+    # Use a specific registry version, model file or database:
+    python scripts/infer.py --version 20260301-101500-3fa2c1d9
+    python scripts/infer.py --model models/xgb_priority_v1.ubj --db data/sales_app.db
 """
 
 from __future__ import annotations
@@ -34,7 +38,9 @@ from pathlib import Path
 ROOT = Path(__file__).resolve().parent.parent
 sys.path.insert(0, str(ROOT))
 
-from src.features.feature_engineering import extract_equipment_features, load_raw_data
+from src.features.feature_engineering import extract_equipment_features, load_raw_data, open_readonly
+from src.models.batch_inference import DEFAULT_CHUNK_ROWS, stream_score
+from src.models.model_registry import ModelRegistry
 from src.models.xgb_ranking_model import XGBPriorityModel
 
 logging.basicConfig(
@@ -47,14 +53,21 @@ logger = logging.getLogger("infer")
 
 def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser(description="Run inference with persisted XGBoost model")
-    p.add_argument("--model",          default=str(ROOT / "models" / "xgb_priority_v1.pkl"))
+    p.add_argument("--model",          default=None,
+                   help="Model file (default: the registry's active version)")
+    p.add_argument("--version",        default=None,
+                   help="Registry version to use instead of the active one")
     p.add_argument("--db",             default=str(ROOT / "data" / "sales_app.db"))
     p.add_argument("--equipment-type", default=None,
                    help="Filter ranking to this equipment type (substring match)")
     p.add_argument("--top-k",          type=int, default=None,
                    help="Return only the top-K ranked items")
-    p.add_argument("--format",         choices=["csv", "json", "print"],
-                   default="print", help="Output format")
+    p.add_argument("--format",         choices=["csv", "json", "parquet", "print"],
+                   default="print", help="Output format (--stream always writes Parquet)")
+    p.add_argument("--stream",         action="store_true",
+                   help="Read, featurise and score the BCG table in chunks; write Parquet incrementally")
+    p.add_argument("--chunk-rows",     type=int, default=DEFAULT_CHUNK_ROWS,
+                   help="Rows per chunk in --stream mode")
     p.add_argument("--out",            default=None,
                    help="Output file path (default: auto-named in data/processed/)")
     return p.parse_args()
@@ -63,6 +76,14 @@ def parse_args() -> argparse.Namespace:
 def main() -> None:
     args = parse_args()
 
+    if args.model is None:
+        registry = ModelRegistry()
+        path = registry.model_path(args.version) if args.version else registry.active_model_path()
+        if path is None or not path.exists():
+            logger.error("No model to score with – train one first (scripts/train.py).")
+            sys.exit(1)
+        args.model = str(path)
+
     logger.info("XGBoost Priority-Ranking – Inference")
     logger.info("Model  : %s", args.model)
     logger.info("DB     : %s", args.db)
@@ -72,6 +93,25 @@ def main() -> None:
     model_wrapper.load(args.model)
     logger.info("Features used: %s", model_wrapper.feature_columns)
 
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    # ── Streaming mode: bounded memory, Parquet written chunk by chunk ─────────
+    if args.stream:
+        out_path = Path(args.out) if args.out else (
+            ROOT / "data" / "processed" / f"ranking_{ts}.parquet"
+        )
+        with open_readonly(args.db) as conn:
+            summary = stream_score(
+                conn, model_wrapper, out_path,
+                chunk_rows=args.chunk_rows,
+                equipment_type=args.equipment_type,
+                top_k=args.top_k,
+                log=logger.info,
+            )
+        logger.info("Scored %d rows in %d chunk(s); %d written → %s",
+                    summary["rows_read"], summary["chunks"], summary["rows_written"], out_path)
+        return
+
     # ── Load & engineer features ───────────────────────────────────────────────
     bcg_df, crm_df = load_raw_data(args.db)
     if bcg_df.empty:
@@ -96,7 +136,6 @@ def main() -> None:
         print(ranked.to_string(index=False))
 
     elif args.format == "csv":
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
         out_path = Path(args.out) if args.out else (
             ROOT / "data" / "processed" / f"ranking_{ts}.csv"
         )
@@ -105,7 +144,6 @@ def main() -> None:
         logger.info("CSV saved → %s", out_path)
 
     elif args.format == "json":
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
         out_path = Path(args.out) if args.out else (
             ROOT / "data" / "processed" / f"ranking_{ts}.json"
         )
@@ -113,6 +151,14 @@ def main() -> None:
         out_path.write_text(ranked.to_json(orient="records", indent=2))
         logger.info("JSON saved → %s", out_path)
 
+    elif args.format == "parquet":
+        out_path = Path(args.out) if args.out else (
+            ROOT / "data" / "processed" / f"ranking_{ts}.parquet"
+        )
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        ranked.to_parquet(out_path, index=False)
+        logger.info("Parquet saved → %s", out_path)
+
 
 if __name__ == "__main__":
     main()
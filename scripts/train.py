@@ -9,11 +9,21 @@ Usage
     # From project root (with venv activated):
     python scripts/train.py
 
-    # With explicit DB and model paths:
-    python scripts/train.py --db data/sales_app.db --out models/xgb_priority_v1.pkl
+    # Trained models are registered under models/registry/ and activated;
+    # the running app hot-swaps to them.  Register without activating:
+    python scripts/train.py --no-activate
+
+    # With explicit DB path, writing a standalone model file instead:
+    python scripts/train.py --db data/sales_app.db --out models/xgb_priority_v1.ubj
 
     # Dry-run (feature engineering only, no model saved):
     python scripts/train.py --dry-run
+
+    # Learning-to-rank objective (one query per equipment type):
+    python scripts/train.py --objective rank:ndcg
+
+    # Hyperparameter search (successive halving, all cores), then train the winner:
+    python scripts/train.py --search --search-trials 27 --search-workers 4
 """
 
 from __future__ import annotations
@@ -32,10 +42,12 @@ import pandas as pd
 
 from src.features.feature_engineering import (
     build_labels,
+    data_fingerprint,
     extract_equipment_features,
     load_raw_data,
 )
-from src.models.xgb_ranking_model import XGBPriorityModel
+from src.models.model_registry import ModelRegistry
+from src.models.xgb_ranking_model import SUPPORTED_OBJECTIVES, XGBPriorityModel
 
 logging.basicConfig(
     level=logging.INFO,
@@ -57,10 +69,26 @@ def parse_args() -> argparse.Namespace:
                    help="Path to CRM data CSV (use instead of --db when DB is locked)")
     p.add_argument("--export-csv-only", action="store_true",
                    help="Export BCG and CRM tables to CSV then exit (useful when DB is locked)")
-    p.add_argument("--out",     default=str(ROOT / "models" / "xgb_priority_v1.pkl"),
-                   help="Output path for model pickle")
+    p.add_argument("--out",     default=None,
+                   help="Write a standalone model file (.ubj or .json) instead of registering it")
+    p.add_argument("--registry", default=str(ROOT / "models" / "registry"),
+                   help="Model registry directory")
+    p.add_argument("--no-activate", action="store_true",
+                   help="Register the new version without making it the active model")
     p.add_argument("--eval-split", type=float, default=0.2,
                    help="Fraction of data reserved for test evaluation")
+    p.add_argument("--objective", default="binary:logistic", choices=list(SUPPORTED_OBJECTIVES),
+                   help="Pointwise classifier or learning-to-rank objective (queries = equipment types)")
+    p.add_argument("--search", action="store_true",
+                   help="Run a hyperparameter search first and train the best config")
+    p.add_argument("--search-strategy", choices=["halving", "random"], default="halving",
+                   help="Successive halving or plain random search")
+    p.add_argument("--search-trials", type=int, default=27,
+                   help="Number of sampled configurations")
+    p.add_argument("--search-max-estimators", type=int, default=800,
+                   help="Largest tree budget per trial (early stopping applies)")
+    p.add_argument("--search-workers", type=int, default=None,
+                   help="Worker processes (default: one per CPU core)")
     p.add_argument("--top-k",   type=int, default=20,
                    help="Number of top-ranked equipment to print per type")
     p.add_argument("--dry-run", action="store_true",
@@ -75,21 +103,26 @@ def main() -> None:
     logger.info("XGBoost Priority-Ranking – Training Pipeline")
     logger.info("Started at %s", datetime.now().isoformat())
     logger.info("Database   : %s", args.db)
-    logger.info("Model out  : %s", args.out)
+    logger.info("Model out  : %s", args.out or f"registry {args.registry}")
+    logger.info("Objective  : %s", args.objective)
     logger.info("=" * 60)
 
+    # The hyperparameter search is a step of its own, so the step count
+    # (parsed by training_service for progress) depends on --search
+    n_steps = 6 if args.search else 5
+
     # ── 1. Load raw data ───────────────────────────────────────────────────────
     processed_dir = ROOT / "data" / "processed"
     processed_dir.mkdir(parents=True, exist_ok=True)
 
     if args.bcg_csv:
         # ── CSV mode: load from pre-exported files (avoids DB lock) ──────────
-        logger.info("Step 1/5  Loading raw data from CSV files …")
+        logger.info("Step 1/%d  Loading raw data from CSV files …", n_steps)
         bcg_df = pd.read_csv(args.bcg_csv)
         crm_df = pd.read_csv(args.crm_csv) if args.crm_csv else pd.DataFrame()
         logger.info("BCG rows: %d  |  CRM rows: %d", len(bcg_df), len(crm_df))
     else:
-        logger.info("Step 1/5  Loading raw data from DuckDB …")
+        logger.info("Step 1/%d  Loading raw data from DuckDB …", n_steps)
         bcg_df, crm_df = load_raw_data(args.db)
         logger.info("BCG rows: %d  |  CRM rows: %d", len(bcg_df), len(crm_df))
 
@@ -109,7 +142,7 @@ def main() -> None:
         sys.exit(1)
 
     # ── 2. Labels ─────────────────────────────────────────────────────────────
-    logger.info("Step 2/5  Building binary labels …")
+    logger.info("Step 2/%d  Building binary labels …", n_steps)
     labels = build_labels(bcg_df, crm_df)
 
     if labels.sum() == 0:
@@ -117,7 +150,7 @@ def main() -> None:
                        "Check company name columns in BCG/CRM data.")
 
     # ── 3. Feature engineering ────────────────────────────────────────────────
-    logger.info("Step 3/5  Extracting features …")
+    logger.info("Step 3/%d  Extracting features …", n_steps)
     feat_df, feat_meta = extract_equipment_features(bcg_df, crm_df)
 
     feature_cols = feat_meta["feature_columns"]
@@ -137,27 +170,55 @@ def main() -> None:
         logger.info("Dry-run mode – skipping model training.")
         return
 
+    # ── 4b. Optional hyperparameter search ─────────────────────────────────────
+    search_params = None
+    if args.search:
+        from src.models.hparam_search import best_params, run_search
+
+        logger.info("Step 4/%d  Hyperparameter search (%s) …", n_steps, args.search_strategy)
+        board = run_search(
+            feat_df, labels, feature_cols,
+            objective=args.objective,
+            strategy=args.search_strategy,
+            n_trials=args.search_trials,
+            max_estimators=args.search_max_estimators,
+            n_workers=args.search_workers,
+            eval_split=args.eval_split,
+        )
+        board_path = processed_dir / f"search_leaderboard_{snapshot_id}.csv"
+        board.to_csv(board_path, index=False)
+        print(board.head(10).to_string(index=False))
+        logger.info("Leaderboard → %s  (total trial time %.1fs)", board_path, board["wall_time_s"].sum())
+        search_params = best_params(board)
+        logger.info("Best config: %s", search_params)
+
     # ── 5. Train model ─────────────────────────────────────────────────────────
-    logger.info("Step 4/5  Training XGBoost model …")
-    model_wrapper = XGBPriorityModel(model_path=args.out)
+    logger.info("Step %d/%d  Training XGBoost model …", n_steps - 1, n_steps)
+    model_wrapper = XGBPriorityModel(model_path=args.out) if args.out else XGBPriorityModel()
     metrics = model_wrapper.train(
         X=feat_df,
         y=labels,
         feature_columns=feature_cols,
         eval_split=args.eval_split,
         data_snapshot_id=snapshot_id,
+        objective=args.objective,
+        params=search_params,
     )
 
     logger.info("─" * 40)
     logger.info("Training metrics:")
     for k, v in metrics.items():
-        logger.info("  %-25s %s", k, v)
+        if k != "ci_by_type":
+            logger.info("  %-25s %s", k, v)
 
     # ── 5b. Per-equipment-type breakdown ───────────────────────────────────────
     logger.info("─" * 40)
     logger.info("Per-equipment-type ranking performance (Precision@10 / NDCG@10):")
     eq_metrics = model_wrapper.per_equipment_type_metrics(feat_df, labels, k=10)
     print(eq_metrics.to_string(index=False))
+    logger.info("Hold-out macro average over equipment types, 95% bootstrap CI:")
+    ci = pd.DataFrame(metrics["ci_by_type"]).T
+    print(ci.round(3).to_string())
 
     # ── 5c. Feature importance ─────────────────────────────────────────────────
     logger.info("─" * 40)
@@ -165,9 +226,20 @@ def main() -> None:
     print(model_wrapper.feature_importances_.to_string())
 
     # ── 6. Persist ────────────────────────────────────────────────────────────
-    logger.info("Step 5/5  Saving model artefacts …")
-    meta_path = Path(args.out).with_suffix(".meta.json")
-    mp, ap = model_wrapper.save(model_path=args.out, meta_path=meta_path)
+    logger.info("Step %d/%d  Saving model artefacts …", n_steps, n_steps)
+    if args.out:
+        meta_path = Path(args.out).with_suffix(".meta.json")
+        mp, ap = model_wrapper.save(model_path=args.out, meta_path=meta_path)
+    else:
+        registry = ModelRegistry(args.registry)
+        version = registry.register(
+            model_wrapper,
+            data_fingerprint=data_fingerprint(feat_df),
+            activate=not args.no_activate,
+        )
+        mp, ap = model_wrapper.model_path, model_wrapper.meta_path
+        logger.info("Registered version %s (%s)", version,
+                    "not activated" if args.no_activate else "active")
 
     # ── 7. Export rankings per equipment type ──────────────────────────────────
     ranked_dir = ROOT / "data" / "processed"
@@ -20,9 +20,10 @@ from __future__ import annotations
 
 import re
 import logging
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Dict, Iterator, Optional, Sequence, Tuple
 
 import duckdb
 import numpy as np
@@ -41,6 +42,12 @@ _COMPANY_COLS   = ["company_internal", "company_name", "Company Name", "name", "
 _RATING_COLS    = ["crm_rating", "rating", "CRM Rating", "customer_rating"]
 _COUNTRY_COLS   = ["country_internal", "country", "Country", "ib_customer_country", "region", "location"]
 
+# ── DuckDB table candidates, in order of preference ──────────────────────────
+# Prefer bcg_installed_base (has internal/normalised columns) over the raw
+# bcg_data dump (which has original xlsx column names)
+_BCG_TABLES = ["bcg_installed_base", "bcg_data", "installed_base", "bcg"]
+_CRM_TABLES = ["crm_data", "crm", "customers", "unified_companies"]
+
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Low-level helpers
@@ -75,31 +82,41 @@ def _rating_num(rating: str) -> int:
     return {"A": 5, "B": 4, "C": 3, "D": 2, "E": 1}.get(str(rating).strip().upper(), 3)
 
 
+def data_fingerprint(df: pd.DataFrame) -> str:
+    """
+    Cheap content hash of a DataFrame (values + column names).
+
+    Used to key cached scores so they are recomputed only when the
+    underlying data actually changes.
+    """
+    import hashlib
+    h = hashlib.sha1()
+    h.update("|".join(map(str, df.columns)).encode("utf-8"))
+    h.update(str(len(df)).encode("utf-8"))
+    if len(df):
+        h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()[:16]
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Data loading
 # ─────────────────────────────────────────────────────────────────────────────
 
-def load_raw_data(db_path: str | Path) -> Tuple[pd.DataFrame, pd.DataFrame]:
+@contextmanager
+def open_readonly(db_path: str | Path) -> Iterator["duckdb.DuckDBPyConnection"]:
     """
-    Load BCG installed-base and CRM tables from DuckDB.
+    Read-only DuckDB connection to *db_path*, closed on exit.
 
-    Returns
-    -------
-    bcg_df : pd.DataFrame   – one row per equipment unit
-    crm_df : pd.DataFrame   – CRM company + project summary
+    DuckDB on Windows uses exclusive file locking. If another process (e.g.
+    the running Streamlit app) has the DB open, we read from a temp copy.
     """
-    # DuckDB on Windows uses exclusive file locking. If another process (e.g. the
-    # running Streamlit app) has the DB open, we must read from a temp copy.
     import shutil, tempfile
     db_path = Path(db_path)
 
-    def _connect(path: Path, read_only: bool = True):
-        return duckdb.connect(str(path), read_only=read_only)
-
     conn = None
     tmp_path = None
     try:
-        conn = _connect(db_path, read_only=True)
+        conn = duckdb.connect(str(db_path), read_only=True)
     except Exception as lock_err:
         logger.warning("Direct open failed (%s) – copying DB to temp file …", lock_err)
         try:
@@ -107,7 +124,7 @@ def load_raw_data(db_path: str | Path) -> Tuple[pd.DataFrame, pd.DataFrame]:
             import os; os.close(tmp_fd)
             tmp_path = Path(tmp_str)
             shutil.copy2(db_path, tmp_path)
-            conn = _connect(tmp_path, read_only=False)
+            conn = duckdb.connect(str(tmp_path), read_only=False)
             logger.info("Connected to temp copy: %s", tmp_path)
         except Exception as e2:
             raise RuntimeError(
@@ -116,31 +133,7 @@ def load_raw_data(db_path: str | Path) -> Tuple[pd.DataFrame, pd.DataFrame]:
             ) from e2
 
     try:
-        tables = {r[0] for r in conn.execute("SHOW TABLES").fetchall()}
-        logger.info("Available DuckDB tables: %s", tables)
-
-        # ── BCG (installed base) ──────────────────────────────────────────────────
-        # Prefer bcg_installed_base (has internal/normalised columns) over
-        # the raw bcg_data dump (which has original xlsx column names)
-        bcg_candidates = ["bcg_installed_base", "bcg_data", "installed_base", "bcg"]
-        bcg_table = next((t for t in bcg_candidates if t in tables), None)
-        if bcg_table:
-            bcg_df = conn.execute(f"SELECT * FROM {bcg_table}").df()
-            logger.info("Loaded BCG table '%s': %d rows", bcg_table, len(bcg_df))
-        else:
-            logger.warning("No BCG table found – returning empty DataFrame")
-            bcg_df = pd.DataFrame()
-
-        # ── CRM ───────────────────────────────────────────────────────────────────
-        crm_candidates = ["crm_data", "crm", "customers", "unified_companies"]
-        crm_table = next((t for t in crm_candidates if t in tables), None)
-        if crm_table:
-            crm_df = conn.execute(f"SELECT * FROM {crm_table}").df()
-            logger.info("Loaded CRM table '%s': %d rows", crm_table, len(crm_df))
-        else:
-            logger.warning("No CRM table found – labels will default to 0")
-            crm_df = pd.DataFrame()
-
+        yield conn
     finally:
         conn.close()
         if tmp_path is not None:
@@ -150,7 +143,24 @@ def load_raw_data(db_path: str | Path) -> Tuple[pd.DataFrame, pd.DataFrame]:
             except Exception:
                 pass
 
-    return bcg_df, crm_df
+
+def find_table(conn, candidates: Sequence[str]) -> Optional[str]:
+    """First of *candidates* that exists in the connected database."""
+    tables = {r[0] for r in conn.execute("SHOW TABLES").fetchall()}
+    return next((t for t in candidates if t in tables), None)
+
+
+def load_raw_data(db_path: str | Path) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Load BCG installed-base and CRM tables from DuckDB.
+
+    Returns
+    -------
+    bcg_df : pd.DataFrame   – one row per equipment unit
+    crm_df : pd.DataFrame   – CRM company + project summary
+    """
+    with open_readonly(db_path) as conn:
+        return load_raw_data_from_conn(conn)
 
 
 def load_raw_data_from_conn(conn) -> Tuple[pd.DataFrame, pd.DataFrame]:
@@ -165,11 +175,9 @@ def load_raw_data_from_conn(conn) -> Tuple[pd.DataFrame, pd.DataFrame]:
     here; it belongs to the caller).
     """
     tables = {r[0] for r in conn.execute("SHOW TABLES").fetchall()}
-    logger.info("(shared conn) Available DuckDB tables: %s", tables)
+    logger.info("Available DuckDB tables: %s", tables)
 
-    # Prefer bcg_installed_base (has normalised internal columns) over raw dump
-    bcg_candidates = ["bcg_installed_base", "bcg_data", "installed_base", "bcg"]
-    bcg_table = next((t for t in bcg_candidates if t in tables), None)
+    bcg_table = next((t for t in _BCG_TABLES if t in tables), None)
     if bcg_table:
         bcg_df = conn.execute(f"SELECT * FROM {bcg_table}").df()
         logger.info("Loaded BCG table '%s': %d rows", bcg_table, len(bcg_df))
@@ -177,8 +185,7 @@ def load_raw_data_from_conn(conn) -> Tuple[pd.DataFrame, pd.DataFrame]:
         logger.warning("No BCG table found – returning empty DataFrame")
         bcg_df = pd.DataFrame()
 
-    crm_candidates = ["crm_data", "crm", "customers", "unified_companies"]
-    crm_table = next((t for t in crm_candidates if t in tables), None)
+    crm_table = next((t for t in _CRM_TABLES if t in tables), None)
     if crm_table:
         crm_df = conn.execute(f"SELECT * FROM {crm_table}").df()
         logger.info("Loaded CRM table '%s': %d rows", crm_table, len(crm_df))
@@ -242,13 +249,58 @@ def build_labels(bcg_df: pd.DataFrame, crm_df: pd.DataFrame) -> pd.Series:
 # Feature extraction  (equipment-level)
 # ─────────────────────────────────────────────────────────────────────────────
 
+def clean_category(values: pd.Series) -> pd.Series:
+    """Raw categorical values as encoded: missing → "Unknown", whitespace stripped."""
+    return values.fillna("Unknown").str.strip()
+
+
+def _encode(values: pd.Series, vocab: Optional[Sequence[str]]) -> Tuple[np.ndarray, LabelEncoder]:
+    """LabelEncoder codes, fitted on *values* or fixed to a given *vocab*."""
+    le = LabelEncoder()
+    if vocab is None:
+        return le.fit_transform(values.astype(str)), le
+    le.classes_ = np.asarray(vocab, dtype=object)
+    codes = pd.Index(le.classes_).get_indexer(values.astype(str))
+    if (codes < 0).any():
+        unknown = sorted(set(values.astype(str)[codes < 0]))[:5]
+        raise ValueError(f"Values missing from category vocabulary: {unknown}")
+    return codes, le
+
+
+def build_crm_lookup(crm_df: pd.DataFrame) -> Dict[str, dict]:
+    """Normalised company name → {rating, fte, proj_count} from the CRM table."""
+    crm_lookup: Dict[str, dict] = {}
+    if crm_df.empty:
+        return crm_lookup
+    crm_company_col = _first_col(crm_df, _COMPANY_COLS)
+    crm_rating_col = _first_col(crm_df, _RATING_COLS)
+    fte_col = _first_col(crm_df, ["fte", "employees", "headcount"])
+    proj_col = _first_col(crm_df, ["project_count", "projects_count", "num_projects"])
+
+    for _, row in crm_df.iterrows():
+        key = _normalise_name(str(row[crm_company_col]) if crm_company_col else "")
+        crm_lookup[key] = {
+            "rating": _rating_num(str(row[crm_rating_col])) if crm_rating_col else 3,
+            "fte": _parse_int(row[fte_col]) if fte_col else 0,
+            "proj_count": _parse_int(row[proj_col]) if proj_col else 0,
+        }
+    return crm_lookup
+
+
 def extract_equipment_features(
     bcg_df: pd.DataFrame,
     crm_df: pd.DataFrame,
+    category_vocab: Optional[Dict[str, Sequence[str]]] = None,
+    crm_lookup: Optional[Dict[str, dict]] = None,
 ) -> pd.DataFrame:
     """
     Build the feature matrix X (one row per BCG equipment row).
 
+    For chunked processing pass *category_vocab* ({"equipment_type": [...],
+    "country": [...]}, sorted as LabelEncoder would fit them on the whole
+    table) and a prebuilt *crm_lookup* (see build_crm_lookup), so every chunk
+    is encoded exactly as the full table would be.
+
     Numeric features
     ----------------
     equipment_age           years since installation / commission
@@ -283,40 +335,30 @@ def extract_equipment_features(
     # ── Equipment type (encoded) ──────────────────────────────────────────────
     eq_col = _first_col(df, _EQ_TYPE_COLS)
     if eq_col:
-        df["equipment_type_raw"] = df[eq_col].fillna("Unknown").str.strip()
+        df["equipment_type_raw"] = clean_category(df[eq_col])
     else:
         df["equipment_type_raw"] = "Unknown"
 
-    le_eq = LabelEncoder()
-    df["equipment_type_enc"] = le_eq.fit_transform(df["equipment_type_raw"].astype(str))
+    df["equipment_type_enc"], le_eq = _encode(
+        df["equipment_type_raw"], (category_vocab or {}).get("equipment_type")
+    )
 
     # ── Country / region (encoded) ────────────────────────────────────────────
     country_col = _first_col(df, _COUNTRY_COLS)
     if country_col:
-        df["country_raw"] = df[country_col].fillna("Unknown").str.strip()
+        df["country_raw"] = clean_category(df[country_col])
     else:
         df["country_raw"] = "Unknown"
 
-    le_country = LabelEncoder()
-    df["country_enc"] = le_country.fit_transform(df["country_raw"].astype(str))
+    df["country_enc"], le_country = _encode(
+        df["country_raw"], (category_vocab or {}).get("country")
+    )
 
     # ── CRM enrichment (join by normalised name) ──────────────────────────────
     company_col = _first_col(df, _COMPANY_COLS)
 
-    crm_lookup: dict[str, dict] = {}
-    if not crm_df.empty:
-        crm_company_col = _first_col(crm_df, _COMPANY_COLS)
-        crm_rating_col = _first_col(crm_df, _RATING_COLS)
-        fte_col = _first_col(crm_df, ["fte", "employees", "headcount"])
-        proj_col = _first_col(crm_df, ["project_count", "projects_count", "num_projects"])
-
-        for _, row in crm_df.iterrows():
-            key = _normalise_name(str(row[crm_company_col]) if crm_company_col else "")
-            crm_lookup[key] = {
-                "rating": _rating_num(str(row[crm_rating_col])) if crm_rating_col else 3,
-                "fte": _parse_int(row[fte_col]) if fte_col else 0,
-                "proj_count": _parse_int(row[proj_col]) if proj_col else 0,
-            }
+    if crm_lookup is None:
+        crm_lookup = build_crm_lookup(crm_df)
 
     def _crm_info(raw_name: str) -> dict:
         n = _normalise_name(raw_name)
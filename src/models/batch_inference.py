@@ -0,0 +1,192 @@
+"""
+Streaming batch inference for the XGBoost priority-ranking model
+=================================================================
+Scores the BCG installed base chunk by chunk straight from DuckDB and
+writes Parquet incrementally, so memory stays bounded by the chunk size
+(plus the top-K buffer) instead of the table size.
+
+Design decisions
+----------------
+- Rows are read as Arrow record batches (``fetch_record_batch``), then
+  featurised and scored per chunk with the native booster.
+- Categorical encodings must match an in-memory run over the whole table,
+  so the equipment-type / country vocabularies are computed up front with
+  ``SELECT DISTINCT`` (small results) and the CRM lookup is built once.
+- Without ``top_k`` every scored row is appended to the Parquet file in
+  table order (``row_id`` = position in the scan); sort downstream or use
+  ``top_k``, which keeps only the best K rows across chunks and writes
+  them ranked at the end.
+"""
+
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.features.feature_engineering import (
+    _BCG_TABLES,
+    _COUNTRY_COLS,
+    _CRM_TABLES,
+    _EQ_TYPE_COLS,
+    _first_col,
+    build_crm_lookup,
+    clean_category,
+    extract_equipment_features,
+    find_table,
+)
+from src.models.xgb_ranking_model import top_k_order
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_ROWS = 100_000
+
+OUTPUT_COLUMNS = ["row_id", "company", "equipment_type", "country", "equipment_age", "priority_score"]
+
+
+def _output_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("row_id",         pa.int64()),
+        ("company",        pa.string()),
+        ("equipment_type", pa.string()),
+        ("country",        pa.string()),
+        ("equipment_age",  pa.int64()),
+        ("priority_score", pa.float64()),
+    ])
+
+
+def category_vocab(conn, table: str) -> Dict[str, List[str]]:
+    """
+    Sorted equipment-type / country vocabularies of *table*, computed in SQL.
+
+    Values are cleaned exactly as extract_equipment_features does, so the
+    codes match a LabelEncoder fitted on the full table.
+    """
+    columns = [r[0] for r in conn.execute(f"DESCRIBE {table}").fetchall()]
+    probe = pd.DataFrame(columns=columns)
+    vocab: Dict[str, List[str]] = {}
+    for key, aliases in (("equipment_type", _EQ_TYPE_COLS), ("country", _COUNTRY_COLS)):
+        col = _first_col(probe, aliases)
+        if col is None:
+            vocab[key] = ["Unknown"]
+            continue
+        distinct = conn.execute(f'SELECT DISTINCT "{col}" FROM {table}').df()[col]
+        vocab[key] = sorted(set(clean_category(distinct.astype(object)).astype(str)))
+    return vocab
+
+
+def _score_chunk(
+    chunk: pd.DataFrame,
+    model,
+    vocab: Dict[str, List[str]],
+    crm_lookup: Dict[str, dict],
+    offset: int,
+    equipment_type: Optional[str],
+) -> pd.DataFrame:
+    """Featurise and score one chunk: OUTPUT_COLUMNS plus the raw `_score`."""
+    feat_df, _ = extract_equipment_features(
+        chunk, pd.DataFrame(), category_vocab=vocab, crm_lookup=crm_lookup
+    )
+    row_id = np.arange(offset, offset + len(feat_df), dtype=np.int64)
+    if equipment_type:
+        mask = feat_df["_equipment_type"].str.contains(equipment_type, case=False, na=False).to_numpy()
+        feat_df, row_id = feat_df[mask], row_id[mask]
+    if feat_df.empty:
+        return pd.DataFrame(columns=OUTPUT_COLUMNS + ["_score"])
+
+    scores = model.predict_proba(feat_df)
+    return pd.DataFrame({
+        "row_id":         row_id,
+        "company":        feat_df["_company"].astype(str).to_numpy(),
+        "equipment_type": feat_df["_equipment_type"].astype(str).to_numpy(),
+        "country":        feat_df["_country"].astype(str).to_numpy(),
+        "equipment_age":  feat_df["_equipment_age"].to_numpy(dtype=np.int64),
+        "priority_score": (scores * 100).round(1),
+        "_score":         scores,     # unrounded, for ranking across chunks
+    })
+
+
+def stream_score(
+    conn,
+    model,
+    out_path: str | Path,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    equipment_type: Optional[str] = None,
+    top_k: Optional[int] = None,
+    log: Callable[[str], None] = logger.info,
+) -> Dict:
+    """
+    Score the BCG table of *conn* in chunks and write Parquet to *out_path*.
+
+    *model* is a loaded XGBPriorityModel.  With *top_k* only the K best rows
+    (after the optional *equipment_type* filter) are kept and written with a
+    1-based ``rank`` column; otherwise all rows are streamed to disk.
+
+    Returns a summary dict: out_path, rows_read, rows_written, chunks.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = find_table(conn, _BCG_TABLES)
+    if table is None:
+        raise ValueError("No BCG table found in the database")
+    crm_table = find_table(conn, _CRM_TABLES)
+    crm_df = conn.execute(f"SELECT * FROM {crm_table}").df() if crm_table else pd.DataFrame()
+    crm_lookup = build_crm_lookup(crm_df)
+    vocab = category_vocab(conn, table)
+    log(f"Streaming '{table}' in chunks of {chunk_rows:,} rows "
+        f"({len(vocab['equipment_type'])} equipment types, {len(vocab['country'])} countries)")
+
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    schema = _output_schema()
+    result = conn.execute(f"SELECT * FROM {table}")
+    # to_arrow_reader supersedes fetch_record_batch in newer DuckDB releases
+    reader = (result.to_arrow_reader(chunk_rows) if hasattr(result, "to_arrow_reader")
+              else result.fetch_record_batch(chunk_rows))
+
+    writer = None
+    best: Optional[pd.DataFrame] = None
+    rows_read = rows_written = chunks = 0
+    try:
+        for batch in reader:
+            scored = _score_chunk(batch.to_pandas(), model, vocab, crm_lookup,
+                                  rows_read, equipment_type)
+            rows_read += batch.num_rows
+            chunks += 1
+            if top_k:
+                pool = scored if best is None else pd.concat([best, scored], ignore_index=True)
+                keep = top_k_order(pool["_score"].to_numpy(dtype=float), top_k)
+                best = pool.iloc[np.sort(keep)].reset_index(drop=True)
+            elif len(scored):
+                if writer is None:
+                    writer = pq.ParquetWriter(out_path, schema)
+                writer.write_table(pa.Table.from_pandas(scored[OUTPUT_COLUMNS], schema=schema,
+                                                        preserve_index=False))
+                rows_written += len(scored)
+            log(f"Chunk {chunks}: {rows_read:,} rows scored")
+
+        if top_k:
+            ranked = best if best is not None else pd.DataFrame(columns=OUTPUT_COLUMNS + ["_score"])
+            ranked = ranked.iloc[top_k_order(ranked["_score"].to_numpy(dtype=float))]
+            table_out = pa.Table.from_pandas(ranked[OUTPUT_COLUMNS].reset_index(drop=True),
+                                             schema=schema, preserve_index=False)
+            table_out = table_out.add_column(0, "rank", pa.array(np.arange(1, len(ranked) + 1)))
+            pq.write_table(table_out, out_path)
+            rows_written = len(ranked)
+        elif writer is None:
+            pq.write_table(schema.empty_table(), out_path)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return {
+        "out_path":     out_path,
+        "rows_read":    rows_read,
+        "rows_written": rows_written,
+        "chunks":       chunks,
+    }
@@ -0,0 +1,144 @@
+"""
+Feature and score drift monitoring for the priority-ranking model
+=================================================================
+At training time a compact reference profile (per-feature histograms and
+the score histogram) is stored in the model metadata.  When new data is
+scored, the same bins are filled from the already-extracted feature matrix
+and the already-computed scores, and the Population Stability Index (PSI)
+is reported per feature — no raw data is re-read.
+
+Design decisions
+----------------
+- Bins are training quantiles (deciles by default); discrete features with
+  few distinct values simply get fewer bins.  Values equal to an edge fall
+  in the lower bin on both sides, so reference and current counts agree.
+- PSI thresholds follow the usual convention: < 0.1 stable, 0.1–0.25
+  moderate shift, > 0.25 major shift → retraining recommended.
+- Model age is reported too; a model older than MAX_MODEL_AGE_DAYS is
+  flagged as stale even without measurable drift.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+N_BINS             = 10
+PSI_MODERATE       = 0.1
+PSI_MAJOR          = 0.25
+MAX_MODEL_AGE_DAYS = 180
+_EPS               = 1e-4
+
+
+def _bin_counts(values: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    idx = np.searchsorted(edges, values, side="left")
+    return np.bincount(idx, minlength=len(edges) + 1)
+
+
+def _histogram(values: np.ndarray, n_bins: int = N_BINS) -> Dict:
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return {"edges": [], "props": [1.0]}
+    qs = np.linspace(0, 1, n_bins + 1)[1:-1]
+    edges = np.unique(np.quantile(values, qs))
+    counts = _bin_counts(values, edges)
+    return {"edges": edges.tolist(), "props": (counts / counts.sum()).tolist()}
+
+
+def psi(expected: Iterable[float], actual: Iterable[float]) -> float:
+    """Population Stability Index between two bin-proportion vectors."""
+    e = np.clip(np.asarray(expected, dtype=float), _EPS, None)
+    a = np.clip(np.asarray(actual, dtype=float), _EPS, None)
+    return float(np.sum((a - e) * np.log(a / e)))
+
+
+def reference_profile(
+    X: pd.DataFrame,
+    feature_columns: List[str],
+    scores: Optional[np.ndarray] = None,
+    n_bins: int = N_BINS,
+) -> Dict:
+    """Histograms of every feature (and the model scores) on the training data."""
+    profile = {
+        "n_rows":   int(len(X)),
+        "features": {
+            c: _histogram(X[c].to_numpy(dtype=float), n_bins) for c in feature_columns
+        },
+    }
+    if scores is not None:
+        profile["score"] = _histogram(np.asarray(scores, dtype=float), n_bins)
+    return profile
+
+
+def _current_psi(hist: Dict, values: np.ndarray) -> float:
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return float("nan")
+    counts = _bin_counts(values, np.asarray(hist["edges"], dtype=float))
+    return psi(hist["props"], counts / counts.sum())
+
+
+def _status(value: float) -> str:
+    if value != value:
+        return "n/a"
+    if value > PSI_MAJOR:
+        return "major"
+    if value > PSI_MODERATE:
+        return "moderate"
+    return "stable"
+
+
+def drift_report(
+    profile: Dict,
+    feat_df: pd.DataFrame,
+    scores: Optional[np.ndarray] = None,
+    trained_at: Optional[str] = None,
+) -> Dict:
+    """
+    Compare current features / scores against the training *profile*.
+
+    Returns a dict with
+      features          DataFrame: feature, psi, status (sorted by psi)
+      score_psi         PSI of the model scores (NaN if not profiled)
+      model_age_days    days since *trained_at* (None if unknown)
+      needs_retraining  bool
+      reasons           human-readable list of why retraining is advised
+    """
+    rows = []
+    for name, hist in profile.get("features", {}).items():
+        value = _current_psi(hist, feat_df[name].to_numpy(dtype=float)) if name in feat_df else float("nan")
+        rows.append({"feature": name, "psi": round(value, 4), "status": _status(value)})
+    features = (pd.DataFrame(rows, columns=["feature", "psi", "status"])
+                .sort_values("psi", ascending=False, na_position="last")
+                .reset_index(drop=True))
+
+    score_psi = float("nan")
+    if scores is not None and "score" in profile:
+        score_psi = round(_current_psi(profile["score"], np.asarray(scores, dtype=float)), 4)
+
+    age_days = None
+    if trained_at:
+        try:
+            age_days = (datetime.now() - datetime.fromisoformat(str(trained_at))).days
+        except ValueError:
+            pass
+
+    reasons = [
+        f"{r.feature} distribution shifted (PSI {r.psi:.2f})"
+        for r in features.itertuples() if r.status == "major"
+    ]
+    if score_psi == score_psi and score_psi > PSI_MAJOR:
+        reasons.append(f"score distribution shifted (PSI {score_psi:.2f})")
+    if age_days is not None and age_days > MAX_MODEL_AGE_DAYS:
+        reasons.append(f"model is {age_days} days old")
+
+    return {
+        "features":         features,
+        "score_psi":        score_psi,
+        "model_age_days":   age_days,
+        "needs_retraining": bool(reasons),
+        "reasons":          reasons,
+    }
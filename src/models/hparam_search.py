@@ -0,0 +1,254 @@
+"""
+Hyperparameter search for the XGBoost priority-ranking model
+=============================================================
+Budgeted random search or successive halving over tree depth, learning
+rate, number of trees and regularisation, run in a process pool.
+
+Design decisions
+----------------
+- One fixed hold-out split (same rules as XGBPriorityModel.train); every
+  trial early-stops on it, so `n_estimators` is a budget, not a guess.
+- Trials run single-threaded (n_jobs=1) in separate processes: one worker
+  per core, no nested thread pools.
+- Fully deterministic for a given SEED: configs are drawn from a seeded
+  generator and results are ordered by trial id, not completion order.
+- Selection metric is the mean NDCG@10 per equipment type (global NDCG@10
+  saturates quickly); AUC breaks ties.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.models.xgb_ranking_model import (
+    EARLY_STOPPING_ROUNDS,
+    RANK_PARAMS,
+    SEED,
+    XGB_PARAMS,
+    _to_probability,
+    group_train_test_split,
+    mean_group_ndcg,
+    ndcg_at_k,
+    query_ids,
+)
+
+logger = logging.getLogger(__name__)
+
+# (kind, low, high) for continuous dims, list of choices otherwise
+SEARCH_SPACE: Dict = {
+    "max_depth":        [3, 4, 5, 6, 8],
+    "learning_rate":    ("log", 0.01, 0.3),
+    "min_child_weight": [1, 3, 5, 10],
+    "subsample":        ("uniform", 0.6, 1.0),
+    "colsample_bytree": ("uniform", 0.6, 1.0),
+    "reg_alpha":        ("log", 1e-3, 10.0),
+    "reg_lambda":       ("log", 1e-2, 10.0),
+}
+N_ESTIMATORS_CHOICES = [200, 400, 800]
+
+
+def sample_configs(n: int, seed: int = SEED, random_estimators: bool = True) -> List[Dict]:
+    """Draw *n* parameter sets from SEARCH_SPACE (deterministic for *seed*)."""
+    rng = np.random.default_rng(seed)
+    configs = []
+    for _ in range(n):
+        cfg: Dict = {}
+        for name, spec in SEARCH_SPACE.items():
+            if isinstance(spec, list):
+                cfg[name] = spec[int(rng.integers(len(spec)))]
+            elif spec[0] == "log":
+                cfg[name] = float(math.exp(rng.uniform(math.log(spec[1]), math.log(spec[2]))))
+            else:
+                cfg[name] = float(rng.uniform(spec[1], spec[2]))
+        if random_estimators:
+            cfg["n_estimators"] = N_ESTIMATORS_CHOICES[int(rng.integers(len(N_ESTIMATORS_CHOICES)))]
+        configs.append(cfg)
+    return configs
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Worker side
+# ─────────────────────────────────────────────────────────────────────────────
+
+_DATA: Dict = {}   # per-process copy of the split, set by _init_worker
+
+
+def _init_worker(data: Dict) -> None:
+    _DATA.clear()
+    _DATA.update(data)
+
+
+def _run_trial(trial_id: int, rung: int, cfg: Dict) -> Dict:
+    """Train one config with early stopping on the hold-out and score it."""
+    import xgboost as xgb
+    from sklearn.metrics import roc_auc_score
+
+    d = _DATA
+    objective = d["objective"]
+    ranking = objective.startswith("rank:")
+    base = RANK_PARAMS if ranking else XGB_PARAMS
+    params = {
+        **base,
+        **cfg,
+        "objective": objective,
+        "n_jobs": 1,
+        "random_state": SEED,
+        "early_stopping_rounds": EARLY_STOPPING_ROUNDS,
+    }
+    if not ranking:
+        params["scale_pos_weight"] = d["scale_pos_weight"]
+
+    start = time.perf_counter()
+    if ranking:
+        model = xgb.XGBRanker(**params)
+        model.fit(
+            d["X_tr"], d["y_tr"], qid=d["g_tr"],
+            eval_set=[(d["X_te"], d["y_te"])], eval_qid=[d["g_te"]], verbose=False,
+        )
+    else:
+        model = xgb.XGBClassifier(**params)
+        model.fit(d["X_tr"], d["y_tr"], eval_set=[(d["X_te"], d["y_te"])], verbose=False)
+    best_it = int(getattr(model, "best_iteration", params["n_estimators"] - 1))
+    raw = model.get_booster().inplace_predict(d["X_te"], iteration_range=(0, best_it + 1))
+    wall = time.perf_counter() - start
+
+    y_te = d["y_te"]
+    y_prob = _to_probability(raw, objective)
+    auc = roc_auc_score(y_te, y_prob) if len(np.unique(y_te)) > 1 else float("nan")
+    return {
+        "trial":              trial_id,
+        "rung":               rung,
+        "n_estimators":       int(cfg["n_estimators"]),
+        "best_iteration":     best_it + 1,
+        "ndcg_at_10":         ndcg_at_k(y_te, y_prob, k=min(10, len(y_te))),
+        "ndcg_at_10_by_type": mean_group_ndcg(y_te, y_prob, d["g_te"], k=10),
+        "auc":                float(auc),
+        "wall_time_s":        round(wall, 3),
+        **{k: v for k, v in cfg.items() if k != "n_estimators"},
+    }
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Driver
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _prepare_split(X: pd.DataFrame, y: pd.Series, feature_columns: List[str],
+                   objective: str, eval_split: float, seed: int) -> Dict:
+    """Hold-out split shared by all trials (mirrors XGBPriorityModel.train)."""
+    groups = query_ids(X, "_equipment_type")
+    Xf = X[feature_columns].to_numpy(dtype=np.float32)
+    yv = y.astype(int).to_numpy()
+    if objective.startswith("rank:"):
+        tr, te = group_train_test_split(groups, eval_split, seed=seed)
+        # XGBRanker needs rows sorted by query id
+        tr = tr[np.argsort(groups[tr], kind="stable")]
+        te = te[np.argsort(groups[te], kind="stable")]
+    else:
+        from sklearn.model_selection import train_test_split
+        tr, te = train_test_split(np.arange(len(yv)), test_size=eval_split,
+                                  stratify=yv, random_state=seed)
+    y_tr = yv[tr]
+    return {
+        "objective": objective,
+        "X_tr": Xf[tr], "y_tr": y_tr, "g_tr": groups[tr],
+        "X_te": Xf[te], "y_te": yv[te], "g_te": groups[te],
+        "scale_pos_weight": float((y_tr == 0).sum() / max((y_tr == 1).sum(), 1)),
+    }
+
+
+def _score(row: Dict) -> tuple:
+    """Sort key: per-type NDCG@10 (global NDCG@10 if undefined), then AUC."""
+    primary = row["ndcg_at_10_by_type"]
+    if primary != primary:   # NaN
+        primary = row["ndcg_at_10"]
+    auc = row["auc"] if row["auc"] == row["auc"] else -1.0
+    return (primary, auc)
+
+
+def _run_batch(jobs: List[tuple], data: Dict, n_workers: int) -> List[Dict]:
+    """Run (trial_id, rung, cfg) jobs, in a process pool when n_workers > 1."""
+    if n_workers <= 1 or len(jobs) <= 1:
+        _init_worker(data)
+        return [_run_trial(*job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=min(n_workers, len(jobs)),
+                             initializer=_init_worker, initargs=(data,)) as pool:
+        futures = [pool.submit(_run_trial, *job) for job in jobs]
+        return [f.result() for f in futures]
+
+
+def run_search(
+    X: pd.DataFrame,
+    y: pd.Series,
+    feature_columns: List[str],
+    objective: str = "binary:logistic",
+    strategy: str = "halving",
+    n_trials: int = 27,
+    max_estimators: int = 800,
+    eta: int = 3,
+    n_workers: Optional[int] = None,
+    eval_split: float = 0.2,
+    seed: int = SEED,
+    log: Callable[[str], None] = logger.info,
+) -> pd.DataFrame:
+    """
+    Run the search and return the leaderboard (best first).
+
+    strategy="random"  : *n_trials* configs, each with a sampled tree budget.
+    strategy="halving" : successive halving — all configs start with a small
+                         tree budget, the best 1/eta advance to eta× the
+                         budget until *max_estimators* is reached.
+
+    The leaderboard has one row per evaluated (trial, rung) with the params,
+    best_iteration, ndcg_at_10, ndcg_at_10_by_type, auc and wall_time_s.
+    """
+    if strategy not in ("random", "halving"):
+        raise ValueError(f"Unknown search strategy {strategy!r}")
+    n_workers = n_workers or min(os.cpu_count() or 1, n_trials)
+    data = _prepare_split(X, y, feature_columns, objective, eval_split, seed)
+
+    results: List[Dict] = []
+    if strategy == "random":
+        configs = sample_configs(n_trials, seed)
+        log(f"Random search: {n_trials} trials on {n_workers} worker(s)")
+        results = _run_batch([(i, 0, c) for i, c in enumerate(configs)], data, n_workers)
+    else:
+        configs = sample_configs(n_trials, seed, random_estimators=False)
+        n_rungs = max(1, int(math.floor(math.log(max(n_trials, 1), eta))) + 1)
+        survivors = list(range(n_trials))
+        for rung in range(n_rungs):
+            budget = max(10, int(max_estimators / eta ** (n_rungs - 1 - rung)))
+            log(f"Successive halving rung {rung + 1}/{n_rungs}: "
+                f"{len(survivors)} config(s) × {budget} trees on {n_workers} worker(s)")
+            jobs = [(i, rung, {**configs[i], "n_estimators": budget}) for i in survivors]
+            rung_results = _run_batch(jobs, data, n_workers)
+            results.extend(rung_results)
+            if rung < n_rungs - 1:
+                ranked = sorted(rung_results, key=lambda r: (_score(r), -r["trial"]), reverse=True)
+                keep = max(1, int(math.ceil(len(ranked) / eta)))
+                survivors = sorted(r["trial"] for r in ranked[:keep])
+
+    board = pd.DataFrame(results)
+    keys = [(r["rung"], *_score(r), -r["trial"]) for r in results]
+    order = sorted(range(len(results)), key=lambda i: keys[i], reverse=True)
+    board = board.iloc[order].reset_index(drop=True)
+    board.insert(0, "position", np.arange(1, len(board) + 1))
+    return board
+
+
+def best_params(board: pd.DataFrame) -> Dict:
+    """Parameters of the leaderboard winner, with its early-stopped tree count."""
+    top = board.iloc[0]
+    params = {
+        k: int(top[k]) if isinstance(SEARCH_SPACE[k], list) else float(top[k])
+        for k in SEARCH_SPACE
+    }
+    params["n_estimators"] = int(top["best_iteration"])
+    return params
@@ -0,0 +1,197 @@
+"""
+Model registry for the XGBoost priority-ranking model
+======================================================
+Versioned model artifacts under ``models/registry/`` with an "active"
+pointer that the app follows.
+
+Layout
+------
+    models/registry/
+        ACTIVE                          ← version id, or "heuristic"
+        20260301-101500-3fa2c1d9/
+            model.ubj                   ← native booster
+            model.meta.json             ← metadata, metrics, data fingerprint
+
+Design decisions
+----------------
+- A version directory is written under a temporary name and renamed into
+  place, so readers never see a half-written artifact.
+- The ACTIVE pointer is replaced with ``os.replace`` (atomic on POSIX and
+  Windows); MLRankingService re-reads it on each scoring request and
+  hot-swaps in-process when it changes.
+- "heuristic" is an explicit pointer value, replacing the old trick of
+  renaming the model file to ``.bak`` to force the fallback scorer.
+- Without an ACTIVE pointer the registry falls back to the pre-registry
+  single-file model (``settings.XGB_MODEL_PATH``), so existing installs
+  keep working until their first registered training run.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+_ROOT = Path(__file__).resolve().parent.parent.parent
+DEFAULT_REGISTRY_DIR = _ROOT / "models" / "registry"
+LEGACY_MODEL_PATH    = _ROOT / "models" / "xgb_priority_v1.ubj"
+
+ACTIVE_FILE   = "ACTIVE"
+HEURISTIC     = "heuristic"
+MODEL_FILE    = "model.ubj"
+META_FILE     = "model.meta.json"
+
+
+class ModelRegistry:
+    """Versioned store of trained models plus the pointer to the active one."""
+
+    def __init__(
+        self,
+        root: str | Path = DEFAULT_REGISTRY_DIR,
+        legacy_model_path: Optional[str | Path] = LEGACY_MODEL_PATH,
+    ):
+        self.root = Path(root)
+        self.legacy_model_path = Path(legacy_model_path) if legacy_model_path else None
+
+    # ── Versions ──────────────────────────────────────────────────────────────
+
+    def register(
+        self,
+        model,
+        data_fingerprint: Optional[str] = None,
+        activate: bool = True,
+    ) -> str:
+        """
+        Store a trained XGBPriorityModel as a new version and return its id.
+
+        The data fingerprint (see feature_engineering.data_fingerprint) is
+        recorded in the metadata so a version can be matched to its data.
+        """
+        meta = model._meta
+        trained = meta.get("trained_at") or datetime.now().isoformat()
+        stamp = datetime.fromisoformat(trained).strftime("%Y%m%d-%H%M%S")
+        version = f"{stamp}-{(data_fingerprint or 'nodata')[:8]}"
+        n = 2
+        while (self.root / version).exists():
+            version = f"{stamp}-{(data_fingerprint or 'nodata')[:8]}-{n}"
+            n += 1
+
+        meta["registry_version"] = version
+        meta["data_fingerprint"] = data_fingerprint
+        meta["registered_at"]    = datetime.now().isoformat()
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.root / f".{version}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir()
+        model.save(model_path=tmp / MODEL_FILE, meta_path=tmp / META_FILE)
+        os.replace(tmp, self.root / version)
+        model.model_path = self.root / version / MODEL_FILE
+        model.meta_path  = self.root / version / META_FILE
+        logger.info("Registered model version %s", version)
+
+        if activate:
+            self.activate(version)
+        return version
+
+    def versions(self) -> List[str]:
+        """All registered version ids, oldest first."""
+        if not self.root.exists():
+            return []
+        return sorted(
+            p.name for p in self.root.iterdir()
+            if p.is_dir() and not p.name.startswith(".") and (p / MODEL_FILE).exists()
+        )
+
+    def model_path(self, version: str) -> Path:
+        return self.root / version / MODEL_FILE
+
+    def get_meta(self, version: str) -> Dict:
+        """Metadata JSON of *version* ({} if missing or unreadable)."""
+        try:
+            return json.loads((self.root / version / META_FILE).read_text())
+        except Exception:
+            return {}
+
+    def list_versions(self) -> pd.DataFrame:
+        """One row per version: trained_at, objective, key metrics, fingerprint, active flag."""
+        active = self.active_version()
+        rows = []
+        for v in self.versions():
+            meta = self.get_meta(v)
+            metrics = meta.get("metrics", {})
+            rows.append({
+                "version":          v,
+                "trained_at":       meta.get("trained_at"),
+                "objective":        meta.get("objective", "binary:logistic"),
+                "auc_test":         metrics.get("auc_test"),
+                "ndcg_at_10":       metrics.get("ndcg_at_10"),
+                "data_fingerprint": meta.get("data_fingerprint"),
+                "active":           v == active,
+            })
+        return pd.DataFrame(rows, columns=["version", "trained_at", "objective", "auc_test",
+                                           "ndcg_at_10", "data_fingerprint", "active"])
+
+    # ── Active pointer ────────────────────────────────────────────────────────
+
+    @property
+    def _pointer(self) -> Path:
+        return self.root / ACTIVE_FILE
+
+    def active_version(self) -> Optional[str]:
+        """Version id, HEURISTIC, or None when no pointer has been written yet."""
+        try:
+            value = self._pointer.read_text().strip()
+        except FileNotFoundError:
+            return None
+        return value or None
+
+    def pointer_stamp(self) -> Optional[Tuple[int, int]]:
+        """
+        (inode, mtime ns) of the ACTIVE pointer, None without one.
+
+        Every `activate` replaces the file, so the stamp changes even when
+        the same version is activated again within the mtime resolution.
+        """
+        try:
+            st = self._pointer.stat()
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def activate(self, version: str) -> None:
+        """Point the app at *version* (or HEURISTIC) atomically."""
+        if version != HEURISTIC and not self.model_path(version).exists():
+            raise KeyError(f"Unknown model version: {version}")
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self._pointer.with_name(ACTIVE_FILE + ".tmp")
+        tmp.write_text(version + "\n")
+        os.replace(tmp, self._pointer)
+        logger.info("Active model → %s", version)
+
+    def deactivate(self) -> None:
+        """Switch the app to heuristic scoring without touching any artifact."""
+        self.activate(HEURISTIC)
+
+    def active_model_path(self) -> Optional[Path]:
+        """Path of the model the app should serve, or None for heuristic mode."""
+        active = self.active_version()
+        if active == HEURISTIC:
+            return None
+        if active is not None:
+            path = self.model_path(active)
+            if path.exists():
+                return path
+            logger.warning("Active model version %s is missing", active)
+            return None
+        if self.legacy_model_path is not None and self.legacy_model_path.exists():
+            return self.legacy_model_path
+        return None
@@ -7,11 +7,16 @@ probability [0, 1] used to rank customers/equipment by likelihood of
 
 Design decisions
 ----------------
-- Pointwise binary classifier (not rank:pairwise) for simplicity and
+- Pointwise binary classifier by default for simplicity and
   interpretability; probability output is directly usable as a ranking score.
+- Optional learning-to-rank mode (rank:ndcg / rank:pairwise) with one query
+  per EquipmentType and a group-aware train/test split, matching how the
+  rankings are consumed.  Margins are squashed to [0, 1] for display.
 - Single global model, results filtered/sorted per EquipmentType.
 - CPU-only (tree_method='hist').
-- Persisted via joblib + metadata JSON.
+- Persisted in XGBoost's native booster format (UBJ, or JSON for a
+  ``.json`` path) + metadata JSON; loaded lazily into a ``Booster`` and
+  scored with ``inplace_predict``.  Legacy joblib pickles still load.
 - SHAP values computed for business-facing explanations.
 """
 
@@ -19,14 +24,17 @@ from __future__ import annotations
 
 import json
 import logging
+import os
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
-import joblib
 import numpy as np
 import pandas as pd
 
+from src.models.drift import reference_profile
+from src.models.ranking_metrics import bootstrap_ci, grouped_ranking_metrics
+
 logger = logging.getLogger(__name__)
 
 # ─ optional heavy imports ─────────────────────────────────────────────────────
@@ -45,7 +53,7 @@ except ImportError:
     logger.warning("shap not installed – SHAP explainability disabled")
 
 try:
-    from sklearn.model_selection import StratifiedKFold, cross_val_score
+    from sklearn.model_selection import StratifiedKFold
     from sklearn.metrics import roc_auc_score, precision_score
     SKLEARN_AVAILABLE = True
 except ImportError:
@@ -55,7 +63,7 @@ except ImportError:
 # Constants
 # ─────────────────────────────────────────────────────────────────────────────
 
-DEFAULT_MODEL_PATH = Path(__file__).parent.parent.parent / "models" / "xgb_priority_v1.pkl"
+DEFAULT_MODEL_PATH = Path(__file__).parent.parent.parent / "models" / "xgb_priority_v1.ubj"
 DEFAULT_META_PATH  = DEFAULT_MODEL_PATH.with_suffix(".meta.json")
 
 SEED = 42
@@ -78,6 +86,31 @@ XGB_PARAMS: Dict = {
     "verbosity":        0,
 }
 
+# Learning-to-rank mode: one query per equipment type.  The listwise
+# objective optimises exactly what the UI consumes (order within a type),
+# so it converges with far fewer trees than the pointwise classifier.
+RANK_PARAMS: Dict = {
+    "objective":        "rank:ndcg",
+    "eval_metric":      "ndcg@10",
+    "tree_method":      "hist",
+    "max_depth":        5,
+    "learning_rate":    0.1,
+    "n_estimators":     150,
+    "subsample":        0.8,
+    "colsample_bytree": 0.8,
+    "min_child_weight": 5,
+    "reg_alpha":        0.1,
+    "reg_lambda":       1.0,
+    "random_state":     SEED,
+    "n_jobs":           -1,
+    "verbosity":        0,
+}
+
+SUPPORTED_OBJECTIVES = ("binary:logistic", "rank:ndcg", "rank:pairwise")
+
+# Trees without validation improvement before a fold (or search trial) stops
+EARLY_STOPPING_ROUNDS = 30
+
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Evaluation helpers
@@ -106,6 +139,194 @@ def ndcg_at_k(y_true: np.ndarray, y_score: np.ndarray, k: int = 10) -> float:
     return dcg / idcg if idcg > 0 else 0.0
 
 
+def top_k_order(y_score: np.ndarray, k: Optional[int] = None) -> np.ndarray:
+    """
+    Indices of the *k* highest scores, best first.
+
+    Uses ``argpartition`` so only the selected k items are fully sorted
+    (O(n + k log k) instead of O(n log n)).  ``k=None`` sorts everything.
+    """
+    y_score = np.asarray(y_score)
+    n = len(y_score)
+    if k is None or k >= n:
+        return np.argsort(-y_score, kind="stable")
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    part = np.argpartition(-y_score, k - 1)[:k]
+    return part[np.argsort(-y_score[part], kind="stable")]
+
+
+def mean_group_ndcg(
+    y_true: np.ndarray,
+    y_score: np.ndarray,
+    groups: np.ndarray,
+    k: int = 10,
+) -> float:
+    """Mean NDCG@K over query groups (groups without positives are skipped)."""
+    per_group = grouped_ranking_metrics(y_true, y_score, groups, k=k)
+    vals = per_group.loc[(per_group["n_items"] >= 2) & (per_group["n_positive"] > 0), "ndcg_at_k"]
+    return float(vals.mean()) if len(vals) else float("nan")
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Learning-to-rank helpers
+# ─────────────────────────────────────────────────────────────────────────────
+
+def query_ids(X: pd.DataFrame, group_column: str = "_equipment_type") -> np.ndarray:
+    """
+    Integer query id per row (one query per equipment type).
+
+    Falls back to the encoded feature column, then to a single query.
+    """
+    col = next((c for c in [group_column, "equipment_type_enc"] if c in X.columns), None)
+    if col is None:
+        return np.zeros(len(X), dtype=np.int64)
+    return pd.factorize(X[col].astype(str), sort=True)[0].astype(np.int64)
+
+
+def _shuffled_group_positions(groups: np.ndarray, seed: int = SEED) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (position of each row inside its shuffled group, size of that group)."""
+    n = len(groups)
+    pos  = np.zeros(n, dtype=np.int64)
+    size = np.zeros(n, dtype=np.int64)
+    if n == 0:
+        return pos, size
+    perm = np.random.default_rng(seed).permutation(n)
+    perm = perm[np.argsort(groups[perm], kind="stable")]
+    g = groups[perm]
+    starts = np.r_[0, np.flatnonzero(np.diff(g)) + 1]
+    sizes  = np.diff(np.r_[starts, n])
+    pos[perm]  = np.arange(n) - np.repeat(starts, sizes)
+    size[perm] = np.repeat(sizes, sizes)
+    return pos, size
+
+
+def group_train_test_split(
+    groups: np.ndarray,
+    test_size: float = 0.2,
+    seed: int = SEED,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Split row positions *within* every query group.
+
+    Each group with ≥ 2 rows contributes ~test_size of its rows (at least
+    one) to the test set, so every equipment type is ranked on both sides.
+    Single-row groups stay in train.
+    """
+    pos, size = _shuffled_group_positions(groups, seed)
+    n_test = np.minimum(np.maximum(np.round(size * test_size).astype(np.int64), 1), size - 1)
+    is_test = pos < n_test
+    return np.flatnonzero(~is_test), np.flatnonzero(is_test)
+
+
+def _to_probability(raw: np.ndarray, objective: str) -> np.ndarray:
+    """Map booster output to [0, 1] (ranking margins go through a sigmoid)."""
+    if objective.startswith("rank:"):
+        return 1.0 / (1.0 + np.exp(-raw))
+    return raw
+
+
+def _fit_ranker(
+    params: Dict,
+    X: pd.DataFrame,
+    y: pd.Series,
+    groups: np.ndarray,
+    eval_set: Optional[Tuple[pd.DataFrame, pd.Series, np.ndarray]] = None,
+) -> "xgb.XGBRanker":
+    """Fit an XGBRanker; rows are sorted by query id as XGBoost requires."""
+    order = np.argsort(groups, kind="stable")
+    fit_kw: Dict = {}
+    if eval_set is not None:
+        X_e, y_e, g_e = eval_set
+        e_order = np.argsort(g_e, kind="stable")
+        fit_kw = {"eval_set": [(X_e.iloc[e_order], y_e.iloc[e_order])], "eval_qid": [g_e[e_order]]}
+    model = xgb.XGBRanker(**params)
+    model.fit(X.iloc[order], y.iloc[order], qid=groups[order], verbose=False, **fit_kw)
+    return model
+
+
+def _fit_model(
+    params: Dict,
+    X: pd.DataFrame,
+    y: pd.Series,
+    groups: np.ndarray,
+    ranking: bool,
+    eval_set: Optional[Tuple[pd.DataFrame, pd.Series, np.ndarray]] = None,
+):
+    """Fit an XGBRanker (ranking mode) or XGBClassifier."""
+    if ranking:
+        return _fit_ranker(params, X, y, groups, eval_set=eval_set)
+    model = xgb.XGBClassifier(**params)
+    fit_kw = {"eval_set": [(eval_set[0], eval_set[1])]} if eval_set is not None else {}
+    model.fit(X, y, verbose=False, **fit_kw)
+    return model
+
+
+def _cv_fold_ids(y: np.ndarray, groups: np.ndarray, n_splits: int, ranking: bool) -> np.ndarray:
+    """Fold id per row: stratified by label, or spread within query groups for ranking."""
+    if ranking:
+        pos, _ = _shuffled_group_positions(groups, SEED)
+        return pos % n_splits
+    folds = np.zeros(len(y), dtype=np.int64)
+    cv = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=SEED)
+    for f, (_, va) in enumerate(cv.split(np.zeros(len(y)), y)):
+        folds[va] = f
+    return folds
+
+
+def _thread_budget(n_tasks: int) -> Tuple[int, int]:
+    """
+    Split the CPU cores between concurrent fits and XGBoost's own threads.
+
+    Returns (parallel_fits, threads_per_fit) with the product ≤ cpu_count,
+    so folds never oversubscribe the machine.
+    """
+    cpus = os.cpu_count() or 1
+    workers = max(1, min(n_tasks, cpus))
+    return workers, max(1, cpus // workers)
+
+
+def _cv_early_stopping(
+    params: Dict,
+    X: pd.DataFrame,
+    y: pd.Series,
+    groups: np.ndarray,
+    folds: np.ndarray,
+    ranking: bool,
+) -> Tuple[np.ndarray, List[int]]:
+    """
+    Fit one early-stopped model per fold, concurrently.
+
+    Returns (AUC per fold, best tree count per fold).  Folds run in a thread
+    pool (XGBoost releases the GIL while training) with the core budget from
+    `_thread_budget`.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    fold_ids = [f for f in np.unique(folds) if not (folds == f).all()]
+    workers, threads = _thread_budget(len(fold_ids))
+    fold_params = {**params, "n_jobs": threads, "early_stopping_rounds": EARLY_STOPPING_ROUNDS}
+
+    def _one(f):
+        va = folds == f
+        m = _fit_model(fold_params, X[~va], y[~va], groups[~va], ranking,
+                       eval_set=(X[va], y[va], groups[va]))
+        n_trees = int(getattr(m, "best_iteration", fold_params["n_estimators"] - 1)) + 1
+        if y[va].nunique() < 2:
+            return np.nan, n_trees
+        raw = m.get_booster().inplace_predict(
+            X[va].to_numpy(dtype=np.float32), iteration_range=(0, n_trees)
+        )
+        return roc_auc_score(y[va], raw), n_trees
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_one, fold_ids))
+
+    scores = np.array([r[0] for r in results], dtype=float)
+    scores = scores[~np.isnan(scores)] if (~np.isnan(scores)).any() else np.array([np.nan])
+    return scores, [r[1] for r in results]
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Core model class
 # ─────────────────────────────────────────────────────────────────────────────
@@ -120,10 +341,18 @@ class XGBPriorityModel:
     ):
         self.model_path = Path(model_path)
         self.meta_path  = Path(meta_path)
-        self.model: Optional["xgb.XGBClassifier"]  = None
+        self.model: Optional["xgb.XGBClassifier"]  = None   # set after train() only
+        self._booster: Optional["xgb.Booster"]     = None   # scoring handle (lazy after load)
+        self._booster_path: Optional[Path]         = None
         self.feature_columns: List[str] = []
         self.feature_importances_: Optional[pd.Series] = None
         self._meta: dict = {}
+        self._explainer = None   # shap.TreeExplainer, built once per loaded model
+
+    @property
+    def version_id(self) -> str:
+        """Identifier of the trained/loaded model (version + training timestamp)."""
+        return f"{self._meta.get('model_version', 'unknown')}@{self._meta.get('trained_at', '')}"
 
     # ── Training ──────────────────────────────────────────────────────────────
 
@@ -134,6 +363,9 @@ class XGBPriorityModel:
         feature_columns: List[str],
         eval_split: float = 0.2,
         data_snapshot_id: str = "unknown",
+        objective: str = "binary:logistic",
+        group_column: str = "_equipment_type",
+        params: Optional[Dict] = None,
     ) -> Dict:
         """
         Train the XGBoost model with early stopping and cross-validation.
@@ -145,78 +377,107 @@ class XGBPriorityModel:
         feature_columns   : Ordered list of feature column names used
         eval_split        : Fraction held out as a temporal/random test set
         data_snapshot_id  : Identifier of the data version used for training
+        objective         : "binary:logistic" (pointwise classifier) or a
+                            learning-to-rank objective ("rank:ndcg",
+                            "rank:pairwise") with one query per equipment type
+        group_column      : Column defining the ranking queries
+        params            : Overrides for XGB_PARAMS / RANK_PARAMS (e.g. the
+                            winner of a hyperparameter search)
 
         Returns
         -------
-        metrics : dict with auc_cv, auc_test, precision_at_10, ndcg_at_10
+        metrics : dict with auc_cv, auc_test, precision_at_10, ndcg_at_10,
+                  ndcg_at_10_by_type and ci_by_type ({metric: {mean, ci_low,
+                  ci_high}}, 95% bootstrap CIs of the per-type test metrics)
         """
         if not XGB_AVAILABLE:
             raise ImportError("xgboost is required for training")
+        if objective not in SUPPORTED_OBJECTIVES:
+            raise ValueError(f"Unsupported objective {objective!r}; use one of {SUPPORTED_OBJECTIVES}")
 
+        ranking = objective.startswith("rank:")
+        groups  = query_ids(X, group_column)
         X = X[feature_columns].astype(float)
         y = y.astype(int)
 
-        logger.info("Training XGBoost on %d samples, %d features", len(X), len(feature_columns))
+        logger.info("Training XGBoost (%s) on %d samples, %d features", objective, len(X), len(feature_columns))
         logger.info("Label distribution: %d pos / %d neg", y.sum(), (y == 0).sum())
 
-        # ── Train / test split (stratified random; swap for time-split later) ──
-        from sklearn.model_selection import train_test_split
-        X_tr, X_te, y_tr, y_te = train_test_split(
-            X, y, test_size=eval_split, stratify=y, random_state=SEED
-        )
-
-        # ── Adjust class weight for imbalance ─────────────────────────────────
-        neg, pos = (y_tr == 0).sum(), (y_tr == 1).sum()
-        scale_pos = neg / max(pos, 1)
-
-        params = {**XGB_PARAMS, "scale_pos_weight": scale_pos}
-
-        model = xgb.XGBClassifier(**params)
-
-        # Early stopping on hold-out
-        model.fit(
-            X_tr, y_tr,
-            eval_set=[(X_te, y_te)],
-            verbose=False,
-        )
+        # ── Train / test split ────────────────────────────────────────────────
+        # Ranking: split inside every query group so each equipment type is
+        # represented on both sides.  Classifier: stratified random split.
+        if ranking:
+            tr_idx, te_idx = group_train_test_split(groups, eval_split, seed=SEED)
+            if len(te_idx) == 0:
+                raise ValueError("Ranking mode needs at least one equipment type with ≥ 2 rows")
+        else:
+            from sklearn.model_selection import train_test_split
+            tr_idx, te_idx = train_test_split(
+                np.arange(len(X)), test_size=eval_split, stratify=y, random_state=SEED
+            )
+        X_tr, X_te = X.iloc[tr_idx], X.iloc[te_idx]
+        y_tr, y_te = y.iloc[tr_idx], y.iloc[te_idx]
+        g_tr, g_te = groups[tr_idx], groups[te_idx]
 
-        # ── Cross-validation AUC ──────────────────────────────────────────────
+        if ranking:
+            params = {**RANK_PARAMS, **(params or {}), "objective": objective}
+        else:
+            # ── Adjust class weight for imbalance ─────────────────────────────
+            neg, pos = (y_tr == 0).sum(), (y_tr == 1).sum()
+            scale_pos = neg / max(pos, 1)
+            params = {**XGB_PARAMS, **(params or {}), "scale_pos_weight": scale_pos}
+
+        # ── Cross-validation with early stopping ──────────────────────────────
+        # Each fold early-stops on its own validation part; the final model is
+        # then fitted once with the median best tree count (the hold-out stays
+        # untouched until evaluation).
         # Cap n_splits so we never ask for more folds than training samples
         min_class_count = int(min(y_tr.sum(), (y_tr == 0).sum()))
         n_cv_splits = max(2, min(5, min_class_count))
         if n_cv_splits >= 2 and len(X_tr) >= n_cv_splits:
-            cv = StratifiedKFold(n_splits=n_cv_splits, shuffle=True, random_state=SEED)
-            cv_scores = cross_val_score(
-                xgb.XGBClassifier(**params), X_tr, y_tr,
-                cv=cv, scoring="roc_auc", n_jobs=-1
-            )
+            folds = _cv_fold_ids(y_tr.to_numpy(), g_tr, n_cv_splits, ranking)
+            cv_scores, cv_trees = _cv_early_stopping(params, X_tr, y_tr, g_tr, folds, ranking)
+            n_trees = max(1, int(np.median(cv_trees)))
         else:
             logger.warning("Too few samples for CV (%d train rows) – skipping cross-validation", len(X_tr))
             cv_scores = np.array([np.nan])
+            cv_trees  = []
+            n_trees   = int(params["n_estimators"])
+
+        params = {**params, "n_estimators": n_trees}
+        model = _fit_model(params, X_tr, y_tr, g_tr, ranking)
 
         # ── Hold-out evaluation ───────────────────────────────────────────────
-        y_prob   = model.predict_proba(X_te)[:, 1]
-        auc_test = roc_auc_score(y_te, y_prob)
+        y_prob   = _to_probability(model.get_booster().inplace_predict(X_te.to_numpy(dtype=np.float32)), objective)
+        auc_test = roc_auc_score(y_te, y_prob) if y_te.nunique() > 1 else np.nan
         eval_k   = min(10, len(y_te))          # cap k to actual test-set size
         p_at_10  = precision_at_k(y_te.to_numpy(), y_prob, k=eval_k)
         ndcg     = ndcg_at_k(y_te.to_numpy(), y_prob, k=eval_k)
+        ndcg_grp = mean_group_ndcg(y_te.to_numpy(), y_prob, g_te, k=10)
+        # Per-type metrics with bootstrap CIs (groups resampled), so runs can
+        # be compared beyond the noise of a small hold-out
+        ci = bootstrap_ci(grouped_ranking_metrics(y_te.to_numpy(dtype=float), y_prob, g_te, k=10))
 
         metrics = {
-            "auc_cv_mean":    float(cv_scores.mean()),
-            "auc_cv_std":     float(cv_scores.std()),
+            "auc_cv_mean":    float(np.mean(cv_scores)),
+            "auc_cv_std":     float(np.std(cv_scores)),
             "auc_test":       float(auc_test),
             "precision_at_10": float(p_at_10),
             "ndcg_at_10":     float(ndcg),
+            "ndcg_at_10_by_type": float(ndcg_grp),
+            "ci_by_type":     {m: {c: float(v) for c, v in row.items()} for m, row in ci.iterrows()},
             "n_estimators_used": int(model.n_estimators),
+            "n_estimators_cv": [int(t) for t in cv_trees],
             "train_size":     len(X_tr),
             "test_size":      len(X_te),
             "pos_rate_train": float(y_tr.mean()),
         }
 
         logger.info(
-            "Training done → AUC-CV: %.3f±%.3f | AUC-test: %.3f | P@10: %.3f | NDCG@10: %.3f",
+            "Training done → AUC-CV: %.3f±%.3f | AUC-test: %.3f | P@10: %.3f | NDCG@10: %.3f | NDCG@10/type: %.3f",
             metrics["auc_cv_mean"], metrics["auc_cv_std"],
-            metrics["auc_test"], metrics["precision_at_10"], metrics["ndcg_at_10"]
+            metrics["auc_test"], metrics["precision_at_10"], metrics["ndcg_at_10"],
+            metrics["ndcg_at_10_by_type"],
         )
 
         # ── Feature importance ────────────────────────────────────────────────
@@ -225,27 +486,48 @@ class XGBPriorityModel:
         ).sort_values(ascending=False)
 
         self.model          = model
+        self._booster       = model.get_booster()
+        self._booster_path  = None
         self.feature_columns = feature_columns
+        self._explainer     = None
+
+        # ── Reference distributions for drift monitoring ─────────────────────
+        all_scores = _to_probability(self._booster.inplace_predict(X.to_numpy(dtype=np.float32)), objective)
         self._meta = {
             "model_version":    "xgb_priority_v1",
             "trained_at":       datetime.now().isoformat(),
             "data_snapshot_id": data_snapshot_id,
+            "objective":        objective,
+            "group_column":     group_column if ranking else None,
             "feature_columns":  feature_columns,
             "xgb_params":       params,
             "metrics":          metrics,
             "feature_importance": self.feature_importances_.to_dict(),
+            "reference_profile": reference_profile(X, feature_columns, all_scores),
         }
 
         return metrics
 
     # ── Inference ─────────────────────────────────────────────────────────────
 
+    @property
+    def booster(self) -> "xgb.Booster":
+        """The underlying Booster, parsed from disk on first use after load()."""
+        if self._booster is None:
+            if self._booster_path is None:
+                raise RuntimeError("Model not trained or loaded. Call train() or load().")
+            if not XGB_AVAILABLE:
+                raise ImportError("xgboost is required for inference")
+            booster = xgb.Booster()
+            booster.load_model(bytearray(self._booster_path.read_bytes()))
+            self._booster = booster
+        return self._booster
+
     def predict_proba(self, X: pd.DataFrame) -> np.ndarray:
         """Return probability scores [0, 1] for each row in X."""
-        if self.model is None:
-            raise RuntimeError("Model not trained or loaded. Call train() or load().")
-        X_feat = X[self.feature_columns].astype(float)
-        return self.model.predict_proba(X_feat)[:, 1]
+        X_feat = X[self.feature_columns].to_numpy(dtype=np.float32)
+        raw = self.booster.inplace_predict(X_feat)
+        return _to_probability(raw, self._meta.get("objective", "binary:logistic"))
 
     def rank_by_equipment_type(
         self,
@@ -267,24 +549,21 @@ class XGBPriorityModel:
         Ranked DataFrame with columns:
           rank | company | equipment_type | country | equipment_age | priority_score
         """
-        df = feat_df.copy()
-        df["priority_score"] = (self.predict_proba(df) * 100).round(1)
-
-        # Filter
+        df = feat_df
+        # Filter before scoring so only the requested equipment type is predicted
         if equipment_type:
             mask = df["_equipment_type"].str.contains(equipment_type, case=False, na=False)
             df = df[mask]
 
-        df = df.sort_values("priority_score", ascending=False).reset_index(drop=True)
-        df.index += 1  # 1-based rank
+        scores = self.predict_proba(df)
+        order  = top_k_order(scores, top_k or None)
 
-        out = df[["_company", "_equipment_type", "_country", "_equipment_age", "priority_score"]].copy()
-        out.columns = ["company", "equipment_type", "country", "equipment_age", "priority_score"]
+        out = df.iloc[order][["_company", "_equipment_type", "_country", "_equipment_age"]].copy()
+        out.columns = ["company", "equipment_type", "country", "equipment_age"]
+        out["priority_score"] = (scores[order] * 100).round(1)
+        out.index = np.arange(1, len(out) + 1)  # 1-based rank
         out.insert(0, "rank", out.index)
 
-        if top_k:
-            out = out.head(top_k)
-
         return out
 
     def per_equipment_type_metrics(
@@ -294,45 +573,54 @@ class XGBPriorityModel:
         k: int = 10,
     ) -> pd.DataFrame:
         """
-        Compute Precision@K and NDCG@K broken down by EquipmentType.
+        Compute ranking metrics broken down by EquipmentType.
+
+        All groups are evaluated in one vectorised pass (see
+        src.models.ranking_metrics); Recall@K and average precision are
+        reported next to ROC-AUC, Precision@K and NDCG@K.
         """
-        df = feat_df.copy()
-        df["_label"]         = labels.values
-        df["priority_score"] = self.predict_proba(df)
-
-        rows = []
-        for eq_type, grp in df.groupby("_equipment_type"):
-            if len(grp) < 2:
-                continue
-            y_t = grp["_label"].to_numpy()
-            y_s = grp["priority_score"].to_numpy()
-            try:
-                auc  = roc_auc_score(y_t, y_s) if len(np.unique(y_t)) > 1 else np.nan
-            except Exception:
-                auc  = np.nan
-            p_k  = precision_at_k(y_t, y_s, k=min(k, len(grp)))
-            ndcg = ndcg_at_k(y_t, y_s, k=min(k, len(grp)))
-            rows.append({
-                "equipment_type": eq_type,
-                "n_items":        len(grp),
-                "n_positive":     int(y_t.sum()),
-                "roc_auc":        round(auc, 3) if not np.isnan(auc) else None,
-                f"precision_at_{k}": round(p_k, 3),
-                f"ndcg_at_{k}":    round(ndcg, 3),
-            })
-
-        return pd.DataFrame(rows).sort_values("n_items", ascending=False)
+        scores = self.predict_proba(feat_df)
+        per_group = grouped_ranking_metrics(
+            labels.to_numpy(dtype=float), scores, feat_df["_equipment_type"].to_numpy(), k=k
+        )
+        per_group = per_group[per_group["n_items"] >= 2]
+
+        out = pd.DataFrame({
+            "equipment_type":    per_group["group"],
+            "n_items":           per_group["n_items"],
+            "n_positive":        per_group["n_positive"],
+            "roc_auc":           per_group["roc_auc"].round(3).astype(object),
+            f"precision_at_{k}": per_group["precision_at_k"].round(3),
+            f"ndcg_at_{k}":      per_group["ndcg_at_k"].round(3),
+            f"recall_at_{k}":    per_group["recall_at_k"].round(3),
+            "average_precision": per_group["average_precision"].round(3),
+        })
+        out.loc[per_group["roc_auc"].isna(), "roc_auc"] = None
+        return out.sort_values("n_items", ascending=False, kind="stable").reset_index(drop=True)
 
     # ── SHAP explainability ───────────────────────────────────────────────────
 
     def compute_shap(self, X: pd.DataFrame) -> Optional[pd.DataFrame]:
-        """Return a DataFrame of SHAP values (one column per feature)."""
-        if not SHAP_AVAILABLE or self.model is None:
+        """
+        Return a DataFrame of SHAP values (one column per feature, log-odds units).
+
+        The TreeExplainer is built once and reused for every call on this
+        model.  Without shap installed, XGBoost's native TreeSHAP
+        (``pred_contribs``) produces the same values.
+        """
+        if self._booster is None and self._booster_path is None:
             return None
         try:
-            explainer   = shap.TreeExplainer(self.model)
-            X_feat      = X[self.feature_columns].astype(float)
-            shap_values = explainer.shap_values(X_feat)
+            X_feat = X[self.feature_columns].astype(float)
+            if SHAP_AVAILABLE:
+                if self._explainer is None:
+                    self._explainer = shap.TreeExplainer(self.booster)
+                shap_values = self._explainer.shap_values(X_feat)
+            elif XGB_AVAILABLE:
+                contribs    = self.booster.predict(xgb.DMatrix(X_feat), pred_contribs=True)
+                shap_values = contribs[:, :-1]   # last column is the bias term
+            else:
+                return None
             return pd.DataFrame(shap_values, columns=self.feature_columns, index=X.index)
         except Exception as e:
             logger.warning("SHAP computation failed: %s", e)
@@ -346,7 +634,11 @@ class XGBPriorityModel:
         meta_path:  Optional[str | Path] = None,
     ) -> Tuple[Path, Path]:
         """
-        Persist model artifact (joblib .pkl) and metadata JSON.
+        Persist the booster in XGBoost's native format and the metadata JSON.
+
+        The format follows the model path suffix: ``.json`` → JSON,
+        anything else → UBJ.  Feature columns and metadata are also stored
+        as booster attributes so the artifact is self-contained.
 
         Returns (model_path, meta_path).
         """
@@ -354,15 +646,18 @@ class XGBPriorityModel:
         ap = Path(meta_path)  if meta_path  else self.meta_path
         mp.parent.mkdir(parents=True, exist_ok=True)
 
-        artifact = {
-            "model":           self.model,
-            "feature_columns": self.feature_columns,
-            "meta":            self._meta,
-        }
-        joblib.dump(artifact, mp, protocol=4)
+        fmt = "json" if mp.suffix.lower() == ".json" else "ubj"
+        self._meta["model_format"] = fmt
+
+        booster = self.booster
+        booster.set_attr(
+            feature_columns=json.dumps(self.feature_columns),
+            meta=json.dumps(self._meta, default=str),
+        )
+        mp.write_bytes(bytes(booster.save_raw(raw_format=fmt)))
         ap.write_text(json.dumps(self._meta, indent=2, default=str))
 
-        logger.info("Model saved → %s", mp)
+        logger.info("Model saved → %s (%s)", mp, fmt)
         logger.info("Metadata   → %s", ap)
         return mp, ap
 
@@ -370,21 +665,63 @@ class XGBPriorityModel:
         self,
         model_path: Optional[str | Path] = None,
     ) -> "XGBPriorityModel":
-        """Load a persisted artifact. Returns self for chaining."""
+        """
+        Load a persisted artifact. Returns self for chaining.
+
+        Metadata comes from the ``.meta.json`` sidecar when present, so the
+        booster itself is only parsed on the first prediction.  Legacy joblib
+        pickles are still accepted.
+        """
         mp = Path(model_path) if model_path else self.model_path
         if not mp.exists():
             raise FileNotFoundError(f"Model file not found: {mp}")
 
-        artifact = joblib.load(mp)
-        self.model           = artifact["model"]
-        self.feature_columns = artifact["feature_columns"]
-        self._meta           = artifact.get("meta", {})
+        self.model      = None
+        self._explainer = None
 
-        if hasattr(self.model, "feature_importances_"):
-            self.feature_importances_ = pd.Series(
-                self.model.feature_importances_,
-                index=self.feature_columns
+        with mp.open("rb") as fh:
+            is_pickle = fh.read(1) == b"\x80"
+        if is_pickle:
+            self._load_legacy_pickle(mp)
+        else:
+            self._booster      = None
+            self._booster_path = mp
+            meta = {}
+            sidecar = mp.with_suffix(".meta.json")
+            if sidecar.exists():
+                try:
+                    meta = json.loads(sidecar.read_text())
+                except Exception as e:
+                    logger.warning("Unreadable metadata %s: %s", sidecar, e)
+            if not meta.get("feature_columns"):
+                # No sidecar – read everything from the booster attributes
+                attrs = self.booster.attributes()
+                meta = json.loads(attrs.get("meta", "{}"))
+                meta.setdefault("feature_columns", json.loads(attrs.get("feature_columns", "[]")))
+            self._meta           = meta
+            self.feature_columns = list(meta["feature_columns"])
+
+        fi = self._meta.get("feature_importance")
+        if fi:
+            self.feature_importances_ = pd.Series(fi, dtype=float).reindex(
+                self.feature_columns, fill_value=0.0
             ).sort_values(ascending=False)
 
         logger.info("Model loaded from %s", mp)
         return self
+
+    def _load_legacy_pickle(self, mp: Path) -> None:
+        """Load an artifact written by the former joblib-based save()."""
+        import joblib
+        artifact = joblib.load(mp)
+        model = artifact["model"]
+        self._booster        = model.get_booster() if hasattr(model, "get_booster") else model
+        self._booster_path   = None
+        self.feature_columns = artifact["feature_columns"]
+        self._meta           = artifact.get("meta", {})
+        if hasattr(model, "feature_importances_"):
+            self._meta.setdefault(
+                "feature_importance",
+                dict(zip(self.feature_columns, map(float, model.feature_importances_))),
+            )
+        logger.warning("Loaded legacy pickle %s – re-save to convert to the native format", mp)
@@ -28,7 +28,12 @@ from src.features.feature_engineering import (
     build_labels,
     extract_equipment_features,
 )
-from src.models.xgb_ranking_model import XGBPriorityModel, ndcg_at_k, precision_at_k
+from src.models.xgb_ranking_model import (
+    XGBPriorityModel,
+    group_train_test_split,
+    ndcg_at_k,
+    precision_at_k,
+)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -164,6 +169,50 @@ class TestMetrics:
         v = ndcg_at_k(y, s, k=4)
         assert 0.0 <= v <= 1.0
 
+    def test_grouped_metrics_match_reference(self):
+        from sklearn.metrics import average_precision_score, roc_auc_score
+        from src.models.ranking_metrics import grouped_ranking_metrics
+
+        rng = np.random.default_rng(0)
+        groups = rng.integers(0, 25, 600)
+        y = (rng.random(600) < 0.3).astype(int)
+        s = rng.random(600)
+        df = grouped_ranking_metrics(y, s, groups, k=5).set_index("group")
+        for g in np.unique(groups):
+            m = groups == g
+            row = df.loc[g]
+            k = min(5, int(m.sum()))
+            assert row["precision_at_k"] == pytest.approx(precision_at_k(y[m], s[m], k=k))
+            assert row["ndcg_at_k"] == pytest.approx(ndcg_at_k(y[m], s[m], k=k))
+            if y[m].sum() and (1 - y[m]).sum():
+                assert row["average_precision"] == pytest.approx(average_precision_score(y[m], s[m]))
+                assert row["roc_auc"] == pytest.approx(roc_auc_score(y[m], s[m]))
+                top = np.argsort(-s[m])[:k]
+                assert row["recall_at_k"] == pytest.approx(y[m][top].sum() / y[m].sum())
+
+    def test_grouped_auc_handles_ties(self):
+        from sklearn.metrics import roc_auc_score
+        from src.models.ranking_metrics import grouped_ranking_metrics
+
+        y = np.array([1, 0, 1, 0, 0, 1])
+        s = np.array([0.5, 0.5, 0.2, 0.2, 0.9, 0.9])
+        df = grouped_ranking_metrics(y, s, np.zeros(6), k=3)
+        assert df["roc_auc"].iloc[0] == pytest.approx(roc_auc_score(y, s))
+
+    def test_bootstrap_ci_deterministic_and_brackets_mean(self):
+        from src.models.ranking_metrics import bootstrap_ci, grouped_ranking_metrics
+
+        rng = np.random.default_rng(1)
+        groups = rng.integers(0, 40, 800)
+        y = (rng.random(800) < 0.3).astype(int)
+        s = y * 0.3 + rng.random(800)
+        per_group = grouped_ranking_metrics(y, s, groups, k=10)
+        ci1 = bootstrap_ci(per_group, n_boot=200, n_jobs=1)
+        ci4 = bootstrap_ci(per_group, n_boot=200, n_jobs=4)
+        pd.testing.assert_frame_equal(ci1, ci4)
+        assert (ci1["ci_low"] <= ci1["mean"]).all()
+        assert (ci1["mean"] <= ci1["ci_high"]).all()
+
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Model training and persistence
@@ -211,29 +260,1406 @@ class TestXGBPriorityModel:
 
     def test_save_and_load(self, trained_model, tmp_path):
         m, feat_df, _ = trained_model
-        pkl_path = tmp_path / "test_model.pkl"
-        m.save(model_path=pkl_path, meta_path=pkl_path.with_suffix(".json"))
+        model_path = tmp_path / "test_model.ubj"
+        m.save(model_path=model_path, meta_path=model_path.with_suffix(".json"))
 
         m2 = XGBPriorityModel()
-        m2.load(pkl_path)
+        m2.load(model_path)
         # Predictions should be identical
         orig  = m.predict_proba(feat_df)
         loaded = m2.predict_proba(feat_df)
         np.testing.assert_allclose(orig, loaded, rtol=1e-5)
 
+    def test_save_and_load_json_format(self, trained_model, tmp_path):
+        m, feat_df, _ = trained_model
+        model_path = tmp_path / "model.json"
+        m.save(model_path, tmp_path / "model.meta.json")
+        assert json.loads(model_path.read_text())["learner"]
+
+        m2 = XGBPriorityModel().load(model_path)
+        np.testing.assert_allclose(m.predict_proba(feat_df), m2.predict_proba(feat_df), rtol=1e-5)
+
+    def test_load_is_lazy_with_sidecar(self, trained_model, tmp_path):
+        m, feat_df, _ = trained_model
+        model_path = tmp_path / "model.ubj"
+        m.save(model_path, model_path.with_suffix(".meta.json"))
+
+        m2 = XGBPriorityModel().load(model_path)
+        assert m2._booster is None
+        assert m2.feature_columns == m.feature_columns
+        assert list(m2.feature_importances_.index) == list(m.feature_importances_.index)
+        m2.predict_proba(feat_df)
+        assert m2._booster is not None
+
+    def test_load_without_sidecar_reads_booster_attrs(self, trained_model, tmp_path):
+        m, _, _ = trained_model
+        model_path = tmp_path / "model.ubj"
+        m.save(model_path, tmp_path / "elsewhere.json")
+        m2 = XGBPriorityModel().load(model_path)
+        assert m2.feature_columns == m.feature_columns
+        assert m2.version_id == m.version_id
+
+    def test_load_legacy_pickle(self, trained_model, tmp_path):
+        import joblib
+        m, feat_df, _ = trained_model
+        pkl_path = tmp_path / "legacy.pkl"
+        joblib.dump({"model": m.model, "feature_columns": m.feature_columns, "meta": {}}, pkl_path)
+
+        m2 = XGBPriorityModel().load(pkl_path)
+        np.testing.assert_allclose(m.predict_proba(feat_df), m2.predict_proba(feat_df), rtol=1e-5)
+        assert m2.feature_importances_ is not None
+
     def test_metadata_json(self, trained_model, tmp_path):
         m, feat_df, _ = trained_model
-        pkl_path  = tmp_path / "model.pkl"
-        meta_path = tmp_path / "model.json"
-        m.save(pkl_path, meta_path)
+        model_path = tmp_path / "model.ubj"
+        meta_path  = tmp_path / "model.json"
+        m.save(model_path, meta_path)
 
         meta = json.loads(meta_path.read_text())
         assert "metrics" in meta
         assert "feature_columns" in meta
         assert "trained_at" in meta
 
+        ci = meta["metrics"]["ci_by_type"]
+        assert set(ci) == {"precision_at_k", "recall_at_k", "ndcg_at_k", "average_precision", "roc_auc"}
+        ndcg = ci["ndcg_at_k"]
+        assert ndcg["ci_low"] <= ndcg["mean"] <= ndcg["ci_high"]
+        assert ndcg["mean"] == pytest.approx(meta["metrics"]["ndcg_at_10_by_type"])
+
+    def test_final_model_uses_cv_tree_count(self, trained_model):
+        m, _, _ = trained_model
+        metrics = m._meta["metrics"]
+        assert len(metrics["n_estimators_cv"]) >= 2
+        assert metrics["n_estimators_used"] == max(1, int(np.median(metrics["n_estimators_cv"])))
+        assert m.booster.num_boosted_rounds() == metrics["n_estimators_used"]
+
+    def test_thread_budget_never_oversubscribes(self, monkeypatch):
+        from src.models import xgb_ranking_model as xrm
+        for cpus, tasks in [(1, 5), (8, 5), (16, 4), (4, 1)]:
+            monkeypatch.setattr(xrm.os, "cpu_count", lambda c=cpus: c)
+            workers, threads = xrm._thread_budget(tasks)
+            assert workers * threads <= cpus
+            assert workers <= tasks
+
     def test_per_equipment_type_metrics(self, trained_model):
         m, feat_df, labels = trained_model
         df = m.per_equipment_type_metrics(feat_df, labels, k=2)
         assert "equipment_type" in df.columns
         assert "precision_at_2" in df.columns
+
+
+class TestLearningToRank:
+
+    @pytest.fixture
+    def ranker(self, sample_bcg_df, sample_crm_df, tmp_path):
+        feat_df, meta = extract_equipment_features(sample_bcg_df, sample_crm_df)
+        labels = build_labels(sample_bcg_df, sample_crm_df)
+        m = XGBPriorityModel()
+        metrics = m.train(X=feat_df, y=labels, feature_columns=meta["feature_columns"],
+                          data_snapshot_id="test", objective="rank:ndcg")
+        return m, feat_df, labels, metrics
+
+    def test_group_split_keeps_every_group_on_both_sides(self):
+        groups = np.repeat([0, 1, 2, 3], [10, 5, 2, 1])
+        tr, te = group_train_test_split(groups, test_size=0.2, seed=0)
+        assert sorted(np.r_[tr, te].tolist()) == list(range(len(groups)))
+        for g in (0, 1, 2):
+            assert (groups[te] == g).any() and (groups[tr] == g).any()
+        assert not (groups[te] == 3).any()      # singleton stays in train
+        assert (groups[te] == 0).sum() == 2
+
+    def test_ranker_scores_in_unit_range(self, ranker):
+        m, feat_df, _, metrics = ranker
+        probs = m.predict_proba(feat_df)
+        assert ((probs >= 0) & (probs <= 1)).all()
+        assert "ndcg_at_10_by_type" in metrics
+        assert m._meta["objective"] == "rank:ndcg"
+
+    def test_ranker_roundtrip(self, ranker, tmp_path):
+        m, feat_df, _, _ = ranker
+        path = tmp_path / "ranker.ubj"
+        m.save(path, path.with_suffix(".meta.json"))
+        m2 = XGBPriorityModel().load(path)
+        np.testing.assert_allclose(m.predict_proba(feat_df), m2.predict_proba(feat_df), rtol=1e-5)
+
+    def test_unsupported_objective(self, sample_bcg_df, sample_crm_df):
+        feat_df, meta = extract_equipment_features(sample_bcg_df, sample_crm_df)
+        labels = build_labels(sample_bcg_df, sample_crm_df)
+        with pytest.raises(ValueError):
+            XGBPriorityModel().train(feat_df, labels, meta["feature_columns"], objective="reg:squarederror")
+
+
+class TestHyperparameterSearch:
+
+    @pytest.fixture
+    def data(self, sample_bcg_df, sample_crm_df):
+        feat_df, meta = extract_equipment_features(sample_bcg_df, sample_crm_df)
+        labels = build_labels(sample_bcg_df, sample_crm_df)
+        return feat_df, labels, meta["feature_columns"]
+
+    def test_sample_configs_deterministic(self):
+        from src.models.hparam_search import sample_configs
+        assert sample_configs(5, seed=1) == sample_configs(5, seed=1)
+        assert sample_configs(5, seed=1) != sample_configs(5, seed=2)
+
+    def test_halving_leaderboard(self, data):
+        from src.models.hparam_search import best_params, run_search
+        feat_df, labels, cols = data
+        board = run_search(feat_df, labels, cols, n_trials=4, max_estimators=40, eta=2, n_workers=1)
+        assert {"trial", "rung", "best_iteration", "ndcg_at_10", "auc", "wall_time_s"} <= set(board.columns)
+        assert board["rung"].max() == 2
+        assert (board["rung"] == 2).sum() == 1          # 4 → 2 → 1 configs
+        assert board.iloc[0]["rung"] == 2
+        params = best_params(board)
+        assert params["n_estimators"] == int(board.iloc[0]["best_iteration"])
+
+    def test_parallel_matches_serial(self, data):
+        from src.models.hparam_search import run_search
+        feat_df, labels, cols = data
+        kw = dict(strategy="random", n_trials=3, eval_split=0.3)
+        serial   = run_search(feat_df, labels, cols, n_workers=1, **kw).drop(columns="wall_time_s")
+        parallel = run_search(feat_df, labels, cols, n_workers=2, **kw).drop(columns="wall_time_s")
+        pd.testing.assert_frame_equal(serial, parallel)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Model registry and hot swap
+# ─────────────────────────────────────────────────────────────────────────────
+
+class TestModelRegistry:
+
+    @pytest.fixture
+    def setup(self, sample_bcg_df, sample_crm_df, tmp_path):
+        from src.features.feature_engineering import data_fingerprint
+        from src.models.model_registry import ModelRegistry
+
+        feat_df, meta = extract_equipment_features(sample_bcg_df, sample_crm_df)
+        labels = build_labels(sample_bcg_df, sample_crm_df)
+
+        def train(tag):
+            m = XGBPriorityModel()
+            m.train(X=feat_df, y=labels, feature_columns=meta["feature_columns"],
+                    data_snapshot_id=f"test{tag}")
+            return m
+
+        registry = ModelRegistry(tmp_path / "registry", legacy_model_path=None)
+        return registry, train, feat_df, data_fingerprint(feat_df)
+
+    def test_register_and_activate(self, setup):
+        registry, train, _, fp = setup
+        assert registry.active_model_path() is None
+        v1 = registry.register(train(1), data_fingerprint=fp)
+        v2 = registry.register(train(2), data_fingerprint=fp, activate=False)
+        assert registry.versions() == sorted([v1, v2])
+        assert registry.active_version() == v1
+        assert registry.get_meta(v1)["data_fingerprint"] == fp
+        board = registry.list_versions()
+        assert board.loc[board["active"], "version"].tolist() == [v1]
+
+        registry.activate(v2)
+        assert registry.active_model_path() == registry.model_path(v2)
+        registry.deactivate()
+        assert registry.active_model_path() is None
+        with pytest.raises(KeyError):
+            registry.activate("does-not-exist")
+
+    def test_legacy_fallback_without_pointer(self, setup, tmp_path):
+        from src.models.model_registry import ModelRegistry
+        _, train, _, _ = setup
+        legacy = tmp_path / "legacy.ubj"
+        train(1).save(model_path=legacy, meta_path=legacy.with_suffix(".meta.json"))
+        assert ModelRegistry(tmp_path / "empty", legacy_model_path=legacy).active_model_path() == legacy
+
+    def test_service_hot_swaps_without_reextracting(self, setup, monkeypatch):
+        from app.services.ml_ranking_service import MLRankingService
+        registry, train, feat_df, fp = setup
+        m1, m2 = train(1), train(2)
+        v1 = registry.register(m1, data_fingerprint=fp)
+
+        svc = MLRankingService(db_path="unused.db", registry=registry)
+        svc._feat_df = feat_df
+        monkeypatch.setattr(svc, "_get_features", lambda: svc._feat_df)
+        svc.get_ranked_list(top_k=5)
+        assert svc._snapshot.key[0] == m1.version_id
+
+        v2 = registry.register(m2, data_fingerprint=fp)    # e.g. scripts/train.py finishing
+        svc.get_ranked_list(top_k=5)
+        assert svc._snapshot.key[0] == m2.version_id
+        assert svc._feat_df is feat_df
+
+        svc.use_heuristic()
+        svc.get_ranked_list(top_k=5)
+        assert svc._snapshot.key[0] == "heuristic"
+        assert svc.activate_version(v1)
+        svc.get_ranked_list(top_k=5)
+        assert svc._snapshot.key[0] == m1.version_id
+        assert v1 != v2
+
+
+    def test_failed_version_not_retried_until_pointer_changes(self, setup, monkeypatch):
+        from app.services.ml_ranking_service import MLRankingService
+        from src.models import xgb_ranking_model
+        registry, train, feat_df, fp = setup
+        m1, m2 = train(1), train(2)
+        v1 = registry.register(m1, data_fingerprint=fp)
+
+        svc = MLRankingService(db_path="unused.db", registry=registry)
+        svc._feat_df = feat_df
+        monkeypatch.setattr(svc, "_get_features", lambda: svc._feat_df)
+        svc.get_ranked_list(top_k=5)
+
+        v2 = registry.register(m2, data_fingerprint=fp)
+        good = registry.model_path(v2).read_bytes()
+        registry.model_path(v2).write_bytes(b"corrupt")
+        loads = []
+        real_load = xgb_ranking_model.XGBPriorityModel.load
+        monkeypatch.setattr(xgb_ranking_model.XGBPriorityModel, "load",
+                            lambda self, path, *a, **kw: loads.append(path) or real_load(self, path, *a, **kw))
+        for _ in range(3):
+            svc.get_ranked_list(top_k=5)
+            assert svc._snapshot.key[0] == m1.version_id           # keeps serving v1
+        assert loads == [registry.model_path(v2)]               # tried (and logged) once
+
+        registry.model_path(v2).write_bytes(good)
+        registry.activate(v2)                                    # pointer rewritten: retry
+        svc.get_ranked_list(top_k=5)
+        assert svc._snapshot.key[0] == m2.version_id
+        assert v1 != v2
+
+
+class TestBatchInference:
+
+    @pytest.fixture
+    def db(self, sample_bcg_df, sample_crm_df, tmp_path):
+        import duckdb
+        feat_df, meta = extract_equipment_features(sample_bcg_df, sample_crm_df)
+        labels = build_labels(sample_bcg_df, sample_crm_df)
+        m = XGBPriorityModel()
+        m.train(X=feat_df, y=labels, feature_columns=meta["feature_columns"])
+
+        conn = duckdb.connect(str(tmp_path / "t.db"))
+        conn.register("bcg_src", sample_bcg_df)
+        conn.register("crm_src", sample_crm_df)
+        conn.execute("CREATE TABLE bcg_installed_base AS SELECT * FROM bcg_src")
+        conn.execute("CREATE TABLE crm_data AS SELECT * FROM crm_src")
+        yield conn, m, feat_df
+        conn.close()
+
+    def test_streamed_scores_match_in_memory(self, db, tmp_path):
+        from src.models.batch_inference import stream_score
+        conn, m, feat_df = db
+        out = tmp_path / "scores.parquet"
+        summary = stream_score(conn, m, out, chunk_rows=7, log=lambda _: None)
+        assert summary["chunks"] == 5 and summary["rows_read"] == len(feat_df)
+
+        streamed = pd.read_parquet(out)
+        assert streamed["row_id"].tolist() == list(range(len(feat_df)))
+        expected = (m.predict_proba(feat_df) * 100).round(1)
+        np.testing.assert_allclose(streamed["priority_score"].to_numpy(), expected)
+        assert streamed["equipment_type"].tolist() == feat_df["_equipment_type"].tolist()
+
+    def test_streamed_top_k_matches_ranking(self, db, tmp_path):
+        from src.models.batch_inference import stream_score
+        conn, m, feat_df = db
+        out = tmp_path / "top.parquet"
+        stream_score(conn, m, out, chunk_rows=4, top_k=6, equipment_type="furnace",
+                     log=lambda _: None)
+        streamed = pd.read_parquet(out)
+        ranked = m.rank_by_equipment_type(feat_df, equipment_type="furnace", top_k=6)
+        assert streamed["rank"].tolist() == list(range(1, 7))
+        assert streamed["priority_score"].tolist() == ranked["priority_score"].tolist()
+
+
+class TestTrainingJobRunner:
+
+    @staticmethod
+    def _wait(runner, timeout=30.0):
+        import time
+        deadline = time.monotonic() + timeout
+        while runner.is_running() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert not runner.is_running()
+
+    def test_streams_progress_and_notifies(self, tmp_path):
+        from app.services.training_service import TrainingJobRunner
+        script = tmp_path / "fake_train.py"
+        script.write_text(
+            "import sys\n"
+            "print('12:00:00  INFO  train  Step 1/2  Loading raw data …')\n"
+            "print('12:00:01  INFO  train  Step 2/2  Training XGBoost model …')\n"
+            "print('12:00:02  INFO  train  Registered version 20260101-120000-abcd1234 (active)')\n"
+            "print('args', sys.argv[1:])\n"
+        )
+        notified = []
+        runner = TrainingJobRunner(script=script, on_success=notified.append)
+        job = runner.start(["--bcg-csv", "x.csv"])
+        self._wait(runner)
+
+        info = runner.status()
+        assert info["status"] == "succeeded"
+        assert (info["step"], info["n_steps"]) == (2, 2)
+        assert info["version"] == "20260101-120000-abcd1234"
+        assert notified == [job]
+        assert "'--bcg-csv', 'x.csv'" in job.log_tail()
+
+    def test_search_run_progress_is_monotonic(self):
+        from app.services.training_service import TrainingJob
+        job = TrainingJob(["train.py", "--search"])
+        seen = []
+        for line in ["Step 1/6  Loading raw data from DuckDB …", "Step 2/6  Building binary labels …",
+                     "Step 3/6  Extracting features …", "Step 4/6  Hyperparameter search (random) …",
+                     "Step 5/6  Training XGBoost model …", "Step 6/6  Saving model artefacts …"]:
+            job._consume(f"12:00:00  INFO  train  {line}")
+            seen.append((job.progress, job.step_label))
+        assert [p for p, _ in seen] == sorted(p for p, _ in seen) and len({p for p, _ in seen}) == 6
+        assert seen[3][1] == "Hyperparameter search (random)"
+
+    def test_failure_is_reported(self, tmp_path):
+        from app.services.training_service import TrainingJobRunner
+        script = tmp_path / "fail.py"
+        script.write_text("import sys\nprint('boom')\nsys.exit(3)\n")
+        notified = []
+        runner = TrainingJobRunner(script=script, on_success=notified.append)
+        runner.start([])
+        self._wait(runner)
+        assert runner.status()["status"] == "failed"
+        assert runner.status()["returncode"] == 3
+        assert notified == []
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Ranking service (score cache)
+# ─────────────────────────────────────────────────────────────────────────────
+
+class TestMLRankingService:
+
+    @pytest.fixture
+    def service(self, sample_bcg_df, sample_crm_df, tmp_path):
+        from app.services.ml_ranking_service import MLRankingService
+
+        feat_df, meta = extract_equipment_features(sample_bcg_df, sample_crm_df)
+        labels = build_labels(sample_bcg_df, sample_crm_df)
+        m = XGBPriorityModel()
+        m.train(X=feat_df, y=labels, feature_columns=meta["feature_columns"],
+                data_snapshot_id="test")
+
+        svc = MLRankingService(db_path=tmp_path / "none.db", model_path=tmp_path / "none.ubj")
+        svc._feat_df = feat_df
+        svc._model   = m
+        return svc, m, feat_df
+
+    def test_scores_computed_once(self, service, monkeypatch):
+        svc, m, _ = service
+        calls = []
+        orig = m.predict_proba
+        monkeypatch.setattr(m, "predict_proba", lambda X: calls.append(len(X)) or orig(X))
+
+        svc.get_ranked_list()
+        svc.get_ranked_list(equipment_type="Blast", top_k=3)
+        svc.get_ranked_list(country="Germany", top_k=None)
+        assert len(calls) == 1
+
+    def test_top_k_matches_full_sort(self, service):
+        svc, m, feat_df = service
+        full = m.rank_by_equipment_type(feat_df)
+        top  = svc.get_ranked_list(top_k=5)
+        assert top["rank"].tolist() == [1, 2, 3, 4, 5]
+        assert top["priority_score"].tolist() == full["priority_score"].head(5).tolist()
+
+    def test_filters(self, service):
+        svc, _, _ = service
+        ranked = svc.get_ranked_list(equipment_type="rolling", country="italy", top_k=None)
+        assert not ranked.empty
+        assert ranked["equipment_type"].str.contains("Rolling").all()
+        assert (ranked["country"] == "Italy").all()
+
+    def test_concurrent_rescore_does_not_mix_snapshots(self, service, monkeypatch):
+        svc, _, feat_df = service
+        expected = svc.get_ranked_list(country="italy", top_k=None)
+        svc.clear_cache()
+        svc._feat_df = feat_df
+        get_scored = svc._get_scored
+
+        def racing_get_scored(force_heuristic=False):
+            snap = get_scored(force_heuristic)
+            # another caller re-scores different data before this one selects
+            svc._feat_df, svc._feat_fp = feat_df.head(7), None
+            get_scored(force_heuristic=True)
+            return snap
+
+        monkeypatch.setattr(svc, "_get_scored", racing_get_scored)
+        ranked = svc.get_ranked_list(country="italy", top_k=None)
+        pd.testing.assert_frame_equal(ranked, expected)
+        assert len(svc._snapshot.scored) == 7
+
+    def test_heuristic_fallback(self, service):
+        svc, _, _ = service
+        ranked = svc.get_ranked_list(top_k=None, force_heuristic=True)
+        scores = ranked["priority_score"].tolist()
+        assert scores == sorted(scores, reverse=True)
+        assert svc._snapshot.key[0] == "heuristic"
+
+    def test_score_customer_exact_match(self, service):
+        svc, _, _ = service
+        ranked = svc.get_ranked_list(top_k=None)
+        expected = ranked.loc[ranked["company"] == "Gamma Corp", "priority_score"].max()
+        score, source = svc.score_customer("gamma corp")
+        assert source == "xgboost"
+        assert score == pytest.approx(expected)
+
+    def test_score_customer_unknown_company(self, service):
+        svc, _, _ = service
+        assert svc.score_customer("Gamma Corporation Holdings") == (50.0, "heuristic")
+
+    def test_company_ranking_by_type(self, service):
+        svc, _, _ = service
+        entry = svc.get_company_ranking("Alpha Steel GmbH")
+        assert entry["total_companies"] == 5
+        assert 1 <= entry["rank"] <= 5
+        assert entry["n_units"] == 8
+        score, _ = svc.score_customer("Alpha Steel GmbH", equipment_type="Blast")
+        assert score == entry["by_type"]["Blast Furnace"]["max_score"]
+
+    def test_explanations_batched_once(self, service, monkeypatch):
+        svc, m, feat_df = service
+        calls = []
+        orig = m.compute_shap
+        monkeypatch.setattr(m, "compute_shap", lambda X: calls.append(len(X)) or orig(X))
+
+        ranked = svc.get_ranked_list(top_k=3)
+        first  = svc.get_explanations(ranked["row_id"].tolist())
+        again  = svc.get_explanations([int(ranked["row_id"].iloc[0])])
+        assert calls == [len(feat_df)]
+
+        rid = int(ranked["row_id"].iloc[0])
+        drivers = first[rid]
+        assert len(drivers) == 5
+        assert again[rid] == drivers
+        impacts = [abs(d["shap"]) for d in drivers]
+        assert impacts == sorted(impacts, reverse=True)
+
+    def test_explanations_match_full_shap(self, service):
+        svc, m, feat_df = service
+        rid = 7
+        drivers = svc.get_explanations([rid])[rid]
+        full = m.compute_shap(feat_df).iloc[rid]
+        for d in drivers:
+            assert d["shap"] == pytest.approx(full[d["feature"]])
+
+    def test_no_explanations_for_heuristic(self, service):
+        svc, _, _ = service
+        svc._model = None
+        assert svc.get_explanations([0]) == {}
+
+    def test_model_info_cached_until_file_changes(self, service, tmp_path):
+        import os
+        from app.services.ml_ranking_service import MLRankingService
+        _, m, _ = service
+        model_path, meta_path = m.save(model_path=tmp_path / "m.ubj",
+                                       meta_path=tmp_path / "m.meta.json")
+        svc = MLRankingService(db_path=tmp_path / "none.db", model_path=model_path)
+
+        meta = svc.get_model_metadata()
+        assert meta["metrics"]["auc_test"] == m._meta["metrics"]["auc_test"]
+        assert svc.get_model_metadata() is meta              # no re-parse
+        fi = svc.get_feature_importance()                    # model never loaded
+        assert svc._model is None
+        assert fi.index[0] == m.feature_importances_.index[0]
+
+        data = json.loads(meta_path.read_text())
+        data["trained_at"] = "2026-01-01T00:00:00"
+        meta_path.write_text(json.dumps(data))
+        st = meta_path.stat()
+        os.utime(meta_path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+        assert svc.get_model_metadata()["trained_at"] == "2026-01-01T00:00:00"
+
+
+class TestHeuristicScorer:
+
+    @pytest.fixture
+    def equipment(self):
+        rng = np.random.default_rng(3)
+        n = 200
+        years = rng.integers(1980, 2026, n).astype(object)
+        years[::17] = None
+        years[::23] = "unknown"
+        maint = pd.Series(pd.Timestamp.now() - pd.to_timedelta(rng.integers(0, 1500, n), unit="D"))
+        maint = maint.dt.strftime("%Y-%m-%d").astype(object)
+        maint[::5] = ""
+        return pd.DataFrame({
+            "installation_year": years,
+            "equipment_type":    rng.choice(["Blast Furnace", "EAF", "Caster", "Rolling Mill", "Arc Furnace"], n),
+            "oem":               rng.choice(["SMS group", "Danieli", "Primetals"], n),
+            "last_maintenance":  maint,
+        })
+
+    def test_batch_matches_single_item(self, equipment):
+        from app.services.prediction_service import PredictionService
+        svc = PredictionService()
+        for crm in ({}, {"rating": "A"}, {"crm_rating": "E"}):
+            batch = svc.predict_equipment_hit_rates(equipment, crm)
+            single = [svc.predict_equipment_hit_rate(r, crm)[0]
+                      for r in equipment.to_dict("records")]
+            np.testing.assert_allclose(batch, single)
+
+    def test_single_and_batch_agree_on_missing_years(self):
+        from app.services.prediction_service import PredictionService
+        svc = PredictionService()
+        records = [
+            {"installation_year": np.nan, "year": 1995, "equipment": "EAF"},   # falls back to year
+            {"installation_year": None, "equipment": "Caster"},                # default year
+            {"year": "n/a", "equipment_type": "Blast Furnace", "oem": None, "manufacturer": "SMS"},
+            {"installation_year": 2001.0, "oem": "SMS group", "last_service": "2020-01-01"},
+            {},
+        ]
+        for crm in ({}, {"rating": "A"}, {"crm_rating": "D"}):
+            batch = svc.predict_equipment_hit_rates(pd.DataFrame(records), crm)
+            for rec, expected in zip(records, batch):
+                assert svc.predict_equipment_hit_rate(rec, crm)[0] == expected
+        assert svc.predict_equipment_hit_rate(records[0])[0] == 75.0            # year 1995: 31 yrs
+
+    def test_tz_aware_and_mixed_maintenance_dates(self):
+        from app.services.prediction_service import PredictionService
+        svc = PredictionService()
+        old = {"equipment_type": "EAF", "installation_year": 1990}
+        score, _ = svc.predict_equipment_hit_rate({**old, "last_maintenance": "2020-01-01T00:00:00+00:00"})
+        assert score == 85.0                                    # > 24 months since maintenance
+        mixed = pd.DataFrame([{**old, "last_maintenance": d} for d in
+                              ["2020-01-01T00:00:00+00:00", "2020-01-01", "2020-01-01T02:00:00+02:00",
+                               "not a date", None]])
+        scores = svc.predict_equipment_hit_rates(mixed, {})
+        assert scores.tolist() == [85.0, 85.0, 85.0, 75.0, 75.0]   # unparseable: 12 months
+
+    def test_customer_score_is_equipment_mean(self, equipment):
+        from app.services.prediction_service import PredictionService
+        svc = PredictionService()
+        records = equipment.to_dict("records")
+        score, _ = svc.predict_hit_rate({"installed_base": records, "crm": {"rating": "B"}})
+        single = [svc.predict_equipment_hit_rate(r, {"rating": "B"})[0] for r in records]
+        assert score == round(float(np.mean(single)), 1)
+
+    def test_ranking_fallback_uses_shared_rules(self, sample_bcg_df, sample_crm_df):
+        from app.services.ml_ranking_service import MLRankingService
+        from app.services.prediction_service import PredictionService
+        feat_df, _ = extract_equipment_features(sample_bcg_df, sample_crm_df)
+        fallback = MLRankingService._heuristic_scores(feat_df)
+        rating = {5: "A", 4: "B", 3: "C", 2: "D", 1: "E"}
+        svc = PredictionService()
+        for i in range(len(feat_df)):
+            eq = {"installation_year": 2026 - feat_df["equipment_age"].iloc[i],
+                  "equipment_type": feat_df["_equipment_type"].iloc[i],
+                  "oem": "SMS" if feat_df["is_sms_oem"].iloc[i] else "other"}
+            crm = {"rating": rating[int(feat_df["crm_rating_num"].iloc[i])]}
+            assert fallback[i] == svc.predict_equipment_hit_rate(eq, crm)[0]
+
+
+class TestDriftMonitor:
+
+    def test_identical_data_is_stable(self):
+        from src.models.drift import drift_report, reference_profile
+        rng = np.random.default_rng(0)
+        X = pd.DataFrame({"age": rng.normal(30, 10, 5000), "flag": rng.integers(0, 2, 5000)})
+        profile = reference_profile(X, ["age", "flag"], rng.random(5000))
+        report = drift_report(profile, X, rng.random(5000))
+        assert (report["features"]["psi"] < 0.01).all()
+        assert report["score_psi"] < 0.01
+        assert not report["needs_retraining"]
+
+    def test_shifted_feature_flags_retraining(self):
+        from src.models.drift import drift_report, reference_profile
+        rng = np.random.default_rng(1)
+        X = pd.DataFrame({"age": rng.normal(30, 10, 5000), "flag": rng.integers(0, 2, 5000)})
+        profile = json.loads(json.dumps(reference_profile(X, ["age", "flag"])))  # survives metadata JSON
+        shifted = X.assign(age=X["age"] + 15)
+        report = drift_report(profile, shifted, trained_at="2026-01-01T00:00:00")
+        top = report["features"].iloc[0]
+        assert top["feature"] == "age" and top["status"] == "major"
+        assert report["features"].set_index("feature").loc["flag", "status"] == "stable"
+        assert report["needs_retraining"]
+        assert any("age" in r for r in report["reasons"])
+
+    def test_service_report_from_training_profile(self, sample_bcg_df, sample_crm_df, tmp_path):
+        from app.services.ml_ranking_service import MLRankingService
+        feat_df, meta = extract_equipment_features(sample_bcg_df, sample_crm_df)
+        labels = build_labels(sample_bcg_df, sample_crm_df)
+        m = XGBPriorityModel()
+        m.train(X=feat_df, y=labels, feature_columns=meta["feature_columns"],
+                data_snapshot_id="test")
+        assert set(m._meta["reference_profile"]["features"]) == set(meta["feature_columns"])
+
+        svc = MLRankingService(db_path=tmp_path / "none.db", model_path=tmp_path / "none.ubj")
+        svc._feat_df = feat_df
+        svc._model   = m
+        report = svc.get_drift_report()
+        assert report["score_psi"] == pytest.approx(0.0, abs=1e-6)
+        assert not report["needs_retraining"]
+        assert svc.get_drift_report() is report        # cached per scored key
+
+
+class TestIBCompanyIndex:
+
+    @pytest.fixture
+    def index(self):
+        from app.services.ml_ranking_service import _IBCompanyIndex
+        ib = pd.DataFrame({
+            "ib_customer": ["Alpha Steel GmbH", "Alpha Steel GmbH", "ThyssenKrupp Steel Europe", "Posco"],
+            "ib_city":     ["Duisburg", "Bremen", np.nan, "Pohang"],
+            "ib_startup":  [1995, "2008", None, 0],
+        })
+        return _IBCompanyIndex(ib, "ib_customer", "ib_city", "ib_startup")
+
+    def test_aggregated_table(self, index):
+        row = index.table.loc["alphasteelgmbh"]
+        assert row["cities"] == "Bremen, Duisburg"
+        assert row["last_startup"] == 2008
+
+    def test_exact_and_fuzzy_resolve(self, index):
+        assert index.resolve("ALPHA STEEL GmbH") == "alphasteelgmbh"
+        assert index.resolve("ThyssenKrupp Steel") == "thyssenkruppsteeleurope"  # prefix in IB key
+        assert index.resolve("Posco Holdings") == "posco"                       # IB key in company
+        assert index.resolve("Zeta Works") is None
+
+    def test_lookup_series(self, index):
+        cities, years = index.lookup(pd.Series(["Alpha Steel GmbH", "Posco", "Unknown"]))
+        assert cities.tolist() == ["Bremen, Duisburg", "Pohang", ""]
+        assert years.tolist() == [2008, None, None]
+
+
+
+class TestHistoricalNameIndex:
+
+    @staticmethod
+    def _scan(df, col, company):
+        """Reference: the original per-row scan of _match_company."""
+        from app.services.historical_service import _norm
+        mask = df[col].astype(str).str.lower().str.contains(company[:8].lower(), na=False, regex=False)
+        if mask.any():
+            return df[mask]
+        return df[df[col].apply(lambda x: _norm(company)[:6] in _norm(x))]
+
+    def test_matches_full_scan(self):
+        from app.services.historical_service import _NameIndex, _match_company
+        crm = pd.DataFrame({
+            "account_name": ["Alpha Steel GmbH", "ALPHA-STEEL Bremen", "Thyssen Krupp AG",
+                             np.nan, "Posco", "Alpha Steel GmbH", "thyssenkrupp Europe"],
+            "value": range(7),
+        })
+        index = _NameIndex(crm["account_name"])
+        for company in ["Alpha Steel GmbH", "alpha-steel", "ThyssenKrupp Steel", "Posco Holdings",
+                        "Zeta Works", "A", ""]:
+            got = _match_company(crm, "account_name", company, index=index)
+            pd.testing.assert_frame_equal(got, self._scan(crm, "account_name", company))
+
+    def test_missing_column_is_empty(self):
+        from app.services.historical_service import _match_company
+        df = pd.DataFrame({"company": ["Alpha"]})
+        assert _match_company(df, "account_name", "Alpha").empty
+
+
+class TestHistoricalTable:
+
+    @pytest.fixture
+    def source(self, tmp_path, monkeypatch):
+        import duckdb
+        from app.services import historical_service as hs
+        conn = duckdb.connect()
+        monkeypatch.setattr(hs, "_shared_conn", lambda: conn)
+        path = tmp_path / "ib_list.xlsx"
+        pd.DataFrame({
+            "ib_customer": ["Alpha Steel GmbH", "Posco", "Alpha Steel GmbH"],
+            "ib_startup":  [1995, "2008", None],
+            "Unnamed: 3":  [1, 2, 3],
+        }).to_excel(path, index=False)
+        table = hs._HistoricalTable("hist_ib", path, hs._IB_NAME_COLS, clean=hs._clean_ib,
+                                    staging_dir=tmp_path / "staging")
+        return table, conn, path
+
+    def test_ingested_once_into_duckdb(self, source, monkeypatch):
+        table, conn, _ = source
+        df = table.frame()
+        assert list(df.columns) == ["ib_customer", "ib_startup"]
+        assert conn.execute("SELECT COUNT(*) FROM hist_ib").fetchone()[0] == 3
+        assert (table.staging_dir / "hist_ib.parquet").exists()
+
+        monkeypatch.setattr(pd, "read_excel", lambda *a, **k: pytest.fail("re-parsed Excel"))
+        assert table.frame() is df
+        table._fp = None                       # new process: reuse the DuckDB copy
+        assert len(table.frame()) == 3
+
+    def test_reingested_when_file_changes(self, source):
+        import os
+        table, conn, path = source
+        first = table.frame()
+        idx = table.name_indexes()
+        pd.DataFrame({"ib_customer": ["Zeta Works"]}).to_excel(path, index=False)
+        st = path.stat()
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+        assert table.frame()["ib_customer"].tolist() == ["Zeta Works"]
+        assert table.name_indexes() is not idx
+        assert table.frame() is not first
+
+    def test_search_query(self, source):
+        from app.services import historical_service as hs
+        table, _, _ = source
+        df = table.frame()
+        found = hs._search(table, df, "ib_customer", "alpha")
+        assert len(found) == 2
+        assert hs._search(table, df, "ib_customer", "nothing").empty
+
+
+class TestYearlyPerformance:
+
+    @pytest.fixture
+    def crm(self, tmp_path, monkeypatch):
+        import duckdb
+        from app.services import historical_service as hs
+        conn = duckdb.connect()
+        monkeypatch.setattr(hs, "_shared_conn", lambda: conn)
+        rng = np.random.default_rng(5)
+        n = 300
+        df = pd.DataFrame({
+            "account_name":          rng.choice(["Alpha Steel GmbH", "Alpha Steel Bremen", "Posco",
+                                                 "Gamma Corp"], n),
+            "customer_project":      rng.choice(["Posco Mill", "Gamma Caster", "Other"], n),
+            "cp_close_date":         pd.Series(pd.to_datetime("2015-01-01")
+                                               + pd.to_timedelta(rng.integers(0, 3000, n), unit="D")),
+            "cp_expected_value_eur": rng.integers(0, 5_000_000, n).astype(float),
+            "cp_status_hot":         rng.choice(["Won", "Lost", "Order placed", "Open", "booked"], n),
+        })
+        df.loc[::11, "cp_close_date"] = pd.NaT
+        path = tmp_path / "gh_current_projects.xlsx"
+        df.to_excel(path, index=False)
+        table = hs._HistoricalTable("hist_crm", path, hs._CRM_NAME_COLS,
+                                    staging_dir=tmp_path / "staging")
+        monkeypatch.setattr(hs, "_CRM_TABLE", table)
+        return hs
+
+    @staticmethod
+    def _reference(projects):
+        """The original per-group apply implementation."""
+        df = projects.copy()
+        df["_year"] = pd.to_datetime(df["cp_close_date"], errors="coerce").dt.year
+        df["_value"] = pd.to_numeric(df["cp_expected_value_eur"], errors="coerce").fillna(0)
+        df["_is_won"] = df["cp_status_hot"].astype(str).str.lower().apply(
+            lambda s: any(k in s for k in ["won", "booked", "converted", "order", "placed"]))
+        g = df.dropna(subset=["_year"]).groupby("_year")
+        return pd.DataFrame({
+            "Year": g["_year"].first().astype(int),
+            "Projects": g["_value"].count(),
+            "Total Value (EUR)": g["_value"].sum().round(0),
+            "Won Value (EUR)": g.apply(lambda x: x.loc[x["_is_won"], "_value"].sum()).round(0),
+            "Win Rate %": g.apply(lambda x: (x["_is_won"].sum() / max(len(x), 1) * 100)).round(1),
+        }).reset_index(drop=True).sort_values("Year"), df
+
+    @pytest.mark.parametrize("company", ["Alpha Steel", "Posco", "Gamma Caster"])
+    def test_matches_reference(self, crm, company):
+        perf = crm.get_yearly_performance(company)
+        expected, df = self._reference(crm.get_crm_projects_for_company(company))
+        pd.testing.assert_frame_equal(perf["yearly_df"], expected, check_dtype=False)
+        assert perf["metrics"]["n_projects"] == len(df)
+        assert perf["metrics"]["total_won_value"] == pytest.approx(df.loc[df["_is_won"], "_value"].sum())
+        assert len(perf["won_list"]) == int(df["_is_won"].sum())
+
+    def test_per_company_results_not_shared(self, crm):
+        first = crm.get_yearly_performance("Posco")
+        first["yearly_df"]["Projects"] = -1
+        first["raw_projects"]["_value"] = -1.0
+        again = crm.get_yearly_performance("Posco")
+        assert again is not first
+        assert (again["yearly_df"]["Projects"] > 0).all()
+        assert (again["raw_projects"]["_value"] >= 0).all()
+        assert crm.get_yearly_performance("Zeta Works") == {}
+        # only whole-table results are kept per file version
+        assert all(isinstance(k, str) for k in crm._CRM_TABLE._derived)
+
+
+class TestPortfolioRollup:
+
+    @pytest.fixture
+    def env(self, tmp_path, monkeypatch):
+        import duckdb
+        from app.services import historical_service as hs
+        from app.services.portfolio_service import PortfolioRollupService
+        conn = duckdb.connect()
+        monkeypatch.setattr(hs, "_shared_conn", lambda: conn)
+        rng = np.random.default_rng(9)
+        n = 200
+        df = pd.DataFrame({
+            "account_name":          rng.choice(["Alpha Steel GmbH", "Posco", "Gamma Corp", "Acme"], n),
+            "account_country":       rng.choice(["Germany", "Korea", "Italy"], n),
+            "sp_coe":                rng.choice(["Rolling Mills", "Melt Shop"], n),
+            "cp_close_date":         pd.Series(pd.to_datetime("2016-01-01")
+                                               + pd.to_timedelta(rng.integers(0, 2500, n), unit="D")),
+            "cp_expected_value_eur": rng.integers(0, 1_000_000, n).astype(float),
+            "cp_status_hot":         rng.choice(["Won", "Lost", "Open"], n),
+        })
+        path = tmp_path / "gh_current_projects.xlsx"
+        df.to_excel(path, index=False)
+        table = hs._HistoricalTable("hist_crm", path, hs._CRM_NAME_COLS,
+                                    staging_dir=tmp_path / "staging")
+        monkeypatch.setattr(hs, "_CRM_TABLE", table)
+        return hs, PortfolioRollupService(conn_factory=lambda: conn), df, path
+
+    def test_company_yearly_matches_per_company_summary(self, env):
+        hs, svc, _, _ = env
+        assert svc.refresh()["status"] == "refreshed"
+        cube = svc.company_yearly("Posco")
+        yearly = hs.get_yearly_performance("Posco")["yearly_df"]
+        assert cube["year"].tolist() == yearly["Year"].tolist()
+        assert cube["projects"].tolist() == yearly["Projects"].tolist()
+        np.testing.assert_allclose(cube["won_value"].round(0), yearly["Won Value (EUR)"])
+        np.testing.assert_allclose(cube["win_rate"], yearly["Win Rate %"])
+
+    def test_rollup_dimensions(self, env):
+        _, svc, df, _ = env
+        svc.refresh()
+        by_region = svc.rollup(by=("region",))
+        assert by_region.set_index("region").loc["Europe", "projects"] == \
+            df["account_country"].isin(["Germany", "Italy"]).sum()
+        assert svc.rollup(by=())["pipeline_value"].iloc[0] == pytest.approx(df["cp_expected_value_eur"].sum())
+        # a filter region expands to its aliases (as the analytics page passes them)
+        aliases = svc.rollup(by=(), region=["Europe", "EU", "Western Europe"])
+        assert aliases["projects"].iloc[0] == by_region.set_index("region").loc["Europe", "projects"]
+        assert svc.rollup(by=(), region=[])["projects"].fillna(0).iloc[0] == 0
+        with pytest.raises(ValueError):
+            svc.rollup(by=("colour",))
+
+    @pytest.mark.filterwarnings("ignore:Parsing dates")
+    def test_text_dates_share_historical_year(self, env):
+        import os
+        hs, svc, df, path = env
+        # European text dates: DuckDB casts cannot read them, pandas can
+        df["cp_close_date"] = df["cp_close_date"].dt.strftime("%d.%m.%Y")
+        df.to_excel(path, index=False)
+        st = path.stat()
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+        svc.refresh()
+        cube = svc.company_yearly("Posco")
+        yearly = hs.get_yearly_performance("Posco")["yearly_df"]
+        assert not cube.empty
+        assert cube["year"].tolist() == yearly["Year"].tolist()
+        assert cube["projects"].tolist() == yearly["Projects"].tolist()
+
+    def test_failed_refresh_drops_temp_tables(self, env):
+        import duckdb
+        from app.services import portfolio_service as ps
+        _, svc, _, _ = env
+        conn = svc._conn()
+        conn.execute(f"CREATE TABLE {ps.DIGEST_TABLE} (legacy INTEGER)")   # diffing step fails
+        with pytest.raises(duckdb.Error):
+            svc.refresh()
+        temp = conn.execute("SELECT table_name FROM duckdb_tables() WHERE temporary").fetchall()
+        assert temp == []
+
+    def test_incremental_refresh(self, env):
+        import os
+        _, svc, df, path = env
+        svc.refresh()
+        assert svc.refresh()["status"] == "unchanged"
+
+        df.loc[df["account_name"] == "Acme", "cp_status_hot"] = "Won"
+        df = df[df["account_name"] != "Gamma Corp"]
+        df.to_excel(path, index=False)
+        st = path.stat()
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+        stats = svc.refresh()
+        assert (stats["companies_changed"], stats["companies_removed"]) == (1, 1)
+
+        acme = svc.company_yearly("Acme")
+        assert (acme["win_rate"] == 100.0).all()
+        assert svc.company_yearly("Gamma Corp").empty
+        assert svc.rollup(by=())["projects"].iloc[0] == len(df)
+
+
+class TestConcurrentFetch:
+
+    @pytest.fixture
+    def rss_server(self):
+        """Local RSS stub: each request sleeps `delay` seconds (?q=slow sleeps 2 s)."""
+        import threading
+        import time
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from urllib.parse import parse_qs, urlsplit
+
+        state = {"active": 0, "peak": 0, "hits": 0, "delay": 0.4}
+        lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                q = parse_qs(urlsplit(self.path).query).get("q", [""])[0]
+                with lock:
+                    state["active"] += 1
+                    state["hits"] += 1
+                    state["peak"] = max(state["peak"], state["active"])
+                time.sleep(2 if q.startswith("slow") else state["delay"])
+                with lock:
+                    state["active"] -= 1
+                body = (f"<rss><channel><item><title>{q}</title><link>http://x/{q}</link>"
+                        "<pubDate>Mon, 02 Mar 2026 10:00:00 GMT</pubDate></item></channel></rss>").encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/rss+xml")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        yield f"http://127.0.0.1:{server.server_port}/rss", state
+        server.shutdown()
+
+    @pytest.fixture
+    def service(self, rss_server, tmp_path):
+        from app.services.web_enrichment_service import WebEnrichmentService
+        svc = WebEnrichmentService(cache_path=tmp_path / "cache.sqlite")
+        svc.GOOGLE_NEWS_RSS = rss_server[0]
+        return svc, rss_server[1]
+
+    def test_country_intelligence_concurrent(self, service):
+        import time
+        svc, state = service
+        start = time.monotonic()
+        intel = svc.get_country_intelligence("Germany")
+        elapsed = time.monotonic() - start
+        assert state["hits"] == 5
+        assert elapsed < 1.5                       # sequential would take ≥ 2 s
+        assert intel["steel_news"][0]["title"] == "Germany steel industry market"
+        assert intel["other_macro"][0]["title"].startswith("Germany infrastructure")
+
+    def test_per_host_limit(self, service):
+        svc, state = service
+        svc.fetcher.per_host = 2
+        svc.fetcher._hosts.clear()
+        svc.get_country_intelligence("Italy")
+        assert state["peak"] <= 2
+
+    def test_deadline_returns_partial_results(self, service):
+        import time
+        svc, _ = service
+        start = time.monotonic()
+        out = svc.fetcher.run({
+            "fast": (svc._get_google_news, ("fast", 5)),
+            "slow": (svc._get_google_news, ("slow", 5)),
+        }, deadline=1.0, default=[])
+        assert time.monotonic() - start < 2.0
+        assert out["fast"][0]["title"] == "fast"
+        assert out["slow"] == []
+
+    def test_deadline_counts_from_call_start(self):
+        import time
+        from app.services.concurrent_fetch import ConcurrentFetcher
+        fetcher = ConcurrentFetcher(max_workers=1)
+        # the second call queues 0.4 s behind the first but still gets its own 0.6 s
+        out = fetcher.run({k: (lambda k=k: time.sleep(0.4) or k, ()) for k in "ab"}, deadline=0.6)
+        assert out == {"a": "a", "b": "b"}
+
+    def test_background_work_does_not_block_interactive(self):
+        import threading
+        import time
+        from app.services.concurrent_fetch import ConcurrentFetcher
+        fetcher = ConcurrentFetcher(max_workers=2)
+        release = threading.Event()
+
+        def prefetch():
+            with fetcher.background():
+                fetcher.run({str(i): (release.wait, (5,)) for i in range(6)}, deadline=5)
+
+        bg = threading.Thread(target=prefetch)
+        bg.start()
+        time.sleep(0.1)
+        start = time.monotonic()
+        out = fetcher.run({"user": (lambda: "ok", ())}, deadline=0.5, default="timeout")
+        assert out == {"user": "ok"} and time.monotonic() - start < 0.3
+        release.set()
+        bg.join()
+
+
+class TestEnrichmentCache:
+
+    def test_persistent_and_lru_bounded(self, tmp_path):
+        from app.services.enrichment_cache import EnrichmentCache
+        path = tmp_path / "cache.sqlite"
+        cache = EnrichmentCache(path, max_entries=3)
+        for k in "abc":
+            cache.set(k, {"v": k})
+        assert cache.get("a")[0] == {"v": "a"}          # a is now most recently used
+        cache.set("d", {"v": "d"})
+        assert cache.get("b") is None                   # least recently used evicted
+        assert len(cache) == 3
+
+        reopened = EnrichmentCache(path, max_entries=3)
+        value, age = reopened.get("d")
+        assert value == {"v": "d"} and age >= 0
+
+    def test_byte_bound(self, tmp_path):
+        from app.services.enrichment_cache import EnrichmentCache
+        cache = EnrichmentCache(tmp_path / "cache.sqlite", max_bytes=3000)
+        for i in range(5):
+            cache.set(str(i), "x" * 1000)
+        assert len(cache) == 2
+        assert cache.get("4") is not None
+
+    def test_stale_while_revalidate(self, tmp_path):
+        import threading
+        from datetime import timedelta
+        from app.services.web_enrichment_service import WebEnrichmentService
+        svc = WebEnrichmentService(cache_path=tmp_path / "cache.sqlite")
+        release = threading.Event()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            if len(calls) > 1:
+                release.wait(5)
+            return len(calls)
+
+        assert svc._cached("k", timedelta(hours=1), fetch) == 1
+        assert svc._cached("k", timedelta(hours=1), fetch) == 1      # fresh hit
+        assert svc._cached("k", timedelta(0), fetch) == 1            # stale, served at once
+        assert svc._cached("k", timedelta(0), fetch) == 1            # refresh already running
+        release.set()
+        svc._refresh_pool.shutdown(wait=True)
+        assert len(calls) == 2
+        assert svc.cache.get("k")[0] == 2
+
+    def test_failed_or_empty_fetch_does_not_poison_cache(self, tmp_path):
+        from datetime import timedelta
+        from app.services.web_enrichment_service import EnrichmentFetchError, WebEnrichmentService
+        svc = WebEnrichmentService(cache_path=tmp_path / "cache.sqlite")
+
+        def down():
+            raise EnrichmentFetchError("source down")
+
+        with pytest.raises(EnrichmentFetchError):
+            svc._cached("miss", timedelta(hours=1), down)
+        assert svc.cache.get("miss") is None
+
+        # empty results are kept only for NEGATIVE_TTL
+        assert svc._cached("empty", timedelta(hours=1), lambda: []) == []
+        svc.NEGATIVE_TTL = timedelta(0)
+        assert svc._cached("empty", timedelta(hours=1), lambda: ["news"]) == ["news"]
+
+        # a failed or empty background refresh keeps the good stale value
+        svc._cached("good", timedelta(hours=1), lambda: ["old"])
+        assert svc._cached("good", timedelta(0), down) == ["old"]
+        assert svc._cached("good", timedelta(0), lambda: []) == ["old"]
+        svc._refresh_pool.shutdown(wait=True)
+        assert svc.cache.get("good")[0] == ["old"]
+
+    def test_unreachable_sources_raise(self, tmp_path):
+        from app.services.web_enrichment_service import EnrichmentFetchError, WebEnrichmentService
+        svc = WebEnrichmentService(cache_path=tmp_path / "cache.sqlite")
+        svc.GOOGLE_NEWS_RSS = "http://127.0.0.1:9/rss"        # discard port: connection refused
+        svc.WIKIPEDIA_API = "http://127.0.0.1:9/api.php"
+        with pytest.raises(EnrichmentFetchError):
+            svc.get_recent_news("Acme", limit=5)
+        with pytest.raises(EnrichmentFetchError):
+            svc.get_company_overview("Acme")
+        with pytest.raises(EnrichmentFetchError):
+            svc.get_country_intelligence("Germany")
+        assert len(svc.cache) == 0
+
+
+# ── Feed parsing ──────────────────────────────────────────────────────────────
+
+class TestFeedParsing:
+
+    def test_rss_matches_soup_parser(self):
+        from html import escape
+        from app.services.feed_parsing import parse_rss_items, parse_rss_items_soup
+        desc = escape('<a href="https://x/1">Mill &amp; caster</a>&nbsp;<font>Outlet</font>')
+        feed = ("<rss><channel>"
+                f"<item><title>A</title><link>https://x/1</link><description>{desc}</description>"
+                '<source url="https://o">Outlet</source></item>'
+                "<item><title>B</title><description>plain text</description></item>"
+                "<item><title>C</title></item>"
+                "</channel></rss>").encode()
+        lean = parse_rss_items(feed, limit=10)
+        assert lean == parse_rss_items_soup(feed, limit=10)
+        assert lean[0]["description"].startswith("Mill & caster")
+        assert lean[1]["source"] == "Google News"
+        assert len(parse_rss_items(feed, limit=2)) == 2
+
+    def test_infobox_fields_and_lead_paragraph(self):
+        from app.services.feed_parsing import parse_infobox, parse_infobox_soup
+        page = ('<div class="mw-parser-output"><table class="infobox vcard"><tbody>'
+                "<tr><th>Industry</th><td>Steel</td></tr>"
+                "<tr><th>Headquarters</th><td>Essen, Germany</td></tr>"
+                "<tr><th>Number of employees</th><td>96,000</td></tr>"
+                '<tr><td colspan="2">logo</td></tr></tbody></table>'
+                '<p class="mw-empty-elt"> </p><p>Example AG is a steelmaker.</p></div>')
+        box = parse_infobox(page)
+        assert box["industry"] == "Steel"
+        assert box["headquarters"] == "Essen, Germany"
+        assert box["employee_count"] == "96,000"
+        assert box["description"] == "Example AG is a steelmaker."
+        soup_box = parse_infobox_soup(page)
+        assert {k: box[k] for k in box if k != "description"} == \
+               {k: soup_box[k] for k in soup_box if k != "description"}
+        assert parse_infobox("<div><p>No infobox here</p></div>") is None
+
+
+# ── Enrichment prefetch ───────────────────────────────────────────────────────
+
+class TestEnrichmentPrefetch:
+
+    @pytest.fixture
+    def prefetcher(self):
+        import threading
+        from app.services.enrichment_prefetch import EnrichmentPrefetcher
+
+        class Enrichment:
+            def __init__(self):
+                self.calls, self.lock = [], threading.Lock()
+                self.gate = threading.Event()
+                self.gate.set()
+
+            def _record(self, *call):
+                self.gate.wait(5)
+                with self.lock:
+                    self.calls.append(call)
+
+            def get_company_overview(self, name):
+                self._record("overview", name)
+                if name == "Gamma":
+                    raise RuntimeError("source down")
+                return {} if name == "Beta" else {"description": name}   # Beta: nothing found
+
+            def get_recent_news(self, name, limit=10):
+                self._record("news", name, limit)
+                return [{"title": name}]
+
+            def get_country_intelligence(self, country):
+                self._record("country", country)
+                return {"steel_news": [country]}
+
+        class Ranking:
+            def get_ranked_list(self, equipment_type=None, country=None, top_k=50):
+                return pd.DataFrame({
+                    "company": ["Alpha", "Alpha", "Beta", "", "Gamma", "Delta"],
+                    "country": ["Germany", "Germany", "Unknown", "Italy", "Germany", "Brazil"],
+                }).head(top_k)
+
+        enrichment = Enrichment()
+        return EnrichmentPrefetcher(enrichment=enrichment, ranking=Ranking(), max_workers=2,
+                                    resolver=lambda names: {}), enrichment
+
+    def test_targets_distinct_in_rank_order(self, prefetcher):
+        pf, _ = prefetcher
+        companies, countries = pf.targets(top_n=3)
+        assert companies == ["Alpha", "Beta", "Gamma"]
+        assert countries == ["Germany"]
+
+    def test_schedule_warms_cache_once(self, prefetcher):
+        pf, enrichment = prefetcher
+        assert pf.schedule(top_n=2)
+        assert pf.wait(5)
+        assert sorted(enrichment.calls) == sorted([
+            ("country", "Germany"),
+            ("overview", "Alpha"), ("news", "Alpha", 5),
+            ("overview", "Beta"), ("news", "Beta", 5),
+        ])
+        # Beta's overview came back empty: counted as failed
+        assert pf.status() == {"companies": 2, "countries": 1, "done": 2, "failed": 1, "pending": 0}
+        assert not pf.schedule(top_n=2)              # same targets, recently warmed
+        assert pf.schedule(top_n=3)                  # ranking changed
+        assert pf.wait(5)
+        assert pf.status() == {"companies": 3, "countries": 1, "done": 2, "failed": 2, "pending": 0}
+
+    def test_superseded_batch_does_not_leak_stats(self, prefetcher):
+        pf, enrichment = prefetcher
+        enrichment.gate.clear()                      # first batch's running work blocks
+        assert pf.schedule(top_n=2)
+        assert pf.schedule(top_n=1)                  # supersedes it while in flight
+        enrichment.gate.set()
+        assert pf.wait(5)
+        pf._pool.shutdown(wait=True)                 # let the first batch's stragglers finish
+        assert pf.status() == {"companies": 1, "countries": 1, "done": 2, "failed": 0, "pending": 0}
+
+    def test_repeated_schedule_short_circuits(self, prefetcher, monkeypatch):
+        from app.services import enrichment_prefetch
+        from app.services.enrichment_prefetch import EnrichmentPrefetcher
+        _, enrichment = prefetcher
+        maps = []
+        monkeypatch.setattr(enrichment_prefetch, "crm_identity_map",
+                            lambda conn=None: maps.append(1) or {"alpha": ("Alpha AG", "Germany")})
+
+        class Ranking:
+            key, calls = ("v1", "fp1"), []
+
+            def score_key(self):
+                return self.key
+
+            def get_ranked_list(self, equipment_type=None, country=None, top_k=50):
+                self.calls.append(top_k)
+                return pd.DataFrame({"company": ["Alpha", "Beta"], "country": ["Germany", "Italy"]})
+
+        ranking = Ranking()
+        pf = EnrichmentPrefetcher(enrichment=enrichment, ranking=ranking, max_workers=2)
+        assert pf.schedule(top_n=2)
+        assert pf.wait(5)
+        assert ("overview", "Alpha AG") in enrichment.calls
+        for _ in range(3):                           # page reruns
+            assert not pf.schedule(top_n=2)
+        assert len(ranking.calls) == 1 and len(maps) == 1
+
+        ranking.key = ("v2", "fp1")                  # new model, same data: map reused
+        assert not pf.schedule(top_n=2)              # same targets, recently warmed
+        assert len(ranking.calls) == 2 and len(maps) == 1
+        ranking.key = ("v2", "fp2")                  # reloaded data: map rebuilt
+        pf.schedule(top_n=2)
+        assert len(maps) == 2
+        assert pf.wait(5)
+
+    def test_prefetched_company_is_cache_hit_for_profile(self, tmp_path, monkeypatch):
+        import duckdb
+        import app.services as services
+        from app.services.enrichment_prefetch import EnrichmentPrefetcher, crm_identities
+        from app.services.profile_pipeline import ProfilePipeline
+        from app.services.web_enrichment_service import WebEnrichmentService
+
+        conn = duckdb.connect()
+        conn.execute("""
+            CREATE TABLE unified_companies AS SELECT * FROM (VALUES
+                ('Alpha Steel GmbH', 'ALPHA STEEL', 'Germany'),
+                ('Beta Metals',      'Beta Metals',  NULL)
+            ) t(name, bcg_name, country)
+        """)
+
+        svc = WebEnrichmentService(cache_path=tmp_path / "cache.sqlite")
+        fetched = []
+        monkeypatch.setattr(svc, "_fetch_overview",
+                            lambda name: fetched.append(("overview", name)) or {"description": name})
+        monkeypatch.setattr(svc, "_fetch_recent_news",
+                            lambda name, limit: fetched.append(("news", name)) or [{"title": name}])
+        monkeypatch.setattr(svc, "_fetch_country_intelligence",
+                            lambda country: fetched.append(("country", country)) or {"steel_news": [country]})
+
+        class Ranking:
+            def get_ranked_list(self, equipment_type=None, country=None, top_k=50):
+                return pd.DataFrame({"company": [" Alpha Steel ", "Beta Metals"],
+                                     "country": ["Deutschland", "Italy"]})
+
+        pf = EnrichmentPrefetcher(enrichment=svc, ranking=Ranking(), max_workers=2,
+                                  resolver=lambda names: crm_identities(names, conn))
+        assert pf.targets(country="Italy") == (["Alpha Steel GmbH", "Beta Metals"], ["Germany", "Italy"])
+        assert pf.schedule(country="Italy")
+        assert pf.wait(5)
+        warmed = len(fetched)
+
+        # what the customer page passes for Alpha Steel: CRM name and country
+        customer_data = {"crm": {"name": "Alpha Steel GmbH", "country": "Germany"}}
+        monkeypatch.setattr(services, "web_enrichment_service", svc)
+        stages = ProfilePipeline(max_workers=1).stages(customer_data, "Alpha Steel GmbH",
+                                                       "Alpha Steel GmbH", "Germany")
+        for stage in ("overview", "company_news", "country_intelligence"):
+            fn, args = stages[stage]
+            assert fn(*args)
+        assert len(fetched) == warmed                # all three served from the prefetched cache
+
+
+# ── Profile pipeline ──────────────────────────────────────────────────────────
+
+class TestProfilePipeline:
+
+    def test_gather_concurrent_with_deadline(self):
+        import time
+        from app.services.profile_pipeline import ProfilePipeline
+
+        def boom():
+            raise RuntimeError("source down")
+
+        pipeline = ProfilePipeline(max_workers=4)
+        seen = []
+        start = time.monotonic()
+        results, report = pipeline.gather({
+            "a":    (lambda: time.sleep(0.3) or "A", ()),
+            "b":    (lambda x: time.sleep(0.3) or x, ("B",)),
+            "bad":  (boom, ()),
+            "slow": (time.sleep, (3,)),
+        }, deadline=1.0, on_stage=lambda stage, r: seen.append((stage, r["status"])))
+        assert time.monotonic() - start < 1.5
+        assert results == {"a": "A", "b": "B", "bad": None, "slow": None}
+        assert report["a"]["status"] == "ok" and 0.25 < report["a"]["seconds"] < 0.9
+        assert report["bad"] == {"seconds": pytest.approx(0, abs=0.1), "status": "failed", "error": "source down"}
+        assert report["slow"]["status"] == "timeout"
+        assert seen[0] == ("bad", "failed") and seen[-1] == ("slow", "timeout")
+
+    def test_generate_streams_and_attaches(self, monkeypatch):
+        from app.services.profile_generator import profile_generator
+        from app.services.profile_pipeline import ProfilePipeline
+
+        captured = {}
+
+        def fake_stream(customer_data, web_data=None, extra_context=None):
+            captured.update(extra_context)
+            yield from ['{"basic_data": ', '{"name": "Acme"}', "}"]
+
+        monkeypatch.setattr(profile_generator, "stream_profile", fake_stream)
+        pipeline = ProfilePipeline(max_workers=1)
+        results = {"company_news": [{"title": "n"}], "priority_ranking": {"rank": 1},
+                   "overview": {"description": "d"}, "market_intelligence": None}
+        texts = []
+        profile, timing = pipeline.generate({"crm": {}}, results, on_text=texts.append)
+        assert profile == {"basic_data": {"name": "Acme"}}
+        assert texts[-1] == '{"basic_data": {"name": "Acme"}}'
+        assert captured["company_news"] == [{"title": "n"}] and captured["crm_history"] is None
+        assert timing["first_content"] is not None
+
+        pipeline.attach(profile, results, {"overview": {"seconds": 0.123}}, timing)
+        assert profile["company_overview"] == {"description": "d"}
+        assert "market_intelligence" not in profile
+        assert profile["_stage_latency"]["overview"] == 0.12
+
+    def test_parse_profile_falls_back(self):
+        from app.services.profile_generator import profile_generator
+        crm = {"crm": {"name": "Acme"}}
+        assert profile_generator.parse_profile("", crm)["basic_data"]["name"] == "Acme"
+        assert profile_generator.parse_profile('{"basic_data": {', crm)["basic_data"]["name"] == "Acme"
+
+
+# ── Profile context budget ────────────────────────────────────────────────────
+
+class TestProfileContextBudget:
+
+    @pytest.fixture
+    def customer(self):
+        ib = [{"equipment": "EAF" if i % 4 else "Caster", "installation_year": 1980 + i % 40,
+               "OEM": "SMS group" if i % 3 else "Danieli", "capacity_internal": 100.0,
+               "location": "Plant " + str(i)} for i in range(400)]
+        crm = {"name": "Acme Steel", "country": "Germany", "notes": "x" * 4000, "rating": float("nan")}
+        extra = {
+            "company_news": [{"title": f"Acme headline {i}"} for i in range(10)],
+            "country_intelligence": {"country": "Germany",
+                                     "steel_news": [{"title": "steel " * 40}] * 5},
+        }
+        return {"crm": crm, "installed_base": ib}, extra
+
+    def test_installed_base_aggregated(self, customer):
+        from app.services.profile_generator import ProfileGeneratorService
+        customer_data, extra = customer
+        context = ProfileGeneratorService()._build_context(customer_data, None, extra)
+        assert "400 equipment units, 2 equipment types" in context
+        assert "EAF: 300 units" in context and "Plant 17" not in context
+        assert '"rating"' not in context                       # NaN fields left out
+        assert "Acme headline 4" in context and "Acme headline 5" not in context
+
+    def test_budget_enforced_by_priority(self, customer):
+        from app.services.profile_generator import ProfileGeneratorService, count_tokens
+        customer_data, extra = customer
+        svc = ProfileGeneratorService()
+        full = svc._build_context(customer_data, "web " * 5000, extra, budget=100_000)
+        assert svc.last_context_report["compacted"] == []
+
+        context = svc._build_context(customer_data, "web " * 5000, extra, budget=1200)
+        report = svc.last_context_report
+        assert report["tokens"] == count_tokens(context) <= 1200 < count_tokens(full)
+        assert "RECENT COMPANY NEWS" in report["compacted"]
+        assert report["truncated"] == ["WEB RESEARCH"] and report["dropped"] == []
+        assert context.startswith("CRM DATA:") and "INSTALLED BASE:" in context
+
+        svc._build_context(customer_data, "web " * 5000, extra, budget=300)
+        assert "WEB RESEARCH" in svc.last_context_report["dropped"]
+        assert svc.last_context_report["tokens"] <= 300